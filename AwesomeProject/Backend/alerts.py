@@ -0,0 +1,327 @@
+# Saved searches and new-record alerts
+# Users save the criteria of a recall (/) or warning-letter search. A
+# background poller reads only the records past a stored high-water mark
+# (openFDA report_date for recalls, ActionTakenDate in the local warning
+# letter index), matches each new record against every saved search at once
+# through an inverted index of search terms, and queues a notification per
+# match. Records are evaluated once, so polling cost follows the number of new
+# records rather than searches times result sets.
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import requests
+
+import openfda
+from local_db import LocalDB, INDEX_DB_PATH
+from rate_limit import BATCH
+from warning_letters import name_tokens
+
+
+POLL_INTERVAL = int(os.getenv('ALERT_POLL_INTERVAL', 3600))
+# Records can appear upstream after their date; re-read this far behind the mark
+POLL_OVERLAP_DAYS = 30
+MAX_SEARCHES_PER_USER = int(os.getenv('ALERT_MAX_SEARCHES_PER_USER', 50))
+
+RECALL = 'recall'
+WARNING_LETTER = 'warning_letter'
+
+# kind -> {criteria field: (record field, how terms are taken)}. 'words'
+# fields match when every word of the criterion appears in the record field;
+# 'exact' fields compare the whole value.
+CRITERIA = {
+    RECALL: {
+        'productDescription': ('product_description', 'words'),
+        'recallingFirm': ('recalling_firm', 'words'),
+        'recallNumber': ('recall_number', 'exact'),
+        'recallClass': ('classification', 'words'),
+    },
+    WARNING_LETTER: {
+        'firmName': ('LegalName', 'words'),
+        'feiNumber': ('FEINumber', 'exact'),
+    },
+}
+RECORD_KEYS = {RECALL: 'recall_number', WARNING_LETTER: 'CaseInjunctionID'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS saved_search (
+    search_id INTEGER PRIMARY KEY,
+    owner TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    criteria TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_saved_search_owner ON saved_search (owner);
+CREATE TABLE IF NOT EXISTS alert_seen (
+    kind TEXT NOT NULL,
+    record_key TEXT NOT NULL,
+    record_date TEXT,
+    PRIMARY KEY (kind, record_key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS notification (
+    notification_id INTEGER PRIMARY KEY,
+    search_id INTEGER NOT NULL,
+    owner TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    record_key TEXT NOT NULL,
+    record TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    UNIQUE (search_id, record_key)
+);
+CREATE INDEX IF NOT EXISTS idx_notification_owner ON notification (owner, notification_id);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _terms(kind, field, value):
+    """Index terms of one criterion or record value, as (record field, term) pairs."""
+    record_field, mode = CRITERIA[kind][field]
+    if mode == 'exact':
+        value = str(value or '').strip().lower()
+        return {(record_field, value)} if value else set()
+    return {(record_field, token) for token in name_tokens(str(value or ''))}
+
+
+def _record_terms(kind, record):
+    terms = set()
+    for field in CRITERIA[kind]:
+        terms |= _terms(kind, field, record.get(CRITERIA[kind][field][0]))
+    return terms
+
+
+def fetch_recalls_since(since):
+    """Enforcement records with report_date from `since` (YYYYMMDD) to today, all pages."""
+    today = datetime.utcnow().strftime('%Y%m%d')
+    query = f'report_date:[{since}+TO+{today}]'
+    records, skip = [], 0
+    while True:
+        try:
+            page = openfda.search(RECALL, query, limit=1000, skip=skip, priority=BATCH)
+        except requests.HTTPError as e:
+            # openFDA answers 404 when a search matches nothing
+            if e.response is not None and e.response.status_code == 404:
+                return records
+            raise
+        records.extend(page.get('results', []))
+        skip += 1000
+        if skip >= page.get('meta', {}).get('results', {}).get('total', 0):
+            return records
+
+
+class SearchIndex:
+    """
+    Inverted index from (record field, term) to the saved searches needing
+    that term. A record matches a search when it contains all of the
+    search's terms.
+    """
+
+    def __init__(self, kind, searches):
+        self.kind = kind
+        self.postings = {}
+        self.required = {}
+        for search_id, criteria in searches:
+            terms = set()
+            for field, value in criteria.items():
+                terms |= _terms(kind, field, value)
+            if not terms:
+                continue
+            self.required[search_id] = len(terms)
+            for term in terms:
+                self.postings.setdefault(term, []).append(search_id)
+
+    def match(self, record):
+        hits = Counter()
+        for term in _record_terms(self.kind, record):
+            hits.update(self.postings.get(term, ()))
+        return [search_id for search_id, count in hits.items() if count == self.required[search_id]]
+
+
+class SavedSearches:
+    """
+    Saved searches, their notifications and the background poller that
+    produces them. `warning_letters` is the local WarningLetterIndex; without
+    a synced index, warning-letter searches get no alerts.
+    """
+
+    def __init__(self, path=INDEX_DB_PATH, warning_letters=None, fetch_recalls=fetch_recalls_since,
+                 poll_interval=POLL_INTERVAL):
+        self.db = LocalDB(path)
+        self.warning_letters = warning_letters
+        self.fetch_recalls = fetch_recalls
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._thread = None
+        self.db.executescript(SCHEMA)
+
+    def save(self, owner, kind, criteria):
+        """Store a search; raises ValueError if it has no usable criteria."""
+        if kind not in CRITERIA:
+            raise ValueError(f"kind must be one of {sorted(CRITERIA)}")
+        criteria = {field: str(value) for field, value in (criteria or {}).items()
+                    if field in CRITERIA[kind] and str(value or '').strip()}
+        if not any(_terms(kind, field, value) for field, value in criteria.items()):
+            raise ValueError(f"At least one of {sorted(CRITERIA[kind])} is required")
+        con = self.db.connection()
+        with con:
+            count = con.execute("SELECT count(*) FROM saved_search WHERE owner = ?", (owner,)).fetchone()[0]
+            if count >= MAX_SEARCHES_PER_USER:
+                raise ValueError(f"At most {MAX_SEARCHES_PER_USER} saved searches are allowed")
+            cursor = con.execute("INSERT INTO saved_search (owner, kind, criteria, created_at) VALUES (?, ?, ?, ?)",
+                                 (owner, kind, json.dumps(criteria, sort_keys=True), time.time()))
+        return cursor.lastrowid
+
+    def list(self, owner):
+        rows = self.db.execute("SELECT search_id, kind, criteria, created_at FROM saved_search "
+                               "WHERE owner = ? ORDER BY search_id", (owner,))
+        return [{"id": row['search_id'], "kind": row['kind'], "criteria": json.loads(row['criteria']),
+                 "createdAt": row['created_at']} for row in rows]
+
+    def delete(self, owner, search_id):
+        con = self.db.connection()
+        with con:
+            deleted = con.execute("DELETE FROM saved_search WHERE search_id = ? AND owner = ?",
+                                  (search_id, owner)).rowcount
+            con.execute("DELETE FROM notification WHERE search_id = ? AND owner = ?", (search_id, owner))
+        return bool(deleted)
+
+    def notifications(self, owner, after=0, limit=100):
+        """Notifications newer than the `after` cursor, oldest first."""
+        rows = self.db.execute("SELECT n.notification_id, n.search_id, n.kind, n.record, n.created_at "
+                               "FROM notification n WHERE n.owner = ? AND n.notification_id > ? "
+                               "ORDER BY n.notification_id LIMIT ?", (owner, after, limit))
+        return [{"id": row['notification_id'], "searchId": row['search_id'], "kind": row['kind'],
+                 "record": json.loads(row['record']), "createdAt": row['created_at']} for row in rows]
+
+    def _get_state(self, key):
+        row = self.db.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row['value'] if row else None
+
+    def _claim(self, name, interval):
+        """
+        Take the next poll. Every worker process runs a poller, but only one
+        of them polls in each half interval (the slack absorbs timer drift).
+        """
+        con = self.db.connection()
+        now = time.time()
+        with con:
+            claimed = con.execute(
+                "INSERT INTO sync_state (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET "
+                "value = excluded.value WHERE CAST(value AS REAL) <= ?",
+                (f'{name}_claimed_at', str(now), now - interval / 2)).rowcount
+        return bool(claimed)
+
+    def process(self, kind, records, notify=True):
+        """
+        Match records not evaluated before against all saved searches of
+        `kind` and queue notifications. Returns the number queued. With
+        notify=False the records are only marked as evaluated.
+        """
+        key_field = RECORD_KEYS[kind]
+        records = {str(r[key_field]): r for r in records if r.get(key_field)}
+        if not records:
+            return 0
+        con = self.db.connection()
+        keys = list(records)
+        seen = set()
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            seen.update(row[0] for row in con.execute(
+                f"SELECT record_key FROM alert_seen WHERE kind = ? AND record_key IN ({', '.join('?' * len(chunk))})",
+                [kind] + chunk))
+        new = {key: record for key, record in records.items() if key not in seen}
+        if not new:
+            return 0
+
+        searches = con.execute("SELECT search_id, owner, criteria FROM saved_search WHERE kind = ?",
+                               (kind,)).fetchall() if notify else []
+        owners = {row['search_id']: row['owner'] for row in searches}
+        index = SearchIndex(kind, [(row['search_id'], json.loads(row['criteria'])) for row in searches])
+        date_field = 'report_date' if kind == RECALL else 'ActionTakenDate'
+        now = time.time()
+        notifications = []
+        for key, record in new.items():
+            body = json.dumps(record)
+            notifications.extend((search_id, owners[search_id], kind, key, body, now)
+                                 for search_id in index.match(record))
+        with con:
+            con.executemany("INSERT OR IGNORE INTO notification (search_id, owner, kind, record_key, record, created_at) "
+                            "VALUES (?, ?, ?, ?, ?, ?)", notifications)
+            con.executemany("INSERT OR IGNORE INTO alert_seen (kind, record_key, record_date) VALUES (?, ?, ?)",
+                            [(kind, key, record.get(date_field)) for key, record in new.items()])
+        return len(notifications)
+
+    def _advance(self, kind, state_key, dates, date_format):
+        """Move the high-water mark to the newest date and forget records from before the overlap window."""
+        con = self.db.connection()
+        newest = max(dates)
+        cutoff = (datetime.strptime(newest, date_format) - timedelta(days=POLL_OVERLAP_DAYS)).strftime(date_format)
+        with con:
+            con.execute("INSERT INTO sync_state (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET "
+                        "value = max(value, excluded.value)", (state_key, newest))
+            con.execute("DELETE FROM alert_seen WHERE kind = ? AND record_date < ?", (kind, cutoff))
+
+    def _window_start(self, state_key, date_format):
+        high_water = self._get_state(state_key)
+        if high_water is None:
+            return None
+        return (datetime.strptime(high_water, date_format) - timedelta(days=POLL_OVERLAP_DAYS)).strftime(date_format)
+
+    def poll_recalls(self):
+        since = self._window_start('alert_recall_high_water', '%Y%m%d')
+        # The first run only sets the mark: alerts are for what arrives from now on
+        first_run = since is None
+        if first_run:
+            since = datetime.utcnow().strftime('%Y%m%d')
+        records = self.fetch_recalls(since)
+        queued = self.process(RECALL, records, notify=not first_run)
+        dates = [r['report_date'] for r in records if r.get('report_date')] or [since]
+        self._advance(RECALL, 'alert_recall_high_water', dates, '%Y%m%d')
+        return queued
+
+    def poll_warning_letters(self):
+        if self.warning_letters is None or not self.warning_letters.is_ready():
+            return 0
+        since = self._window_start('alert_warning_letter_high_water', '%Y-%m-%d')
+        first_run = since is None
+        records = self.warning_letters.since(since or datetime.utcnow().strftime('%Y-%m-%d'))
+        queued = self.process(WARNING_LETTER, records, notify=not first_run)
+        dates = [r['ActionTakenDate'] for r in records if r.get('ActionTakenDate')]
+        if dates or first_run:
+            self._advance(WARNING_LETTER, 'alert_warning_letter_high_water',
+                          dates or [datetime.utcnow().strftime('%Y-%m-%d')], '%Y-%m-%d')
+        return queued
+
+    def poll(self):
+        queued = 0
+        for name, poll in ((RECALL, self.poll_recalls), (WARNING_LETTER, self.poll_warning_letters)):
+            if not self._claim(f'alert_{name}', self.poll_interval):
+                continue
+            try:
+                queued += poll()
+            except Exception as e:
+                logging.error(f"Saved-search poll for {name} failed: {e}")
+        if queued:
+            logging.info(f"Saved-search poll queued {queued} notifications")
+        return queued
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.poll()
+            self._stop.wait(self.poll_interval)
+
+    def start(self):
+        """Start the periodic background poll."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="saved-search-poll", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,271 @@
+# Columnar store of openFDA enforcement and 510(k) history for trend reports
+# Each dataset is kept as one .npz file per year under ANALYTICS_DIR. Text
+# columns are dictionary-encoded (int32 codes plus the distinct values), dates
+# are yyyymmdd integers, so a group-by is a sort over the codes of the
+# partitions in range, sized by the rows rather than by the number of possible
+# key combinations. Partitions are rebuilt from openFDA with
+#
+#   python analytics_store.py enforcement 2012 2024
+#   python analytics_store.py 510k 1976 2024
+
+import calendar
+import logging
+import os
+import threading
+from collections import Counter
+
+import numpy as np
+
+import openfda
+from rate_limit import BATCH
+
+
+ANALYTICS_DIR = os.getenv('ANALYTICS_DIR', 'analytics')
+# openFDA returns at most 1000 records per page and skips no further than 25000
+PAGE_SIZE = 1000
+MAX_SKIP = 25000
+
+# dataset -> (openFDA kind, date field, {column: field in each record})
+DATASETS = {
+    'enforcement': ('recall', 'report_date', {
+        'classification': 'classification',
+        'firm': 'recalling_firm',
+        'product_code': 'product_code',
+        'status': 'status',
+        'state': 'state',
+    }),
+    '510k': ('k510', 'decision_date', {
+        'decision': 'decision_description',
+        'firm': 'applicant',
+        'product_code': 'product_code',
+        'committee': 'advisory_committee_description',
+        'clearance_type': 'clearance_type',
+        'state': 'state',
+    }),
+}
+
+# Group-by keys derived from the date column
+DATE_KEYS = {'year': 10000, 'month': 100}
+
+
+def parse_date(value):
+    """'20140620' or '2014-06-20' -> 20140620; 0 if missing or malformed."""
+    digits = (value or '').replace('-', '')
+    return int(digits) if len(digits) == 8 and digits.isdigit() else 0
+
+
+def _encode(values):
+    """Dictionary-encode a list of strings: (codes, distinct values)."""
+    dictionary, codes = np.unique(np.array(values, dtype=str), return_inverse=True)
+    return codes.astype(np.int32), dictionary
+
+
+def encode_partition(dataset, records):
+    """Columns of one partition as arrays ready for np.savez."""
+    _, date_field, fields = DATASETS[dataset]
+    arrays = {'date': np.array([parse_date(r.get(date_field)) for r in records], dtype=np.int32)}
+    for column, field in fields.items():
+        values = [(r.get(field) or '').strip() for r in records]
+        arrays[f'{column}.codes'], arrays[f'{column}.values'] = _encode(values)
+    return arrays
+
+
+class AnalyticsStore:
+    """
+    Year-partitioned columnar tables. Partitions are read into memory on
+    first use and reloaded when their file changes.
+    """
+
+    def __init__(self, root=ANALYTICS_DIR):
+        self.root = root
+        self._partitions = {}   # path -> ((inode, mtime_ns), columns)
+        self._lock = threading.Lock()
+
+    def _path(self, dataset, year):
+        return os.path.join(self.root, dataset, f'year={year}.npz')
+
+    def years(self, dataset):
+        directory = os.path.join(self.root, dataset)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(int(name[5:-4]) for name in os.listdir(directory)
+                      if name.startswith('year=') and name.endswith('.npz'))
+
+    def write_partition(self, dataset, year, records):
+        """Replace one year's partition; readers see the old or the new file, never a partial one."""
+        path = self._path(dataset, year)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, **encode_partition(dataset, records))
+        os.replace(tmp, path)
+
+    def _load(self, dataset, year):
+        path = self._path(dataset, year)
+        stat = os.stat(path)
+        # Rewrites replace the file, so the inode changes even within one mtime tick
+        version = (stat.st_ino, stat.st_mtime_ns)
+        with self._lock:
+            cached = self._partitions.get(path)
+            if cached and cached[0] == version:
+                return cached[1]
+        with np.load(path, allow_pickle=False) as npz:
+            columns = {name: npz[name] for name in npz.files}
+        with self._lock:
+            self._partitions[path] = (version, columns)
+        return columns
+
+    def _key_codes(self, columns, key):
+        """(codes, labels) for a group-by key in one partition."""
+        if key in DATE_KEYS:
+            labels, codes = np.unique(columns['date'] // DATE_KEYS[key], return_inverse=True)
+            return codes, labels
+        return columns[f'{key}.codes'], columns[f'{key}.values']
+
+    @staticmethod
+    def _group(code_columns, rows):
+        """
+        Dense group ids for rows keyed by several code columns, with the first
+        row and the row count of each group. Keys are folded in one at a time
+        and renumbered, so ids never exceed the rows present, however large
+        the product of the keys' cardinalities.
+        """
+        ids = np.zeros(rows, dtype=np.int64)
+        for codes in code_columns:
+            codes = codes.astype(np.int64)
+            width = int(codes.max()) + 1 if rows else 1
+            _, ids = np.unique(ids * width + codes, return_inverse=True)
+            ids = ids.reshape(-1)
+        _, first, counts = np.unique(ids, return_index=True, return_counts=True)
+        return ids, first, counts
+
+    def aggregate(self, dataset, keys, filters=None, date_from=0, date_to=99991231):
+        """
+        Count rows grouped by `keys` (dataset columns, 'year' or 'month'),
+        over rows whose date is within [date_from, date_to] (yyyymmdd) and
+        whose columns equal the values in `filters`. Returns one label array
+        per key and an array of counts, one entry per group.
+        """
+        fields = DATASETS[dataset][2]
+        for column in list(keys) + list(filters or {}):
+            if column not in fields and column not in DATE_KEYS:
+                raise ValueError(f"Unknown column for {dataset}: {column}")
+
+        # Per-partition groups: labels per key and counts
+        parts = []
+        for year in self.years(dataset):
+            if not date_from // 10000 <= year <= date_to // 10000:
+                continue
+            columns = self._load(dataset, year)
+            dates = columns['date']
+            mask = (dates >= date_from) & (dates <= date_to)
+            for column, value in (filters or {}).items():
+                codes, labels = self._key_codes(columns, column)
+                mask &= np.isin(codes, np.flatnonzero(labels.astype(str) == str(value)))
+            if not mask.any():
+                continue
+
+            decoded = [(codes[mask], labels) for codes, labels in (self._key_codes(columns, key) for key in keys)]
+            _, first, group_counts = self._group([codes for codes, _ in decoded], int(mask.sum()))
+            parts.append(([labels[codes[first]] for codes, labels in decoded], group_counts))
+
+        if not parts:
+            return [np.array([]) for _ in keys], np.zeros(0, dtype=np.int64)
+        counts = np.concatenate([part_counts for _, part_counts in parts])
+        if len(parts) == 1 or not keys:
+            labels = [np.concatenate([part[0][i] for part in parts]) for i in range(len(keys))]
+            if not keys:
+                return labels, counts.sum(keepdims=True)
+            return labels, counts
+
+        # Partitions have their own dictionaries; merge groups on the label values
+        merged = []
+        for i in range(len(keys)):
+            values, codes = np.unique(np.concatenate([part[0][i] for part in parts]), return_inverse=True)
+            merged.append((values, codes))
+        ids, first, _ = self._group([codes.reshape(-1) for _, codes in merged], len(counts))
+        labels = [values[codes[first]] for values, codes in merged]
+        return labels, np.bincount(ids, weights=counts).astype(np.int64)
+
+    def group_by(self, dataset, keys, filters=None, date_from=0, date_to=99991231):
+        """aggregate() as a Counter of key tuples."""
+        labels, counts = self.aggregate(dataset, keys, filters, date_from, date_to)
+        groups = zip(*(column.tolist() for column in labels)) if keys else [()] * len(counts)
+        return Counter(dict(zip(groups, counts.tolist())))
+
+    def report(self, dataset, keys, filters=None, date_from=0, date_to=99991231, limit=100):
+        """Largest groups first as JSON-ready rows, months as 'YYYY-MM'."""
+        labels, counts = self.aggregate(dataset, keys, filters, date_from, date_to)
+        top = np.argsort(-counts, kind='stable')[:limit]
+        rows = []
+        for index in top.tolist():
+            row = {key: column[index].item() for key, column in zip(keys, labels)}
+            if 'month' in row:
+                row['month'] = f"{row['month'] // 100:04d}-{row['month'] % 100:02d}"
+            row['count'] = int(counts[index])
+            rows.append(row)
+        return {"total": int(counts.sum()), "groups": len(counts), "rows": rows}
+
+def _date_bounds(dataset, start, end):
+    """Date literals for an openFDA range query in the dataset's date format."""
+    if dataset == '510k':
+        return f'{start[:4]}-{start[4:6]}-{start[6:]}', f'{end[:4]}-{end[4:6]}-{end[6:]}'
+    return start, end
+
+
+def fetch_range(dataset, start, end):
+    """
+    All records dated from `start` to `end` (yyyymmdd strings), paged.
+    Returns (records, total); records stop short of total when the range
+    holds more than openFDA will page through.
+    """
+    kind, date_field, _ = DATASETS[dataset]
+    low, high = _date_bounds(dataset, start, end)
+    query = f'{date_field}:[{low}+TO+{high}]'
+    records, total, skip = [], None, 0
+    while total is None or (skip < total and skip <= MAX_SKIP):
+        try:
+            page = openfda.search(kind, query, limit=PAGE_SIZE, skip=skip, priority=BATCH)
+        except openfda.requests.HTTPError as e:
+            # openFDA answers 404 when a search matches nothing
+            if e.response is not None and e.response.status_code == 404:
+                return records, 0
+            raise
+        total = page.get('meta', {}).get('results', {}).get('total', 0)
+        records.extend(page.get('results', []))
+        skip += PAGE_SIZE
+    return records, total
+
+
+def fetch_year(dataset, year):
+    """One year of records, a month at a time if the year is too large to page through."""
+    records, total = fetch_range(dataset, f'{year}0101', f'{year}1231')
+    if len(records) >= total:
+        return records
+    logging.info(f"{dataset} {year} has {total} records, fetching by month")
+    records = []
+    for month in range(1, 13):
+        last_day = calendar.monthrange(year, month)[1]
+        month_records, month_total = fetch_range(dataset, f'{year}{month:02d}01', f'{year}{month:02d}{last_day}')
+        if len(month_records) < month_total:
+            logging.warning(f"{dataset} {year}-{month:02d}: kept {len(month_records)} of {month_total} records")
+        records.extend(month_records)
+    return records
+
+
+def build(store, dataset, years):
+    """Rebuild the partitions for `years` from openFDA."""
+    for year in years:
+        records = fetch_year(dataset, year)
+        store.write_partition(dataset, year, records)
+        logging.info(f"Wrote {dataset} {year}: {len(records)} records")
+
+
+analytics_store = AnalyticsStore()
+
+
+if __name__ == '__main__':
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    dataset, first, last = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+    build(analytics_store, dataset, range(first, last + 1))
@@ -0,0 +1,184 @@
+# Typeahead suggestions for the firm, device and product search fields
+# Names come from the local copies of the data: licenses, the firm index
+# (recalling firms, 510(k) applicants, warning letters, business entities),
+# the normalized openFDA records and the CDPH recall index. Each name is
+# weighted by the number of records that carry it.
+#
+# Per field, every name is stored under each of its word suffixes ("Pump,
+# Infusion" under "pump infusion" and "infusion") in one sorted list, so the
+# names matching a prefix are a contiguous range found with bisect. The
+# top-k of every prefix up to PRECOMPUTE_DEPTH characters, whose ranges are
+# the largest, are ranked once at build time; longer prefixes rank their
+# (small) range per query. The index is rebuilt in the background and
+# swapped in whole.
+
+import heapq
+import logging
+import os
+import re
+import threading
+from bisect import bisect_left
+
+
+AUTOCOMPLETE_REFRESH_INTERVAL = int(os.getenv('AUTOCOMPLETE_REFRESH_INTERVAL', 3600))
+TOP_K = 10
+PRECOMPUTE_DEPTH = 3
+# Names are matched from their first few words only
+MAX_SUFFIX_TOKENS = 6
+MAX_DISPLAY_LENGTH = 120
+
+KINDS = ('firm', 'device', 'product')
+
+# kind -> queries returning (name, weight) from the app database
+APP_DB_QUERIES = {
+    'firm': [
+        "SELECT business_name, count(*) FROM license GROUP BY 1",
+        "SELECT corporate_name, count(*) FROM license GROUP BY 1",
+        "SELECT doing_business_as, count(*) FROM license GROUP BY 1",
+    ],
+    'product': [
+        "SELECT text, 1 FROM cdph_recall",
+    ],
+}
+
+# kind -> queries returning (name, weight) from the local index database
+INDEX_DB_QUERIES = {
+    'firm': [
+        "SELECT raw_name, 1 FROM firm_alias",
+        "SELECT recalling_firm, count(*) FROM enforcement_fact GROUP BY 1",
+        "SELECT applicant, count(*) FROM k510_fact GROUP BY 1",
+        "SELECT manufacturer_name, count(*) FROM maude_fact GROUP BY 1",
+    ],
+    'device': [
+        "SELECT device_name, 1 FROM product_code_dim",
+        "SELECT device_name, count(*) FROM k510_fact GROUP BY 1",
+        "SELECT brand_name, count(*) FROM maude_fact GROUP BY 1",
+    ],
+    'product': [
+        "SELECT product_description, count(*) FROM enforcement_fact GROUP BY 1",
+    ],
+}
+
+_NOT_ALNUM = re.compile(r'[^a-z0-9]+')
+
+
+def normalize(text):
+    """'Pump, Infusion ' -> 'pump infusion'."""
+    return _NOT_ALNUM.sub(' ', (text or '').lower()).strip()
+
+
+def terms_from(con, queries):
+    """(kind, name, weight) rows of the given queries; tables that do not exist yet are skipped."""
+    for kind, statements in queries.items():
+        for statement in statements:
+            try:
+                rows = con.execute(statement).fetchall()
+            except Exception as e:
+                logging.debug(f"Autocomplete source skipped ({statement}): {e}")
+                continue
+            for name, weight in rows:
+                if name:
+                    yield kind, name, weight
+
+
+class PrefixIndex:
+    """Names of one field under their word suffixes, sorted for prefix ranges."""
+
+    def __init__(self, weights, k=TOP_K, precompute_depth=PRECOMPUTE_DEPTH):
+        entries = []
+        for display, weight in weights.items():
+            tokens = normalize(display).split()
+            for position in range(min(len(tokens), MAX_SUFFIX_TOKENS)):
+                entries.append((' '.join(tokens[position:]), position, display, weight))
+        entries.sort()
+        self.keys = [entry[0] for entry in entries]
+        # Heavier first, then names that start with the prefix, then shorter names
+        self._rank_keys = [(-weight, position, len(display)) for _, position, display, weight in entries]
+        self._entries = [(display, weight) for _, _, display, weight in entries]
+        self.k = k
+        self.precompute_depth = precompute_depth
+        self.top = {}
+        for depth in range(1, precompute_depth + 1):
+            for prefix in sorted({key[:depth] for key in self.keys if len(key) >= depth}):
+                self.top[prefix] = self._rank(prefix, k)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _rank(self, prefix, limit):
+        low = bisect_left(self.keys, prefix)
+        high = bisect_left(self.keys, prefix + '\uffff')
+        # A name can match under two of its suffixes; take a few extra to dedupe
+        best = heapq.nsmallest(limit + 4, range(low, high), key=self._rank_keys.__getitem__)
+        out, seen = [], set()
+        for i in best:
+            display, weight = self._entries[i]
+            if display not in seen:
+                seen.add(display)
+                out.append({"text": display, "weight": weight})
+        return out[:limit]
+
+    def suggest(self, prefix, limit=TOP_K):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        if len(prefix) <= self.precompute_depth and limit <= self.k:
+            return self.top.get(prefix, [])[:limit]
+        return self._rank(prefix, limit)
+
+
+class Autocomplete:
+    """
+    One PrefixIndex per field, rebuilt from load_terms() -> iterable of
+    (kind, name, weight). Spellings that normalize alike are merged under
+    the heaviest one.
+    """
+
+    def __init__(self, load_terms, refresh_interval=AUTOCOMPLETE_REFRESH_INTERVAL):
+        self.load_terms = load_terms
+        self.refresh_interval = refresh_interval
+        self.indexes = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def is_ready(self):
+        return bool(self.indexes)
+
+    def build(self, terms):
+        merged = {kind: {} for kind in KINDS}
+        for kind, name, weight in terms:
+            display = ' '.join(str(name).split())[:MAX_DISPLAY_LENGTH]
+            key = normalize(display)
+            if not key:
+                continue
+            entry = merged[kind].setdefault(key, [0, {}])
+            entry[0] += weight or 1
+            entry[1][display] = entry[1].get(display, 0) + (weight or 1)
+        indexes = {}
+        for kind, names in merged.items():
+            indexes[kind] = PrefixIndex({max(spellings, key=spellings.get): total
+                                         for total, spellings in names.values()})
+        self.indexes = indexes
+        return {kind: len(names) for kind, names in merged.items()}
+
+    def suggest(self, kind, prefix, limit=TOP_K):
+        index = self.indexes.get(kind)
+        return index.suggest(prefix, limit) if index else []
+
+    def _run(self):
+        while True:
+            try:
+                counts = self.build(self.load_terms())
+                logging.info(f"Autocomplete index built: {counts}")
+            except Exception as e:
+                logging.error(f"Autocomplete index build failed: {e}")
+            if self._stop.wait(self.refresh_interval):
+                return
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="autocomplete-build", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
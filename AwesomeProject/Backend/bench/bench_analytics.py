@@ -0,0 +1,92 @@
+# Latency of the weekly trend reports over the columnar history store
+# Builds a synthetic store at roughly openFDA's full-history size (enforcement
+# ~4k device recalls a year since 2002, 510(k) ~4k decisions a year since
+# 1976) from the recorded fixture pages, then times each report cold (first
+# read of the partitions) and warm.
+#
+#   python bench/bench_analytics.py
+#   python bench/bench_analytics.py --per-year 10000
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics_store import AnalyticsStore  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+REPORTS = [
+    ('enforcement', ['classification']),
+    ('enforcement', ['firm']),
+    ('enforcement', ['product_code']),
+    ('enforcement', ['month']),
+    ('enforcement', ['classification', 'month']),
+    ('510k', ['product_code', 'year']),
+]
+
+
+def synthetic_history(name, date_field, first_year, per_year, seed=3):
+    """Records resampled from a fixture page, spread over the years with new dates."""
+    with open(os.path.join(FIXTURES, name)) as f:
+        sample = json.load(f)['results']
+    rng = random.Random(seed)
+    dash = '-' in sample[0][date_field]
+    for year in range(first_year, 2025):
+        records = []
+        for _ in range(per_year):
+            record = dict(rng.choice(sample))
+            month, day = rng.randint(1, 12), rng.randint(1, 28)
+            record[date_field] = f'{year}-{month:02d}-{day:02d}' if dash else f'{year}{month:02d}{day:02d}'
+            # Enough distinct firms and product codes to resemble the real dictionaries
+            for field in ('recalling_firm', 'applicant'):
+                if field in record:
+                    record[field] = f"{record[field]} {rng.randint(0, 2000)}"
+            record['product_code'] = f"{record.get('product_code', 'XXX')}{rng.randint(0, 300)}"
+            records.append(record)
+        yield year, records
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--per-year', type=int, default=4000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        store = AnalyticsStore(root)
+        start = time.perf_counter()
+        rows = 0
+        for dataset, name, date_field, first_year in (('enforcement', 'openfda_enforcement.json', 'report_date', 2002),
+                                                      ('510k', 'openfda_510k.json', 'decision_date', 1976)):
+            for year, records in synthetic_history(name, date_field, first_year, args.per_year):
+                store.write_partition(dataset, year, records)
+                rows += len(records)
+        report = {"rows": rows, "build_seconds": round(time.perf_counter() - start, 1), "reports": {}}
+
+        for dataset, keys in REPORTS:
+            fresh = AnalyticsStore(root)
+            start = time.perf_counter()
+            groups = len(fresh.group_by(dataset, keys))
+            cold = time.perf_counter() - start
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                fresh.group_by(dataset, keys)
+                timings.append(time.perf_counter() - start)
+            report["reports"][f"{dataset} by {','.join(keys)}"] = {
+                "groups": groups,
+                "cold_ms": round(cold * 1000, 1),
+                "warm_ms": round(statistics.median(timings) * 1000, 1),
+            }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
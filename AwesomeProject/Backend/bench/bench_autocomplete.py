@@ -0,0 +1,77 @@
+# Typeahead latency of the autocomplete prefix index versus a LIKE scan
+# Builds synthetic firm names with a skewed popularity, then times
+# suggestions for prefixes of 1 to 8 characters through autocomplete.py and
+# through "name LIKE 'prefix%' ORDER BY weight" on an indexed SQLite table.
+#
+#   python bench/bench_autocomplete.py
+#   python bench/bench_autocomplete.py --names 500000
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import autocomplete  # noqa: E402
+
+WORDS = ("acme medical pacific heart sierra surgical golden state bio devices labs systems ortho "
+         "vision dental cardio neuro health instruments technologies precision diagnostics").split()
+
+
+def percentiles(fn, prefixes):
+    timings = []
+    for prefix in prefixes:
+        start = time.perf_counter()
+        fn(prefix)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {"p50_ms": round(statistics.median(timings) * 1000, 3),
+            "p99_ms": round(timings[int(len(timings) * 0.99)] * 1000, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--names', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(5)
+    names = {}
+    while len(names) < args.names:
+        name = ' '.join(rng.choice(WORDS).title() for _ in range(rng.randint(2, 4))) + f" {rng.randint(1, 9999)}"
+        names[name] = int(rng.paretovariate(1.1))
+
+    start = time.perf_counter()
+    index = autocomplete.PrefixIndex(names)
+    build_seconds = time.perf_counter() - start
+
+    con = sqlite3.connect(':memory:')
+    con.execute("CREATE TABLE name (key TEXT, display TEXT, weight INTEGER)")
+    con.executemany("INSERT INTO name VALUES (?, ?, ?)",
+                    [(autocomplete.normalize(display), display, weight) for display, weight in names.items()])
+    con.execute("CREATE INDEX name_key ON name (key)")
+    con.execute("PRAGMA case_sensitive_like = ON")
+
+    def like(prefix):
+        return con.execute("SELECT display, weight FROM name WHERE key LIKE ? ORDER BY weight DESC LIMIT 10",
+                           (autocomplete.normalize(prefix) + '%',)).fetchall()
+
+    sample = rng.sample(list(names), args.queries)
+    prefixes = [autocomplete.normalize(name)[:rng.randint(1, 8)] for name in sample]
+    report = {
+        "names": args.names,
+        "index_entries": len(index),
+        "build_seconds": round(build_seconds, 2),
+        "prefix_index": percentiles(index.suggest, prefixes),
+        "sqlite_like": percentiles(like, prefixes[:200]),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
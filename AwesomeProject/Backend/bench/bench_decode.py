@@ -0,0 +1,102 @@
+# Per-image latency and allocations of the /predict decode and encode steps
+# Compares the previous path (PIL decode, RGB conversion, copy to numpy, full
+# size result written with cv2.imwrite and read back) with inference.py's
+# (cv2.imdecode on the upload buffer at reduced size, in-memory imencode).
+# Model time is left out; the decoded image stands in for the plotted result.
+#
+#   python bench/bench_decode.py                  # synthetic 12 MP phone photos
+#   python bench/bench_decode.py --images ~/photos --repeat 10
+
+import argparse
+import base64
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inference import decode_image, encode_jpeg  # noqa: E402
+
+
+def synthetic_photos(seed=7):
+    """JPEGs at common phone camera sizes, with texture so they compress like photos."""
+    rng = np.random.RandomState(seed)
+    photos = {}
+    for name, (width, height) in (('12mp_landscape', (4032, 3024)), ('12mp_portrait', (3024, 4032)),
+                                  ('1080p', (1920, 1080))):
+        small = rng.randint(0, 256, size=(height // 16, width // 16, 3), dtype=np.uint8)
+        image = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+        image = cv2.add(image, rng.randint(0, 24, size=image.shape, dtype=np.uint8))
+        ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        photos[name] = buffer.tobytes()
+    return photos
+
+
+def previous_path(image_bytes, workdir):
+    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    image_np = np.array(image)
+    path = os.path.join(workdir, 'image0.jpg')
+    cv2.imwrite(path, image_np)
+    with open(path, "rb") as f:
+        return base64.b64encode(f.read()).decode("utf-8")
+
+
+def current_path(image_bytes, workdir):
+    image, _ = decode_image(image_bytes)
+    return encode_jpeg(image)
+
+
+def measure(path, image_bytes, workdir, repeat):
+    path(image_bytes, workdir)  # warm up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        path(image_bytes, workdir)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    output = path(image_bytes, workdir)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "median_ms": round(statistics.median(timings) * 1000, 1),
+        "peak_alloc_mb": round(peak / 2 ** 20, 1),
+        "output_kb": round(len(output) / 1024),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--images', help='directory of photos to use instead of synthetic ones')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.images:
+        photos = {}
+        for name in sorted(os.listdir(args.images)):
+            with open(os.path.join(args.images, name), 'rb') as f:
+                photos[name] = f.read()
+    else:
+        photos = synthetic_photos()
+
+    report = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, image_bytes in photos.items():
+            report[name] = {
+                "upload_kb": round(len(image_bytes) / 1024),
+                "previous": measure(previous_path, image_bytes, workdir, args.repeat),
+                "current": measure(current_path, image_bytes, workdir, args.repeat),
+            }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# Storage and lookup cost of the normalized device tables
+# Loads the recorded 510(k), enforcement and MAUDE pages (resampled to more
+# records) into device_facts' tables and compares the database size with the
+# raw JSON, and with a table keeping each record's JSON as one row (what
+# exporting output.csv amounts to). Then times the product-code activity
+# lookup.
+#
+#   python bench/bench_device_facts.py
+#   python bench/bench_device_facts.py --copies 50
+
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from device_facts import DeviceFacts  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+PAGES = {'k510': ('openfda_510k.json', 'k_number'), 'recall': ('openfda_enforcement.json', 'recall_number'),
+         'maude': ('openfda_event.json', 'mdr_report_key')}
+
+
+def records(kind, copies):
+    """Fixture records repeated with distinct identifiers."""
+    name, key = PAGES[kind]
+    with open(os.path.join(FIXTURES, name)) as f:
+        sample = json.load(f)['results']
+    for copy in range(copies):
+        for record in sample:
+            yield dict(record, **{key: f"{record[key]}-{copy}"})
+
+
+def file_size(path):
+    con = sqlite3.connect(path)
+    con.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    con.execute('VACUUM')
+    con.close()
+    return os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--copies', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        facts = DeviceFacts(os.path.join(workdir, 'facts.db'))
+        raw = sqlite3.connect(os.path.join(workdir, 'raw.db'))
+        raw.execute('CREATE TABLE record (kind TEXT, id TEXT, body TEXT, PRIMARY KEY (kind, id))')
+        json_bytes = 0
+        start = time.perf_counter()
+        for kind, (_, key) in PAGES.items():
+            batch = list(records(kind, args.copies))
+            bodies = [(kind, r[key], json.dumps(r)) for r in batch]
+            json_bytes += sum(len(body) for _, _, body in bodies)
+            raw.executemany('INSERT INTO record VALUES (?, ?, ?)', bodies)
+            for offset in range(0, len(batch), 1000):
+                facts.add(kind, batch[offset:offset + 1000])
+        load_seconds = time.perf_counter() - start
+        raw.commit()
+        raw.close()
+
+        codes = [row[0] for row in facts.db.execute('SELECT product_code FROM product_code_dim')]
+        timings = []
+        for i in range(args.repeat):
+            start = time.perf_counter()
+            facts.activity(codes[i % len(codes)])
+            timings.append(time.perf_counter() - start)
+
+        report = {
+            "records": args.copies * 300,
+            "json_kb": round(json_bytes / 1024),
+            "json_rows_db_kb": round(file_size(os.path.join(workdir, 'raw.db')) / 1024),
+            "normalized_db_kb": round(file_size(os.path.join(workdir, 'facts.db')) / 1024),
+            "load_seconds": round(load_seconds, 2),
+            "product_codes": len(codes),
+            "activity_ms": round(statistics.median(timings) * 1000, 2),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+# Benchmark for firm_index: build the blocking index over synthetic firm names
+# and measure throughput, memory and how often spelling variants of one firm
+# land on the same firm ID.
+#
+#   python bench/bench_firm_index.py --names 1000000
+
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from firm_index import FirmIndex  # noqa: E402
+
+
+WORDS = [
+    "acme", "advanced", "allied", "alpha", "apex", "atlas", "bio", "biomedical", "cardio", "care", "clinical",
+    "coastal", "core", "delta", "dental", "diagnostic", "dynamic", "element", "endo", "first", "fusion",
+    "general", "global", "health", "heart", "horizon", "imaging", "infusion", "integrated", "life", "medical",
+    "meridian", "micro", "national", "neuro", "nova", "optical", "ortho", "pacific", "precision", "prime",
+    "pulse", "quantum", "radiant", "scientific", "sierra", "solutions", "spine", "summit", "surgical",
+    "systems", "united", "vascular", "vector", "vision", "western"
+]
+SUFFIXES = ["Inc", "Inc.", "LLC", "Corp", "Corporation", "Co.", "Ltd", "L.L.C.", ""]
+SOURCES = ["enforcement", "510k", "warning_letter", "license", "business_entity"]
+
+
+def brand(rng):
+    """A pronounceable made-up brand word such as "Lumavex"."""
+    return "".join(rng.choice("bcdfghklmnprstvz") + rng.choice("aeiou") for _ in range(rng.randint(2, 4)))
+
+
+def base_names(count, rng):
+    names = set()
+    while len(names) < count:
+        words = [brand(rng)] + rng.sample(WORDS, rng.randint(1, 2))
+        if rng.random() < 0.2:
+            words.append(str(rng.randint(1, 999)))
+        names.add(" ".join(word.capitalize() for word in words))
+    return sorted(names)
+
+
+def variant(name, rng):
+    """A spelling of the same firm as it might appear in another source."""
+    roll = rng.random()
+    if roll < 0.4:
+        name = name.upper()
+    elif roll < 0.6:
+        name = name.replace(" ", ", ", 1)
+    elif roll < 0.8:
+        # one dropped letter inside a word
+        letters = [i for i, c in enumerate(name) if c.isalpha()]
+        i = rng.choice(letters[1:-1])
+        name = name[:i] + name[i + 1:]
+    suffix = rng.choice(SUFFIXES)
+    return f"{name} {suffix}".strip()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--names", type=int, default=1_000_000, help="total raw names to index")
+    parser.add_argument("--variants", type=int, default=4, help="raw spellings per firm")
+    parser.add_argument("--batch", type=int, default=50_000)
+    parser.add_argument("--threshold", type=float, default=0.7, help="trigram Jaccard needed to join a firm")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    firms = base_names(args.names // args.variants, rng)
+    rows = [(firm, variant(firm, rng), SOURCES[i % len(SOURCES)])
+            for firm in firms for i in range(args.variants)]
+    rng.shuffle(rows)
+
+    index = FirmIndex(None, threshold=args.threshold)
+    start = time.perf_counter()
+    assigned = []
+    for offset in range(0, len(rows), args.batch):
+        batch = rows[offset:offset + args.batch]
+        assigned.extend(index.add_many([raw for _, raw, _ in batch], "bench"))
+    build_seconds = time.perf_counter() - start
+
+    # Pairwise quality against the generating firm
+    by_firm = {}
+    for (firm, _, _), firm_id in zip(rows, assigned):
+        by_firm.setdefault(firm, []).append(firm_id)
+    together = sum(1 for ids in by_firm.values() if len(set(ids)) == 1)
+    owners = {}
+    for firm, ids in by_firm.items():
+        for firm_id in set(ids):
+            owners.setdefault(firm_id, set()).add(firm)
+    merged = sum(1 for names in owners.values() if len(names) > 1)
+
+    probes = [raw for _, raw, _ in rows[:10_000]]
+    start = time.perf_counter()
+    for raw in probes:
+        index.resolve(raw)
+    resolve_seconds = time.perf_counter() - start
+
+    print(json.dumps({
+        "names": len(rows),
+        "true_firms": len(firms),
+        "firm_ids": len(index),
+        "build_seconds": round(build_seconds, 2),
+        "names_per_second": round(len(rows) / build_seconds),
+        "resolve_us": round(1e6 * resolve_seconds / len(probes), 1),
+        "firms_fully_clustered": round(together / len(firms), 4),
+        "firm_ids_spanning_several_firms": merged,
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# Proximity query latency with the R-tree versus a full scan of the license table
+# Builds a synthetic California: ZIP centroids scattered over the state's
+# bounding box and licenses spread across them, then times "within 10 miles"
+# and "nearest" through geo_index against computing the distance to every row.
+#
+#   python bench/bench_geo.py
+#   python bench/bench_geo.py --licenses 500000
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import geo_index  # noqa: E402
+
+
+def timed(fn, origins):
+    timings = []
+    for lat, lon in origins:
+        start = time.perf_counter()
+        fn(lat, lon)
+        timings.append(time.perf_counter() - start)
+    return round(statistics.median(timings) * 1000, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--licenses', type=int, default=100000)
+    parser.add_argument('--zips', type=int, default=1700)
+    parser.add_argument('--queries', type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    with tempfile.TemporaryDirectory() as workdir:
+        centroids = os.path.join(workdir, 'zip_centroids.csv')
+        zips = [f"{90000 + i:05d}" for i in range(args.zips)]
+        with open(centroids, 'w') as f:
+            f.write("zip,lat,lon\n")
+            for zip_code in zips:
+                f.write(f"{zip_code},{rng.uniform(32.5, 42.0):.4f},{rng.uniform(-124.4, -114.1):.4f}\n")
+
+        con = sqlite3.connect(os.path.join(workdir, 'app.db'))
+        con.execute("CREATE TABLE license (license_address_id INTEGER PRIMARY KEY, zip TEXT)")
+        con.execute("CREATE TABLE contact (id INTEGER PRIMARY KEY, address TEXT)")
+        con.executemany("INSERT INTO license VALUES (?, ?)", [(i, rng.choice(zips)) for i in range(args.licenses)])
+        con.executemany("INSERT INTO contact VALUES (?, ?)",
+                        [(i, f"1 Main St, CA {rng.choice(zips)}") for i in range(58)])
+        con.commit()
+        start = time.perf_counter()
+        geo_index.init_geo(con, centroids)
+        build_seconds = time.perf_counter() - start
+
+        origins = [(rng.uniform(33, 41), rng.uniform(-123, -115)) for _ in range(args.queries)]
+
+        def scan(lat, lon):
+            rows = con.execute("SELECT license_address_id, latitude, longitude FROM license").fetchall()
+            return sorted((geo_index.haversine_miles(lat, lon, a, b), i) for i, a, b in rows
+                          if geo_index.haversine_miles(lat, lon, a, b) <= 10)
+
+        report = {
+            "licenses": args.licenses,
+            "geocode_seconds": round(build_seconds, 2),
+            "within_10mi_rtree_ms": timed(lambda lat, lon: geo_index.within(con, 'license', lat, lon, 10), origins),
+            "within_10mi_scan_ms": timed(scan, origins[:5]),
+            "nearest_contact_ms": timed(lambda lat, lon: geo_index.nearest(con, 'contact', lat, lon), origins),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
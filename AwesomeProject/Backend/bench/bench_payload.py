@@ -0,0 +1,78 @@
+# Bytes on the wire and serialization CPU for the largest JSON responses
+# Encodes the recorded openFDA and search fixtures the way the routes return
+# them, with the standard provider and with orjson (FAST_JSON), then reports
+# the body size raw, after a typical ?fields= projection and after each
+# available content coding at the levels payload.py uses.
+#
+#   python bench/bench_payload.py
+#   python bench/bench_payload.py --repeat 200
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import payload  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# fixture -> fields a list view actually reads
+PAYLOADS = {
+    'openfda_510k.json': 'results.k_number,results.applicant,results.device_name,results.decision_date',
+    'openfda_enforcement.json': 'results.recall_number,results.recalling_firm,results.classification,'
+                                'results.product_description',
+    'openfda_event.json': 'results.report_number,results.date_received,results.event_type',
+    'elasticsearch_search.json': 'hits.hits._source',
+    'bizfile_businesssearch.json': 'rows',
+}
+
+
+def timed(fn, repeat):
+    fn()  # warm up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return round(statistics.median(timings) * 1000, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    providers = {'json': payload.ProjectingJSONProvider(app)}
+    if payload.orjson:
+        providers['orjson'] = payload.OrjsonProvider(app)
+    encodings = [coding for coding, module in (('gzip', payload.gzip), ('br', payload.brotli),
+                                                ('zstd', payload.zstandard)) if module]
+
+    report = {}
+    for name, fields in PAYLOADS.items():
+        with open(os.path.join(FIXTURES, name)) as f:
+            obj = json.load(f)
+        body = providers['json'].dumps(obj).encode()
+        projected = providers['json'].dumps(payload.project(obj, payload.parse_fields(fields))).encode()
+        entry = {
+            'serialize_ms': {label: timed(lambda: provider.dumps(obj), args.repeat)
+                             for label, provider in providers.items()},
+            'bytes': {'raw': len(body), 'fields': len(projected)},
+        }
+        for coding in encodings:
+            entry['bytes'][coding] = len(payload.compress(body, coding))
+            entry['bytes'][f'fields+{coding}'] = len(payload.compress(projected, coding))
+            entry.setdefault('compress_ms', {})[coding] = timed(lambda: payload.compress(body, coding), args.repeat)
+        report[name] = entry
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# Import-time profile of main.py
+# Runs `python -X importtime -c "import main"` in a scratch directory (with the
+# bench fixtures as the CSV inputs and background tasks deferred) and reports
+# the total import time and the slowest top-level packages.
+#
+#   python bench/importtime.py
+#   PRELOAD_MODEL=1 python bench/importtime.py --top 15 --out importtime.json
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+
+
+def parse_importtime(stderr):
+    """
+    Rows of (self_us, cumulative_us, module) from -X importtime output. The
+    indentation of the module name gives its nesting depth.
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|', 2)
+        name = module.rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return rows
+
+
+def summarize(rows, top):
+    # Sum the direct imports of main per root package
+    packages = {}
+    for self_us, cumulative_us, depth, name in rows:
+        if depth == 1:
+            root = name.split('.')[0]
+            packages[root] = packages.get(root, 0) + cumulative_us
+    main_us = next((cumulative_us for _, cumulative_us, depth, name in rows if name == 'main'), None)
+    slowest = sorted(packages.items(), key=lambda item: -item[1])
+    loaded = {name.split('.')[0] for _, _, _, name in rows}
+    return {
+        "main_import_ms": None if main_us is None else round(main_us / 1000, 1),
+        "modules_imported": len(rows),
+        "slowest_packages_ms": {name: round(us / 1000, 1) for name, us in slowest[:top]},
+        "heavy_packages_loaded": sorted(loaded & {'ultralytics', 'torch', 'cv2', 'serpapi', 'bs4', 'numpy', 'PIL'}),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--out', help='write the JSON report here as well')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='importtime-')
+    for fixture in ('info.csv', 'license.csv'):
+        shutil.copy(os.path.join(BENCH_DIR, 'fixtures', fixture), workdir)
+    env = dict(os.environ, DEFER_BACKGROUND_TASKS='1', INDEX_DB_PATH=os.path.join(workdir, 'index.db'),
+               PYTHONPATH=os.pathsep.join(filter(None, [BACKEND_DIR, os.getenv('PYTHONPATH')])))
+
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'], cwd=workdir, env=env,
+                            capture_output=True, text=True)
+    shutil.rmtree(workdir, ignore_errors=True)
+    rows = parse_importtime(result.stderr)
+    if result.returncode != 0:
+        errors = [line for line in result.stderr.splitlines() if not line.startswith('import time:')]
+        sys.exit("import main failed:\n" + "\n".join(errors[-20:]))
+
+    report = summarize(rows, args.top)
+    report["preload_model"] = bool(os.getenv('PRELOAD_MODEL'))
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+# Concurrent load generator for the backend routes
+# Reports throughput and latency percentiles per route as JSON, and compares
+# two reports:
+#
+#   python bench/loadgen.py --base-url http://127.0.0.1:8080 --out run.json
+#   python bench/loadgen.py --compare baseline.json run.json
+
+import argparse
+import json
+import sys
+import threading
+import time
+
+import requests
+
+
+# (name, method, path, json body)
+SCENARIOS = [
+    ('POST / (recalls)', 'POST', '/', {"productDescription": "heart"}),
+    ('POST /k510', 'POST', '/k510', {"deviceName": "heart"}),
+    ('POST /maude', 'POST', '/maude', {"deviceName": "heart"}),
+    ('POST /batch', 'POST', '/batch', {"queries": [
+        {"type": "k510", "k510Number": "K191234"}, {"type": "k510", "k510Number": "K201234"},
+        {"type": "recall", "productDescription": "heart"}, {"type": "maude", "deviceName": "heart"}]}),
+    ('POST /cdph', 'POST', '/cdph', {"deviceName": "heart"}),
+    ('POST /openhistorical', 'POST', '/openhistorical', {"keyword": "heart"}),
+    ('POST /ca-business-entity', 'POST', '/ca-business-entity', {"searchTerm": "heart"}),
+    ('POST /warning_letters', 'POST', '/warning_letters', {"firmName": "medtronic"}),
+    ('POST /chat (confluence)', 'POST', '/chat', {"message": "what is our privacy policy"}),
+    ('POST /chat (rasa)', 'POST', '/chat', {"message": "hello"}),
+    ('GET /contacts', 'GET', '/contacts', None),
+    ('GET /licenses', 'GET', '/licenses', None),
+]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies, errors, elapsed, response_bytes):
+    latencies = sorted(latencies)
+    ms = lambda value: None if value is None else round(value * 1000, 2)
+    count = len(latencies)
+    return {
+        "requests": count,
+        "errors": errors,
+        "throughput_rps": round(count / elapsed, 2) if elapsed else 0,
+        "mean_ms": ms(sum(latencies) / count) if count else None,
+        "p50_ms": ms(percentile(latencies, 0.50)),
+        "p90_ms": ms(percentile(latencies, 0.90)),
+        "p95_ms": ms(percentile(latencies, 0.95)),
+        "p99_ms": ms(percentile(latencies, 0.99)),
+        "max_ms": ms(latencies[-1]) if latencies else None,
+        "mean_response_bytes": round(response_bytes / count) if count else 0,
+    }
+
+
+class _Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.bytes = {}
+
+    def add(self, name, latency, ok, size):
+        with self.lock:
+            if ok:
+                self.latencies.setdefault(name, []).append(latency)
+                self.bytes[name] = self.bytes.get(name, 0) + size
+            else:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+
+def _worker(base_url, scenarios, deadline, recorder, offset):
+    session = requests.Session()
+    i = offset
+    while time.perf_counter() < deadline:
+        name, method, path, body = scenarios[i % len(scenarios)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            response = session.request(method, base_url + path, json=body, timeout=60)
+            ok, size = response.status_code < 400, len(response.content)
+        except requests.RequestException:
+            ok, size = False, 0
+        recorder.add(name, time.perf_counter() - start, ok, size)
+
+
+def drive(base_url, scenarios, concurrency, duration):
+    """Run `concurrency` workers cycling through the scenarios for `duration` seconds."""
+    recorder = _Recorder()
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=_worker, args=(base_url, scenarios, deadline, recorder, n))
+               for n in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {name: summarize(recorder.latencies.get(name, []), recorder.errors.get(name, 0), elapsed,
+                            recorder.bytes.get(name, 0))
+            for name, _, _, _ in scenarios}
+
+
+def run_load(base_url, scenarios=SCENARIOS, concurrency=8, duration=10, mode='isolated', warmup=1):
+    """
+    In isolated mode each route is driven on its own; in mixed mode all routes
+    share the workers, which shows how slow routes affect cheap ones.
+    """
+    for name, method, path, body in scenarios:
+        for _ in range(warmup):
+            requests.request(method, base_url + path, json=body, timeout=60)
+    if mode == 'mixed':
+        return drive(base_url, scenarios, concurrency, duration)
+    routes = {}
+    for scenario in scenarios:
+        routes.update(drive(base_url, [scenario], concurrency, duration))
+    return routes
+
+
+def compare(baseline, current):
+    """Table of per-route changes between two reports."""
+    lines = [f"{'route':32} {'rps':>18} {'p50 ms':>20} {'p99 ms':>20}"]
+    for name, now in current["routes"].items():
+        before = baseline["routes"].get(name)
+        if not before:
+            continue
+        cells = []
+        for key in ("throughput_rps", "p50_ms", "p99_ms"):
+            old, new = before.get(key), now.get(key)
+            change = f"{100 * (new - old) / old:+.0f}%" if old and new is not None else "n/a"
+            cells.append(f"{old} -> {new} ({change})")
+        lines.append(f"{name:32} {cells[0]:>18} {cells[1]:>20} {cells[2]:>20}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--base-url', default='http://127.0.0.1:8080')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10, help='seconds per route (isolated) or in total (mixed)')
+    parser.add_argument('--mode', choices=('isolated', 'mixed'), default='isolated')
+    parser.add_argument('--out', help='write the JSON report here instead of stdout')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), help='compare two reports and exit')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f, open(args.compare[1]) as g:
+            print(compare(json.load(f), json.load(g)))
+        return
+
+    report = {
+        "meta": {"base_url": args.base_url, "concurrency": args.concurrency, "duration": args.duration,
+                 "mode": args.mode, "started_at": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "routes": run_load(args.base_url, concurrency=args.concurrency, duration=args.duration, mode=args.mode),
+    }
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output)
+    else:
+        sys.stdout.write(output + "\n")
+
+
+if __name__ == '__main__':
+    main()
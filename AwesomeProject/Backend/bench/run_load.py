@@ -0,0 +1,142 @@
+# Offline load test: starts the upstream stubs and main.py pointed at them,
+# drives the routes with bench/loadgen.py and writes a JSON report that can
+# be compared across runs.
+#
+#   python bench/run_load.py --out before.json
+#   ... change something ...
+#   python bench/run_load.py --out after.json --compare before.json
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import loadgen  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(url, timeout=2).status_code < 500:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def backend_env(stub_url, port, workdir):
+    env = dict(os.environ)
+    env.update({
+        'PORT': str(port),
+        'FDA_API_KEY': 'bench',
+        'SERP_API_KEY': 'bench',
+        'APP_SECRET_KEY': 'bench',
+        'OPENFDA_BASE_URL': stub_url,
+        'CDPH_BASE_URL': stub_url,
+        'BIZFILE_SEARCH_URL': f'{stub_url}/api/Records/businesssearch',
+        'DASHBOARD_API_URL': f'{stub_url}/v1/compliance_actions',
+        'ELASTICSEARCH_URL': stub_url,
+        'RASA_URL': f'{stub_url}/webhooks/rest/webhook',
+        'CONFLUENCE_BASE_URL': stub_url,
+        'CONFLUENCE_EMAIL': 'bench@example.com',
+        'CONFLUENCE_API_TOKEN': 'bench',
+        'INDEX_DB_PATH': os.path.join(workdir, 'index.db'),
+        'RATE_LIMIT_DB_PATH': os.path.join(workdir, 'rate_limit.db'),
+        'LOG_LEVEL': 'WARNING',
+    })
+    # Without dashboard credentials the warning-letter sync stays off and the
+    # route exercises the live upstream path
+    env.pop('AUTHORIZATION_USER', None)
+    env.pop('AUTHORIZATION_KEY', None)
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--mode', choices=('isolated', 'mixed'), default='isolated')
+    parser.add_argument('--latency', action='append', help='passed to bench/stubs.py, e.g. openfda=250/100')
+    parser.add_argument('--routes', help='comma-separated substrings selecting scenarios, e.g. "/k510,/contacts"')
+    parser.add_argument('--startup-timeout', type=float, default=180)
+    parser.add_argument('--out', default='bench_results.json')
+    parser.add_argument('--compare', help='earlier report to compare against')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    for fixture in ('info.csv', 'license.csv'):
+        shutil.copy(os.path.join(BENCH_DIR, 'fixtures', fixture), workdir)
+
+    stub_port, backend_port = free_port(), free_port()
+    stub_url, backend_url = f'http://127.0.0.1:{stub_port}', f'http://127.0.0.1:{backend_port}'
+    stub_cmd = [sys.executable, os.path.join(BENCH_DIR, 'stubs.py'), '--port', str(stub_port)]
+    for latency in args.latency or []:
+        stub_cmd += ['--latency', latency]
+
+    log = open(os.path.join(workdir, 'backend.log'), 'w')
+    stubs = subprocess.Popen(stub_cmd)
+    backend = subprocess.Popen([sys.executable, os.path.join(BACKEND_DIR, 'main.py')], cwd=workdir,
+                               env=backend_env(stub_url, backend_port, workdir), stdout=log, stderr=subprocess.STDOUT)
+    try:
+        wait_for(f'{stub_url}/__stats', 30)
+        started = time.perf_counter()
+        wait_for(f'{backend_url}/metrics', args.startup_timeout)
+        startup_seconds = time.perf_counter() - started
+
+        scenarios = loadgen.SCENARIOS
+        if args.routes:
+            wanted = args.routes.split(',')
+            scenarios = [s for s in scenarios if any(w in s[0] for w in wanted)]
+
+        routes = loadgen.run_load(backend_url, scenarios, args.concurrency, args.duration, args.mode)
+        report = {
+            "meta": {
+                "commit": subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                                         capture_output=True, text=True).stdout.strip(),
+                "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "concurrency": args.concurrency,
+                "duration": args.duration,
+                "mode": args.mode,
+                "latency": args.latency or "default",
+                "backend_startup_seconds": round(startup_seconds, 2),
+            },
+            "routes": routes,
+            "upstream_calls": requests.get(f'{stub_url}/__stats', timeout=5).json(),
+        }
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(json.dumps(report, indent=2))
+
+        if args.compare:
+            with open(args.compare) as f:
+                print(loadgen.compare(json.load(f), report))
+    finally:
+        backend.terminate()
+        stubs.terminate()
+        backend.wait(10)
+        stubs.wait(10)
+        log.close()
+        print(f"backend log: {os.path.join(workdir, 'backend.log')}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+# Local stand-ins for the backend's upstream services
+# Replays the sample responses in bench/fixtures (openFDA, CDPH, bizfile,
+# FDA dashboard, Elasticsearch, RASA, Confluence) with configurable latency,
+# and counts calls per upstream on GET /__stats.
+#
+#   python bench/stubs.py --port 9100 --latency openfda=250 --latency cdph=600
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# (upstream, method, path prefix, fixture file)
+ROUTES = [
+    ('openfda', 'GET', '/device/enforcement.json', 'openfda_enforcement.json'),
+    ('openfda', 'GET', '/device/510k.json', 'openfda_510k.json'),
+    ('openfda', 'GET', '/device/event.json', 'openfda_event.json'),
+    ('openfda', 'GET', '/other/historicaldocument.json', 'openfda_historicaldocument.json'),
+    ('cdph', 'GET', '/Programs/CEH/DFDCS/Pages/FDBPrograms/DeviceRecalls.aspx', 'cdph_device_recalls.html'),
+    ('bizfile', 'POST', '/api/Records/businesssearch', 'bizfile_businesssearch.json'),
+    ('fda_dashboard', 'POST', '/v1/compliance_actions', 'fda_dashboard_compliance_actions.json'),
+    ('elasticsearch', 'GET', '/document-with-vector/_search', 'elasticsearch_search.json'),
+    ('rasa', 'POST', '/webhooks/rest/webhook', 'rasa_webhook.json'),
+    ('confluence', 'GET', '/wiki/rest/api/content/', 'confluence_page.json'),
+    ('fda_letters', 'HEAD', '/inspections-compliance-enforcement-and-criminal-investigations/warning-letters/', None),
+]
+
+# Typical observed latency of each upstream in milliseconds: (mean, jitter)
+DEFAULT_LATENCY_MS = {
+    'openfda': (250, 100),
+    'cdph': (600, 200),
+    'bizfile': (400, 150),
+    'fda_dashboard': (500, 200),
+    'elasticsearch': (40, 20),
+    'rasa': (80, 30),
+    'confluence': (200, 80),
+    'fda_letters': (150, 50),
+}
+
+
+class StubState:
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.bodies = {}
+        for _, _, _, fixture in ROUTES:
+            if fixture and fixture not in self.bodies:
+                with open(os.path.join(FIXTURES, fixture), 'rb') as f:
+                    self.bodies[fixture] = f.read()
+
+    def record(self, upstream):
+        with self.lock:
+            self.calls[upstream] = self.calls.get(upstream, 0) + 1
+
+    def delay(self, upstream):
+        mean, jitter = self.latency.get(upstream, (0, 0))
+        time.sleep(max(0.0, random.uniform(mean - jitter, mean + jitter)) / 1000)
+
+
+def make_handler(state):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body, content_type='application/json'):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(body)
+
+        def _handle(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                self.rfile.read(length)
+
+            path = self.path.split('?', 1)[0]
+            if path == '/__stats':
+                return self._send(200, json.dumps(state.calls).encode())
+            for upstream, method, prefix, fixture in ROUTES:
+                if self.command == method and path.startswith(prefix):
+                    state.record(upstream)
+                    state.delay(upstream)
+                    if fixture is None:
+                        return self._send(200, b'', 'text/html')
+                    content_type = 'text/html' if fixture.endswith('.html') else 'application/json'
+                    return self._send(200, state.bodies[fixture], content_type)
+            self._send(404, b'{"error": "no stub for this path"}')
+
+        do_GET = do_POST = do_HEAD = _handle
+
+    return StubHandler
+
+
+def parse_latency(values):
+    latency = dict(DEFAULT_LATENCY_MS)
+    for value in values or []:
+        upstream, _, spec = value.partition('=')
+        mean, _, jitter = spec.partition('/')
+        latency[upstream] = (float(mean), float(jitter or 0))
+    return latency
+
+
+def serve(port, latency):
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(StubState(latency)))
+    server.daemon_threads = True
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=9100)
+    parser.add_argument('--latency', action='append',
+                        help='upstream=mean_ms[/jitter_ms], e.g. openfda=250/100; 0 disables the delay')
+    args = parser.parse_args()
+    serve(args.port, parse_latency(args.latency))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+# In-process caches shared by the backend routes
+
+import functools
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, request
+
+
+class TTLCache:
+    """
+    Thread-safe mapping whose entries expire after a time-to-live. Holds at
+    most maxsize entries, evicting the least recently used first.
+    """
+
+    def __init__(self, ttl, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def keys(self):
+        with self._lock:
+            return list(self._data)
+
+
+_Stored = namedtuple('_Stored', 'stored_at status body mimetype')
+
+
+class SWRCache:
+    """
+    Route responses kept for hard_ttl. Within soft_ttl they are served as
+    they are; after that they are still served, but refreshed by one
+    background call per key.
+    """
+
+    def __init__(self, soft_ttl, hard_ttl, maxsize=1024, workers=2):
+        self.soft_ttl = soft_ttl
+        self.hard_ttl = hard_ttl
+        self.entries = TTLCache(hard_ttl, maxsize)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="swr-refresh")
+
+    @property
+    def hits(self):
+        return self.entries.hits
+
+    @property
+    def misses(self):
+        return self.entries.misses
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def store(self, key, response):
+        """Keep a successful response; anything else is not cached."""
+        if response.status_code == 200 and not response.direct_passthrough:
+            self.entries.set(key, _Stored(time.time(), response.status_code, response.get_data(), response.mimetype))
+
+    def refresh_later(self, key, fetch):
+        """Run fetch() -> response in the background, unless a refresh of key is already running."""
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self.store(key, fetch())
+            except Exception as e:
+                # The stale copy keeps serving until the hard TTL
+                logging.warning(f"Background refresh failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._executor.submit(refresh)
+
+
+def canonical_json(data):
+    """
+    JSON body as a cache key: keys sorted, string values trimmed and empty
+    fields dropped, so requests the routes treat alike share one entry.
+    """
+    if isinstance(data, dict):
+        data = {key: value.strip() if isinstance(value, str) else value for key, value in data.items()}
+        data = {key: value for key, value in data.items() if value not in ('', None, [], {})}
+    return json.dumps(data, sort_keys=True, separators=(',', ':'))
+
+
+def _request_key():
+    data = request.get_json(silent=True)
+    body = canonical_json(data) if data is not None else request.get_data()
+    return (request.method, request.path, tuple(sorted(request.args.items(multi=True))), body)
+
+
+def _freshness(response, cache, age, state):
+    response.headers['Age'] = str(int(age))
+    response.headers['Cache-Control'] = \
+        f"max-age={int(cache.soft_ttl)}, stale-while-revalidate={int(cache.hard_ttl - cache.soft_ttl)}"
+    response.headers['X-Cache'] = state
+    return response
+
+
+def stale_while_revalidate(soft_ttl, hard_ttl, maxsize=1024):
+    """
+    Route decorator: answer from the last successful response of the same
+    request (method, path, query string and body) while it is younger than
+    hard_ttl, refreshing it in the background once it is older than
+    soft_ttl. Only requests with nothing cached wait for the route. Age,
+    Cache-Control and X-Cache (hit, stale or miss) tell clients how fresh
+    the answer is. Only for routes whose answer does not depend on who asks.
+    """
+    cache = SWRCache(soft_ttl, hard_ttl, maxsize)
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = _request_key()
+            entry = cache.get(key)
+            if entry is not None:
+                age = time.time() - entry.stored_at
+                if age >= soft_ttl:
+                    cache.refresh_later(key, _replay(view, args, kwargs))
+                response = current_app.response_class(entry.body, status=entry.status, mimetype=entry.mimetype)
+                return _freshness(response, cache, age, 'stale' if age >= soft_ttl else 'hit')
+
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            cache.store(key, response)
+            return _freshness(response, cache, 0, 'miss')
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
+
+
+def _replay(view, args, kwargs):
+    """A function that runs the view again on a copy of the current request, outside of it."""
+    app = current_app._get_current_object()
+    path, method, query, body = request.path, request.method, request.query_string, request.get_data()
+    content_type = request.content_type
+
+    def fetch():
+        with app.test_request_context(path, method=method, query_string=query, data=body,
+                                      content_type=content_type):
+            return app.make_response(view(*args, **kwargs))
+
+    return fetch
+
+
+def warm(view, **view_args):
+    """
+    Fill the cache of a stale_while_revalidate view for the current request
+    without answering it. Returns False, without calling the view, if a
+    fresh copy is already cached.
+    """
+    key = _request_key()
+    entry = view.cache.get(key)
+    if entry is not None and time.time() - entry.stored_at < view.cache.soft_ttl:
+        return False
+    view.cache.store(key, current_app.make_response(view.__wrapped__(**view_args)))
+    return True
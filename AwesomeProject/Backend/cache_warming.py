@@ -0,0 +1,185 @@
+# Cache warming for the most frequent searches
+# Searches on WARM_ROUTES are counted as they are answered, in a count-min
+# sketch (fixed memory however many distinct searches there are) with a
+# top-K table of the heaviest ones on top. Once a day, in the off-peak
+# WARM_HOURS, the top searches are replayed into the routes'
+# stale_while_revalidate caches, spending at most WARM_BUDGET upstream calls,
+# so the morning rush finds them cached. Counts are halved after every run,
+# so the ranking follows recent traffic.
+#
+# Counts and caches are per process: each worker warms its own cache, and the
+# budget applies per worker.
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from flask import request
+
+import cache
+from cache import canonical_json
+
+
+WARM_ROUTES = tuple(os.getenv('WARM_ROUTES', '/,/k510,/maude,/warning_letters').split(','))
+WARM_TOP_K = int(os.getenv('WARM_TOP_K', 300))
+WARM_BUDGET = int(os.getenv('WARM_BUDGET', 200))
+# Local hours [start, end), e.g. "2-6" for 02:00-05:59; may wrap midnight ("22-4")
+WARM_HOURS = os.getenv('WARM_HOURS', '2-6')
+# Pause between warming calls, to keep the upstreams' rate limits for users
+WARM_PAUSE = float(os.getenv('WARM_PAUSE', 1.0))
+WARM_CHECK_INTERVAL = int(os.getenv('WARM_CHECK_INTERVAL', 600))
+
+
+class CountMinSketch:
+    """
+    Approximate counts in depth x width counters. Estimates are never below
+    the true count and exceed it by at most 2N/width with probability
+    1 - 2^-depth, N being the total of all counts.
+    """
+
+    def __init__(self, width=4096, depth=4):
+        self.width = width
+        self.depth = depth
+        self.rows = [[0] * width for _ in range(depth)]
+
+    def _cells(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=4 * self.depth).digest()
+        return [int.from_bytes(digest[4 * i:4 * i + 4], 'little') % self.width for i in range(self.depth)]
+
+    def add(self, item, count=1):
+        """Count item and return its new estimate."""
+        estimate = None
+        for row, cell in zip(self.rows, self._cells(item)):
+            row[cell] += count
+            estimate = row[cell] if estimate is None else min(estimate, row[cell])
+        return estimate
+
+    def estimate(self, item):
+        return min(row[cell] for row, cell in zip(self.rows, self._cells(item)))
+
+    def halve(self):
+        self.rows = [[count >> 1 for count in row] for row in self.rows]
+
+
+class HeavyHitters:
+    """The k items with the highest count-min estimates."""
+
+    def __init__(self, k, sketch=None):
+        self.k = k
+        self.sketch = sketch or CountMinSketch()
+        self.top = {}
+        self._floor = 0
+        self._lock = threading.Lock()
+
+    def add(self, item):
+        with self._lock:
+            estimate = self.sketch.add(item)
+            if item in self.top or len(self.top) < self.k:
+                self.top[item] = estimate
+            elif estimate > self._floor:
+                # The floor only moves up between decays, so it is recomputed
+                # only when an item may displace the lightest one
+                lightest = min(self.top, key=self.top.get)
+                self._floor = self.top[lightest]
+                if estimate > self._floor:
+                    del self.top[lightest]
+                    self.top[item] = estimate
+
+    def most_common(self, n=None):
+        with self._lock:
+            return sorted(self.top.items(), key=lambda entry: -entry[1])[:n]
+
+    def decay(self):
+        """Halve every count, dropping items that reach zero."""
+        with self._lock:
+            self.sketch.halve()
+            self.top = {item: count >> 1 for item, count in self.top.items() if count >> 1}
+            self._floor = min(self.top.values(), default=0)
+
+
+def parse_hours(spec):
+    """'2-6' -> {2, 3, 4, 5}; '22-4' -> {22, 23, 0, 1, 2, 3}."""
+    start, end = (int(hour) % 24 for hour in spec.split('-'))
+    return {hour % 24 for hour in range(start, end if end > start else end + 24)}
+
+
+class CacheWarmer:
+    """Counts searches on the app's routes and replays the top ones off-peak."""
+
+    def __init__(self, routes=WARM_ROUTES, top_k=WARM_TOP_K, budget=WARM_BUDGET, hours=WARM_HOURS,
+                 pause=WARM_PAUSE, check_interval=WARM_CHECK_INTERVAL):
+        self.routes = set(routes)
+        self.searches = HeavyHitters(top_k)
+        self.budget = budget
+        self.hours = parse_hours(hours)
+        self.pause = pause
+        self.check_interval = check_interval
+        self.last_run = None
+        self.app = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        self.app = app
+
+        @app.after_request
+        def _count_search(response):
+            if request.method == 'POST' and request.path in self.routes and response.status_code == 200:
+                data = request.get_json(silent=True)
+                if isinstance(data, dict):
+                    self.searches.add(json.dumps([request.path, canonical_json(data)]))
+            return response
+
+    def run(self):
+        """Warm the top searches, most frequent first, within the budget. Returns the counts."""
+        counts = {"warmed": 0, "fresh": 0, "failed": 0}
+        adapter = self.app.url_map.bind('')
+        for item, _ in self.searches.most_common():
+            if counts["warmed"] + counts["failed"] >= self.budget or self._stop.is_set():
+                break
+            path, body = json.loads(item)
+            try:
+                endpoint, view_args = adapter.match(path, method='POST')
+                view = self.app.view_functions[endpoint]
+                if not hasattr(view, 'cache'):
+                    continue
+                with self.app.test_request_context(path, method='POST', data=body,
+                                                   content_type='application/json'):
+                    if not cache.warm(view, **view_args):
+                        counts["fresh"] += 1
+                        continue
+                counts["warmed"] += 1
+            except Exception as e:
+                counts["failed"] += 1
+                logging.warning(f"Cache warming failed for {path} {body}: {e}")
+            self._stop.wait(self.pause)
+        self.searches.decay()
+        return counts
+
+    def due(self, now=None):
+        now = now or datetime.now()
+        return now.hour in self.hours and self.last_run != now.date()
+
+    def _run(self):
+        while not self._stop.wait(self.check_interval):
+            if not self.due():
+                continue
+            self.last_run = datetime.now().date()
+            start = time.perf_counter()
+            try:
+                counts = self.run()
+                logging.info(f"Cache warmed in {time.perf_counter() - start:.0f}s: {counts}")
+            except Exception as e:
+                logging.error(f"Cache warming failed: {e}")
+
+    def start(self):
+        if self._thread is None and self.app is not None:
+            self._thread = threading.Thread(target=self._run, name="cache-warming", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,194 @@
+# Helpers for the /chat route: keyword matching against known Confluence
+# pages, a cache of those pages' bodies, and a pooled client to RASA
+
+import base64
+import logging
+import os
+import threading
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import connectors
+from cache import TTLCache
+from metrics import track_upstream
+from singleflight import flights
+
+
+# Confluence-related keywords mapped to page IDs, in match priority order
+CONFLUENCE_PAGES = {
+    "product requirements": "30507017",
+    "masvs checklist": "41353217",
+    "privacy": "29655042",
+    "build .ipa": "33325058",
+    "unit testing": "56262659",
+    "samd": "29032449",
+    "pytorch": "28835843",
+    "hardware considerations": "27131907",
+    "mysql database": "60391427",
+    "mysql backend": "59834369",
+    "flask api": "74088449"
+}
+
+RASA_URL = os.getenv('RASA_URL', "http://localhost:5005/webhooks/rest/webhook")
+CONFLUENCE_PAGE_TTL = int(os.getenv('CONFLUENCE_PAGE_TTL', 3600))
+CONFLUENCE_REFRESH_INTERVAL = int(os.getenv('CONFLUENCE_REFRESH_INTERVAL', 600))
+
+
+class IntentMatcher:
+    """
+    Aho-Corasick automaton over the keywords, built once. match() scans the
+    message a single time and returns the value of the highest-priority
+    keyword found anywhere in it, like checking each keyword with `in`.
+    """
+
+    def __init__(self, keywords):
+        self._values = list(keywords.values())
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [None]  # best (lowest) keyword priority ending at each state
+
+        for priority, keyword in enumerate(keywords):
+            state = 0
+            for char in keyword:
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(None)
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+            if self._output[state] is None:
+                self._output[state] = priority
+
+        # Breadth-first pass to set failure links and inherit outputs
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                inherited = self._output[self._fail[child]]
+                if inherited is not None and (self._output[child] is None or inherited < self._output[child]):
+                    self._output[child] = inherited
+
+    def match(self, text):
+        best = None
+        state = 0
+        for char in text:
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            found = self._output[state]
+            if found is not None and (best is None or found < best):
+                best = found
+                if best == 0:
+                    break
+        return None if best is None else self._values[best]
+
+
+class ConfluenceClient:
+    """
+    Fetches Confluence page bodies with a reusable authenticated session and
+    keeps them in a TTL cache that a background thread refreshes ahead of
+    expiry.
+    """
+
+    def __init__(self, base_url, email, api_token, ttl=CONFLUENCE_PAGE_TTL,
+                 refresh_interval=CONFLUENCE_REFRESH_INTERVAL):
+        self.base_url = base_url
+        self.pages = TTLCache(ttl, maxsize=256)
+        self.refresh_interval = refresh_interval
+        self.session = requests.Session()
+        if email and api_token:
+            auth_bytes = base64.b64encode(f"{email}:{api_token}".encode('utf-8')).decode('utf-8')
+            self.session.headers.update({
+                'Authorization': f'Basic {auth_bytes}',
+                'Content-Type': 'application/json'
+            })
+        self._configured = all([base_url, email, api_token])
+        self._thread = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.getenv('CONFLUENCE_BASE_URL'), os.getenv('CONFLUENCE_EMAIL'), os.getenv('CONFLUENCE_API_TOKEN'))
+
+    def is_configured(self):
+        return self._configured
+
+    def fetch_page(self, page_id):
+        url = f"{self.base_url}/wiki/rest/api/content/{page_id}?expand=body.storage"
+
+        def send(timeout):
+            with track_upstream('confluence') as call:
+                response = call.response = self.session.get(url, timeout=timeout)
+                response.raise_for_status()
+            return response
+
+        def fetch():
+            return connectors.get('confluence').call(send, idempotent=True, key=('GET', url))
+
+        # Concurrent misses on the same page share one request
+        data = flights.do(('GET', url), fetch).json()
+        page_content = data.get('body', {}).get('storage', {}).get('value', 'No content available')
+        self.pages.set(page_id, page_content)
+        return page_content
+
+    def page(self, page_id):
+        """Cached page body, fetched live only on a miss."""
+        page_content = self.pages.get(page_id)
+        if page_content is None:
+            page_content = self.fetch_page(page_id)
+        return page_content
+
+    def _refresh(self, page_ids):
+        while not self._stop.is_set():
+            for page_id in page_ids:
+                try:
+                    self.fetch_page(page_id)
+                except requests.RequestException as e:
+                    # The cached copy keeps serving until its TTL runs out
+                    logging.warning(f"Error refreshing Confluence page {page_id}: {e}")
+            self._stop.wait(self.refresh_interval)
+
+    def start_refresh(self, page_ids):
+        """Keep the given pages warm in the background."""
+        if self._thread is None and self._configured:
+            self._thread = threading.Thread(target=self._refresh, args=(list(page_ids),),
+                                            name="confluence-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+class RasaClient:
+    """Keep-alive connection pool to the RASA REST webhook."""
+
+    def __init__(self, url=RASA_URL, pool_size=int(os.getenv('RASA_POOL_SIZE', 10)), timeout=30):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def reply(self, message):
+        def send(timeout):
+            with track_upstream('rasa') as call:
+                response = call.response = self.session.post(self.url, json={"sender": "user", "message": message},
+                                                             timeout=timeout)
+                response.raise_for_status()
+            return response
+
+        response = connectors.get('rasa').call(send, timeout=self.timeout)
+
+        # Combine responses if RASA sends multiple messages
+        bot_responses = response.json()
+        if bot_responses:
+            return " ".join([resp.get("text", "") for resp in bot_responses])
+        return "I'm not sure how to respond to that."
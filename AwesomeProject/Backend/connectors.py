@@ -0,0 +1,330 @@
+# Upstream connectors: circuit breakers, hedged requests and request deadlines
+# Every upstream call goes through the Connector of its service.
+#  - Each upstream has a circuit breaker. After BREAKER_FAILURES consecutive
+#    failures (connection errors, timeouts, 5xx) it opens, and calls fail at
+#    once with CircuitOpen instead of each waiting out the timeout. After
+#    BREAKER_RESET seconds one trial call goes through; it closes the breaker
+#    again or keeps it open.
+#  - The last good response of each idempotent call is kept for STALE_TTL.
+#    While the breaker is open, or when the call fails, that copy is served
+#    and the response is marked with a Warning header.
+#  - Idempotent calls are hedged: with no answer after the upstream's
+#    hedge_after seconds a second, identical request is sent and whichever
+#    answers first wins. Only slow-tail calls are doubled, and a caller with
+#    a quota can refuse the second request (hedge_permit), e.g. when its rate
+#    limiter has no token for it. The first request gets a thread of its own,
+#    so it is sent at once and the hedge delay counts from sending; only
+#    hedges share the HEDGE_WORKERS pool, and a hedge that starts too late to
+#    finish within the timeout is dropped.
+#  - Each incoming request has a time budget (REQUEST_DEADLINE, or less if
+#    the client sends X-Request-Timeout in seconds). Upstream timeouts are cut
+#    to what is left of it, and a call with no time left is not sent.
+#
+# Upstream timeouts and hedge delays can be overridden per service with
+# <NAME>_TIMEOUT and <NAME>_HEDGE_AFTER (0 disables hedging).
+
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+from flask import request
+
+from cache import TTLCache
+from metrics import registry, Counter, Gauge
+
+
+BREAKER_FAILURES = int(os.getenv('BREAKER_FAILURES', 5))
+BREAKER_RESET = float(os.getenv('BREAKER_RESET', 30))
+REQUEST_DEADLINE = float(os.getenv('REQUEST_DEADLINE', 60))
+STALE_TTL = int(os.getenv('STALE_TTL', 24 * 3600))
+STALE_CACHE_SIZE = int(os.getenv('STALE_CACHE_SIZE', 512))
+HEDGE_WORKERS = int(os.getenv('HEDGE_WORKERS', 16))
+
+# upstream -> (timeout seconds, hedge after seconds or None)
+UPSTREAMS = {
+    'openfda': (30, 5),
+    'cdph': (20, 3),
+    'bizfile': (20, None),
+    'fda_dashboard': (60, None),
+    'fda_letters': (15, 5),
+    'elasticsearch': (10, 1),
+    'confluence': (15, 3),
+    'rasa': (30, None),
+    'serpapi': (60, None),
+}
+
+# Environment variables whose values must never appear in error details
+SECRET_ENV_VARS = ('FDA_API_KEY', 'SERP_API_KEY', 'CONFLUENCE_API_TOKEN', 'AUTHORIZATION_KEY')
+
+circuit_open = registry.register(Gauge(
+    'upstream_circuit_open', '1 while the upstream circuit breaker is open', ('upstream',)))
+stale_responses = registry.register(Counter(
+    'upstream_stale_responses_total', 'Cached responses served because an upstream was down', ('upstream',)))
+hedged_requests = registry.register(Counter(
+    'upstream_hedged_requests_total', 'Second requests sent because the first was slow', ('upstream',)))
+
+_deadline = contextvars.ContextVar('upstream_deadline', default=None)
+_stale_age = contextvars.ContextVar('upstream_stale_age', default=None)
+_hedges = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="upstream-hedge")
+
+
+class CircuitOpen(requests.RequestException):
+    """The upstream is failing; the call was not sent."""
+
+    def __init__(self, upstream, retry_after):
+        super().__init__(f"{upstream} is unavailable, retry in {round(retry_after)}s")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(requests.Timeout):
+    """The request's time budget ran out before the upstream call."""
+
+
+def redact(text):
+    """Text with the values of SECRET_ENV_VARS hidden."""
+    for name in SECRET_ENV_VARS:
+        secret = os.getenv(name)
+        if secret:
+            text = text.replace(secret, "<HIDDEN>")
+    return text
+
+
+def remaining():
+    """Seconds left of the current request's budget, or None outside a request."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def set_deadline(seconds):
+    """Start a time budget for this thread's upstream calls; None clears it."""
+    _deadline.set(None if seconds is None else time.monotonic() + seconds)
+    _stale_age.set(None)
+
+
+def stale_age():
+    """Age in seconds of the oldest stale response served to this request, if any."""
+    return _stale_age.get()
+
+
+def _is_failure(error):
+    """Whether an exception means the upstream is unhealthy, as opposed to a bad request."""
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code >= 500
+    return isinstance(error, requests.RequestException)
+
+
+class CircuitBreaker:
+    def __init__(self, failures=BREAKER_FAILURES, reset_after=BREAKER_RESET):
+        self.threshold = failures
+        self.reset_after = reset_after
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go out. While open, lets one trial call through per reset period."""
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            now = time.monotonic()
+            if now - self.opened_at >= self.reset_after:
+                self.state = 'half_open'
+                self.opened_at = now
+                return True
+            return False
+
+    def retry_after(self):
+        return max(0.0, self.opened_at + self.reset_after - time.monotonic())
+
+    def success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+
+    def failure(self):
+        """Record a failed call. Returns True if this opened the breaker."""
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or (self.state == 'closed' and self.failures >= self.threshold):
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+
+class Connector:
+    """
+    Breaker, stale copies, hedging and deadlines for one upstream. Callers
+    pass a send(timeout) function that makes the actual HTTP call, so each
+    keeps its own session, headers and response handling.
+    """
+
+    def __init__(self, name, timeout=30, hedge_after=None):
+        self.name = name
+        self.timeout = timeout
+        self.hedge_after = hedge_after
+        self.breaker = CircuitBreaker()
+        self.stale = TTLCache(STALE_TTL, maxsize=STALE_CACHE_SIZE)
+
+    def call(self, send, idempotent=False, key=None, timeout=None, hedge_permit=None):
+        """
+        send(timeout) with this upstream's protections. Idempotent calls are
+        hedged unless hedge_permit() returns False when the hedge is due;
+        calls with a key have their last good response kept and served when
+        the upstream is down. Raises CircuitOpen or DeadlineExceeded without
+        calling send.
+        """
+        if not self.breaker.allow():
+            stale = self._stale(key)
+            if stale is not None:
+                return stale
+            raise CircuitOpen(self.name, self.breaker.retry_after())
+
+        timeout = timeout or self.timeout
+        left = remaining()
+        budget_limited = left is not None and left < timeout
+        if budget_limited:
+            if left <= 0:
+                raise DeadlineExceeded(f"No time left to call {self.name}")
+            timeout = left
+
+        try:
+            if idempotent and self.hedge_after and self.hedge_after < timeout:
+                response = self._hedged(send, timeout, hedge_permit)
+            else:
+                response = send(timeout)
+        except requests.RequestException as e:
+            if budget_limited and isinstance(e, requests.Timeout):
+                # Running out of our own budget says nothing about the upstream
+                raise
+            if not _is_failure(e):
+                self.breaker.success()
+                raise
+            self._failed()
+            stale = self._stale(key)
+            if stale is not None:
+                return stale
+            raise
+
+        if getattr(response, 'status_code', 200) >= 500:
+            self._failed()
+            stale = self._stale(key)
+            if stale is not None:
+                return stale
+        else:
+            if self.breaker.state != 'closed':
+                circuit_open.set(0, upstream=self.name)
+            self.breaker.success()
+            if key is not None and getattr(response, 'status_code', 200) == 200:
+                self.stale.set(key, (response, time.time()))
+        return response
+
+    def _failed(self):
+        if self.breaker.failure():
+            circuit_open.set(1, upstream=self.name)
+
+    def _stale(self, key):
+        entry = self.stale.get(key) if key is not None else None
+        if entry is None:
+            return None
+        response, stored_at = entry
+        stale_responses.inc(upstream=self.name)
+        age = time.time() - stored_at
+        _stale_age.set(max(age, _stale_age.get() or 0))
+        return response
+
+    def _hedged(self, send, timeout, permit=None):
+        deadline = time.monotonic() + timeout
+        first = _in_thread(send, timeout, name=f"upstream-{self.name}")
+        done, _ = wait([first], timeout=self.hedge_after)
+        if done or (permit is not None and not permit()):
+            return first.result()
+        hedged_requests.inc(upstream=self.name)
+        pending = {first, _hedges.submit(self._hedge, send, first, deadline)}
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(deadline - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+            if not done:
+                raise requests.Timeout(f"{self.name} did not answer within {timeout:.0f}s")
+            for future in done:
+                try:
+                    response = future.result()
+                except requests.RequestException as e:
+                    error = e
+                    continue
+                if response is not None:
+                    return response
+        raise error
+
+    @staticmethod
+    def _hedge(send, first, deadline):
+        """The second request, unless the first finished or no time is left by the time a worker is free."""
+        left = deadline - time.monotonic()
+        if first.done() or left < 0.1:
+            return None
+        return send(left)
+
+
+def _in_thread(fn, *args, name=None):
+    """Run fn(*args) on a new daemon thread; returns its Future."""
+    future = Future()
+
+    def run():
+        if future.set_running_or_notify_cancel():
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+    threading.Thread(target=run, name=name, daemon=True).start()
+    return future
+
+
+_connectors = {}
+_connectors_lock = threading.Lock()
+
+
+def _setting(name, setting, default):
+    value = os.getenv(f"{name.upper()}_{setting}")
+    return default if value is None else (float(value) or None)
+
+
+def get(name):
+    """The shared Connector of an upstream, created on first use."""
+    with _connectors_lock:
+        connector = _connectors.get(name)
+        if connector is None:
+            timeout, hedge_after = UPSTREAMS.get(name, (30, None))
+            connector = _connectors[name] = Connector(name, _setting(name, 'TIMEOUT', timeout),
+                                                      _setting(name, 'HEDGE_AFTER', hedge_after))
+        return connector
+
+
+def init_app(app):
+    """Give each request its time budget and mark responses built from stale upstream data."""
+
+    @app.before_request
+    def _start_deadline():
+        budget = REQUEST_DEADLINE
+        try:
+            budget = min(budget, max(float(request.headers.get('X-Request-Timeout', budget)), 0))
+        except ValueError:
+            pass
+        set_deadline(budget)
+
+    @app.after_request
+    def _mark_stale(response):
+        age = stale_age()
+        if age is not None:
+            response.headers['Warning'] = '110 - "Response is Stale"'
+            response.headers['X-Upstream-Stale-Age'] = str(int(age))
+        return response
+
+    @app.teardown_request
+    def _clear_deadline(error=None):
+        set_deadline(None)
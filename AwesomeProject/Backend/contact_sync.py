@@ -0,0 +1,94 @@
+# Incremental load of the CA District Attorney contact list into SQLite
+# Shared by main.py (the Contact model's table) and the DA contacts app's
+# create_db.py / contact_info.py scripts. Rows are matched by county and only
+# the differences are written, in a single transaction, so readers never see
+# a half-built table.
+
+import csv
+import logging
+
+
+# Column names as in the DA app's table; SQLite matches them case-insensitively
+# against the Contact model's columns
+COLUMNS = ('County', 'Name', 'Address', 'Phone', 'Fax', 'Link_to_Website')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contact(County TEXT, Name TEXT, Address TEXT, Phone TEXT, Fax TEXT, Link_to_Website TEXT);
+CREATE INDEX IF NOT EXISTS idx_contact_county ON contact(County);
+"""
+
+
+def _clean(value):
+    if isinstance(value, str):
+        value = value.strip()
+    return value if value != '' else None
+
+
+def _rows(records):
+    for record in records:
+        row = tuple(_clean(value) for value in record[:len(COLUMNS)])
+        row += (None,) * (len(COLUMNS) - len(row))
+        if row[0]:
+            yield row
+
+
+def read_contacts(path):
+    """Contact rows from an .xlsx sheet (streamed, read-only) or a .csv file, header skipped."""
+    if path.endswith('.xlsx'):
+        import openpyxl
+        workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            records = workbook.active.iter_rows(min_row=2, values_only=True)
+            return list(_rows(records))
+        finally:
+            workbook.close()
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        return list(_rows(reader))
+
+
+def sync_contacts(con, rows, prune=True):
+    """
+    Make the contact table match `rows`, keyed by county. With prune=False,
+    counties missing from `rows` are left alone. Returns the number of rows
+    inserted, updated and deleted.
+    """
+    con.executescript(SCHEMA)
+    wanted = {}
+    for row in rows:
+        if row[0] in wanted:
+            logging.warning(f"Duplicate contact row for county {row[0]}, keeping the last one")
+        wanted[row[0]] = row
+
+    columns = ', '.join(COLUMNS)
+    changes = {'inserted': 0, 'updated': 0, 'deleted': 0}
+    con.execute('BEGIN IMMEDIATE')
+    try:
+        existing = {}
+        duplicates = []
+        for rowid, *values in con.execute(f"SELECT rowid, {columns} FROM contact ORDER BY rowid"):
+            if values[0] in existing:
+                duplicates.append(rowid)
+            else:
+                existing[values[0]] = (rowid, tuple(values))
+
+        for county, row in wanted.items():
+            current = existing.pop(county, None)
+            if current is None:
+                con.execute(f"INSERT INTO contact ({columns}) VALUES ({', '.join('?' * len(COLUMNS))})", row)
+                changes['inserted'] += 1
+            elif current[1] != row:
+                assignments = ', '.join(f"{column} = ?" for column in COLUMNS[1:])
+                con.execute(f"UPDATE contact SET {assignments} WHERE rowid = ?", row[1:] + (current[0],))
+                changes['updated'] += 1
+
+        if prune:
+            stale = [rowid for rowid, _ in existing.values()] + duplicates
+            con.executemany("DELETE FROM contact WHERE rowid = ?", [(rowid,) for rowid in stale])
+            changes['deleted'] = len(stale)
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    return changes
@@ -0,0 +1,236 @@
+# Normalized local copy of openFDA 510(k), enforcement and MAUDE records
+# Every openFDA device record repeats an `openfda` blob describing its product
+# code (device name, class, regulation number and the full list of
+# registration numbers). Here that blob is stored once per product code in
+# dimension tables with integer surrogate keys, and the records themselves are
+# kept as narrow fact rows that join on product_code_id, so "all activity for
+# product code X" is an indexed lookup.
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from local_db import LocalDB, INDEX_DB_PATH
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS product_code_dim (
+    product_code_id INTEGER PRIMARY KEY,
+    product_code TEXT NOT NULL UNIQUE,
+    device_name TEXT,
+    device_class TEXT,
+    regulation_number TEXT,
+    medical_specialty TEXT
+);
+CREATE TABLE IF NOT EXISTS registration_dim (
+    registration_id INTEGER PRIMARY KEY,
+    registration_number TEXT NOT NULL UNIQUE,
+    fei_number TEXT
+);
+CREATE TABLE IF NOT EXISTS product_registration (
+    product_code_id INTEGER NOT NULL,
+    registration_id INTEGER NOT NULL,
+    PRIMARY KEY (product_code_id, registration_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS k510_fact (
+    k_number TEXT PRIMARY KEY,
+    product_code_id INTEGER,
+    decision_date INTEGER,
+    decision_code TEXT,
+    clearance_type TEXT,
+    applicant TEXT,
+    device_name TEXT
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_k510_fact_product ON k510_fact (product_code_id, decision_date);
+CREATE TABLE IF NOT EXISTS enforcement_fact (
+    recall_number TEXT PRIMARY KEY,
+    product_code_id INTEGER,
+    report_date INTEGER,
+    classification TEXT,
+    status TEXT,
+    recalling_firm TEXT,
+    product_description TEXT
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_enforcement_fact_product ON enforcement_fact (product_code_id, report_date);
+CREATE TABLE IF NOT EXISTS maude_fact (
+    mdr_report_key TEXT NOT NULL,
+    product_code_id INTEGER NOT NULL,
+    date_received INTEGER,
+    event_type TEXT,
+    report_number TEXT,
+    brand_name TEXT,
+    manufacturer_name TEXT,
+    PRIMARY KEY (mdr_report_key, product_code_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_maude_fact_product ON maude_fact (product_code_id, date_received);
+"""
+
+
+def _date(value):
+    """'20140620' or '2014-06-20' -> 20140620, None if missing."""
+    digits = (value or '').replace('-', '')
+    return int(digits) if len(digits) == 8 and digits.isdigit() else None
+
+
+def _iso(value):
+    return f"{value // 10000:04d}-{value // 100 % 100:02d}-{value % 100:02d}" if value else None
+
+
+class DeviceFacts:
+    """
+    Product-code and registration dimensions plus 510(k), enforcement and
+    MAUDE fact tables in the local index database. Surrogate keys are cached
+    in memory once seen; they never change once assigned.
+    """
+
+    def __init__(self, path=INDEX_DB_PATH):
+        self.db = LocalDB(path)
+        self.db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._product_ids = {}    # product code -> product_code_id
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="device-facts")
+
+    def _product_code_ids(self, con, products):
+        """
+        Surrogate keys for {product code: openfda blob or None}, adding new
+        codes to the dimension tables along with their registrations.
+        """
+        with self._lock:
+            missing = [code for code in products if code not in self._product_ids]
+        found = {}
+        if missing:
+            con.executemany(
+                'INSERT INTO product_code_dim (product_code, device_name, device_class, regulation_number, '
+                'medical_specialty) VALUES (?, ?, ?, ?, ?) ON CONFLICT (product_code) DO UPDATE SET '
+                'device_name = coalesce(excluded.device_name, device_name), '
+                'device_class = coalesce(excluded.device_class, device_class), '
+                'regulation_number = coalesce(excluded.regulation_number, regulation_number), '
+                'medical_specialty = coalesce(excluded.medical_specialty, medical_specialty)',
+                [(code, blob.get('device_name'), blob.get('device_class'), blob.get('regulation_number'),
+                  blob.get('medical_specialty_description'))
+                 for code, blob in ((code, products[code] or {}) for code in missing)])
+            for chunk in range(0, len(missing), 500):
+                part = missing[chunk:chunk + 500]
+                found.update(con.execute(
+                    f"SELECT product_code, product_code_id FROM product_code_dim "
+                    f"WHERE product_code IN ({', '.join('?' * len(part))})", part).fetchall())
+            # Codes seen without a blob are looked up again until one arrives
+            with self._lock:
+                self._product_ids.update((code, found[code]) for code in missing if products[code])
+
+            # Registration lists are only read for codes new to this process;
+            # they are by far the largest part of each blob
+            for code in missing:
+                blob = products[code] or {}
+                numbers = blob.get('registration_number') or []
+                fei_numbers = blob.get('fei_number') or []
+                if not numbers:
+                    continue
+                pairs = list(zip(numbers, fei_numbers + [None] * (len(numbers) - len(fei_numbers))))
+                con.executemany('INSERT OR IGNORE INTO registration_dim (registration_number, fei_number) '
+                                'VALUES (?, ?)', pairs)
+                con.executemany(
+                    'INSERT OR IGNORE INTO product_registration (product_code_id, registration_id) '
+                    'SELECT ?, registration_id FROM registration_dim WHERE registration_number = ?',
+                    [(found[code], number) for number, _ in pairs])
+        with self._lock:
+            return {code: found.get(code) or self._product_ids[code] for code in products}
+
+    def add(self, kind, records):
+        """Store openFDA records of kind 'k510', 'recall' or 'maude', replacing earlier copies."""
+        products = {}
+        rows = []
+        if kind == 'maude':
+            for record in records:
+                for device in record.get('device') or []:
+                    code = device.get('device_report_product_code')
+                    if code and record.get('mdr_report_key'):
+                        products[code] = products.get(code) or device.get('openfda')
+                        rows.append((record['mdr_report_key'], code, _date(record.get('date_received')),
+                                     record.get('event_type'), record.get('report_number'),
+                                     device.get('brand_name'), device.get('manufacturer_d_name')))
+        else:
+            key_field = 'k_number' if kind == 'k510' else 'recall_number'
+            for record in records:
+                if not record.get(key_field):
+                    continue
+                code = record.get('product_code') or None
+                if code:
+                    products[code] = products.get(code) or record.get('openfda')
+                if kind == 'k510':
+                    rows.append((record['k_number'], code, _date(record.get('decision_date')),
+                                 record.get('decision_code'), record.get('clearance_type'),
+                                 record.get('applicant'), record.get('device_name')))
+                else:
+                    rows.append((record['recall_number'], code, _date(record.get('report_date')),
+                                 record.get('classification'), record.get('status'),
+                                 record.get('recalling_firm'), record.get('product_description')))
+        if not rows:
+            return 0
+
+        con = self.db.connection()
+        with con:
+            ids = self._product_code_ids(con, products)
+            rows = [(row[0], ids.get(row[1])) + row[2:] for row in rows]
+            if kind == 'k510':
+                con.executemany('INSERT OR REPLACE INTO k510_fact VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            elif kind == 'recall':
+                con.executemany('INSERT OR REPLACE INTO enforcement_fact VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            else:
+                con.executemany('INSERT OR REPLACE INTO maude_fact VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+        return len(rows)
+
+    def add_later(self, kind, records):
+        """Queue records seen in an upstream response without delaying the request."""
+        if records:
+            self._executor.submit(self._add_quietly, kind, records)
+
+    def _add_quietly(self, kind, records):
+        try:
+            self.add(kind, records)
+        except Exception as e:
+            logging.error(f"Error storing {kind} records: {e}")
+
+    def activity(self, product_code, limit=50):
+        """
+        The product code's dimension row and its most recent 510(k)
+        clearances, recalls and MAUDE reports, or None for an unknown code.
+        """
+        con = self.db.connection()
+        product = con.execute(
+            'SELECT p.*, (SELECT count(*) FROM product_registration r WHERE r.product_code_id = p.product_code_id) '
+            'AS registrations FROM product_code_dim p WHERE p.product_code = ?', (product_code,)).fetchone()
+        if product is None:
+            return None
+        product_id = product['product_code_id']
+
+        def rows(sql, date_column):
+            out = []
+            for row in con.execute(sql, (product_id, limit)):
+                row = dict(row)
+                row[date_column] = _iso(row[date_column])
+                out.append(row)
+            return out
+
+        def count(table):
+            return con.execute(f'SELECT count(*) FROM {table} WHERE product_code_id = ?', (product_id,)).fetchone()[0]
+
+        return {
+            "productCode": product['product_code'],
+            "deviceName": product['device_name'],
+            "deviceClass": product['device_class'],
+            "regulationNumber": product['regulation_number'],
+            "medicalSpecialty": product['medical_specialty'],
+            "registrations": product['registrations'],
+            "counts": {"k510": count('k510_fact'), "recalls": count('enforcement_fact'),
+                       "maude": count('maude_fact')},
+            "k510": rows('SELECT k_number, decision_date, decision_code, clearance_type, applicant, device_name '
+                         'FROM k510_fact WHERE product_code_id = ? ORDER BY decision_date DESC LIMIT ?',
+                         'decision_date'),
+            "recalls": rows('SELECT recall_number, report_date, classification, status, recalling_firm, '
+                            'product_description FROM enforcement_fact WHERE product_code_id = ? '
+                            'ORDER BY report_date DESC LIMIT ?', 'report_date'),
+            "maude": rows('SELECT mdr_report_key, date_received, event_type, report_number, brand_name, '
+                          'manufacturer_name FROM maude_fact WHERE product_code_id = ? '
+                          'ORDER BY date_received DESC LIMIT ?', 'date_received'),
+        }
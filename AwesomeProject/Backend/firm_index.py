@@ -0,0 +1,338 @@
+# Firm-name entity resolution shared across data sources
+# recalling_firm (openFDA enforcement), applicant (510k), LegalName (warning
+# letters) and business_name (licenses, SOS entities) are canonicalized and
+# clustered onto one firm ID, with MinHash LSH over character trigrams used to
+# find near-duplicate spellings without scanning every known name.
+
+import functools
+import logging
+import re
+import threading
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+
+from local_db import LocalDB, INDEX_DB_PATH
+
+
+# Trailing legal-form words that do not identify a firm
+LEGAL_SUFFIXES = {
+    "inc", "incorporated", "corp", "corporation", "co", "company", "cos", "llc", "lc", "ltd", "limited",
+    "lp", "llp", "pllc", "plc", "pc", "gmbh", "ag", "kg", "sa", "sas", "sarl", "srl", "spa", "bv", "nv",
+    "ab", "as", "oy", "pty", "kk", "sl", "sro", "se", "ulc"
+}
+
+TOKEN_SYNONYMS = {
+    "intl": "international",
+    "int": "international",
+    "mfg": "manufacturing",
+    "mfr": "manufacturing",
+    "labs": "laboratories",
+    "lab": "laboratory",
+    "tech": "technology",
+    "techs": "technologies",
+    "med": "medical",
+    "assoc": "associates",
+    "svcs": "services",
+    "sys": "systems",
+    "ctr": "center",
+    "usa": "us",
+}
+
+# Canonical keys that belong to another firm (subsidiaries filed under the parent)
+KNOWN_ALIASES = {"medtronic minimed": "medtronic"}
+
+NUM_PERM = 32
+BANDS = 8
+ROWS_PER_BAND = NUM_PERM // BANDS
+MERSENNE_PRIME = (1 << 31) - 1
+# Candidates taken from any one LSH bucket; very common buckets only add noise
+MAX_BUCKET_CANDIDATES = 64
+# MinHash estimates from 32 permutations are noisy, so candidates this far
+# below the threshold still get an exact trigram comparison
+ESTIMATE_SLACK = 0.2
+VERIFY_CANDIDATES = 8
+
+
+
+# numpy is imported on first use so that importing this module stays cheap
+@functools.lru_cache(maxsize=None)
+def _hash_params():
+    """Permutation and band-mixing constants, drawn once from a fixed seed."""
+    import numpy as np
+    rng = np.random.RandomState(20240501)
+    perm_a = rng.randint(1, MERSENNE_PRIME, size=NUM_PERM).astype(np.uint64)
+    perm_b = rng.randint(0, MERSENNE_PRIME, size=NUM_PERM).astype(np.uint64)
+    band_mix = rng.randint(1, 1 << 31, size=ROWS_PER_BAND).astype(np.uint64)
+    return perm_a, perm_b, band_mix
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS firm (
+    firm_id INTEGER PRIMARY KEY,
+    canonical_name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS firm_alias (
+    source TEXT NOT NULL,
+    raw_name TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    firm_id INTEGER NOT NULL,
+    PRIMARY KEY (source, raw_name)
+);
+CREATE INDEX IF NOT EXISTS idx_firm_alias_firm ON firm_alias (firm_id);
+CREATE INDEX IF NOT EXISTS idx_firm_alias_key ON firm_alias (name_key);
+"""
+
+
+def canonical_tokens(name):
+    """Lowercased ASCII tokens of a firm name with legal suffixes and trade-name tails removed."""
+    text = unicodedata.normalize('NFKD', name or '').encode('ascii', 'ignore').decode('ascii').lower()
+    text = re.sub(r"[.']", '', text)  # "Inc." -> "inc", "L.L.C." -> "llc"
+    text = re.split(r'\b(?:d/?b/?a|aka|fka)\b', text)[0]
+    text = text.replace('&', ' and ')
+    tokens = [TOKEN_SYNONYMS.get(token, token) for token in re.findall(r'[a-z0-9]+', text)]
+    while len(tokens) > 1 and (tokens[-1] in LEGAL_SUFFIXES or tokens[-1] == 'and'):
+        tokens.pop()
+    if len(tokens) > 1 and tokens[0] == 'the':
+        tokens = tokens[1:]
+    return tokens
+
+
+def canonical_key(name):
+    key = ' '.join(canonical_tokens(name))
+    return KNOWN_ALIASES.get(key, key)
+
+
+def minhash_signatures(keys):
+    """
+    MinHash signatures (len(keys) x NUM_PERM, uint32) over the character
+    trigrams of each key, computed for the whole batch at once.
+    """
+    import numpy as np
+    if not keys:
+        return np.empty((0, NUM_PERM), dtype=np.uint32)
+    padded = [f" {key} ".encode('ascii', 'ignore') for key in keys]
+    lengths = np.fromiter((len(p) for p in padded), dtype=np.int64, count=len(padded))
+    buf = np.frombuffer(b''.join(padded), dtype=np.uint8).astype(np.uint64)
+    codes = (buf[:-2] << np.uint64(16)) | (buf[1:-1] << np.uint64(8)) | buf[2:]
+
+    # Keep only trigrams that start and end inside the same key
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    valid = np.ones(len(codes), dtype=bool)
+    ends = starts + lengths
+    for offset in (1, 2):
+        cut = ends - offset
+        valid[cut[(cut >= 0) & (cut < len(codes))]] = False
+    codes = codes[valid]
+    gram_starts = starts - 2 * np.arange(len(keys))
+
+    perm_a, perm_b, _ = _hash_params()
+    signatures = np.empty((len(keys), NUM_PERM), dtype=np.uint32)
+    for i in range(NUM_PERM):
+        hashed = (perm_a[i] * codes + perm_b[i]) % np.uint64(MERSENNE_PRIME)
+        signatures[:, i] = np.minimum.reduceat(hashed, gram_starts)
+    return signatures
+
+
+def band_hashes(signatures):
+    """One 64-bit bucket key per LSH band, tagged with the band number."""
+    import numpy as np
+    rows = signatures.reshape(len(signatures), BANDS, ROWS_PER_BAND).astype(np.uint64)
+    mixed = (rows * _hash_params()[2]).sum(axis=2, dtype=np.uint64)
+    return (mixed << np.uint64(3)) | np.arange(BANDS, dtype=np.uint64)
+
+
+def _trigrams(key):
+    padded = f" {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _digits(key):
+    return frozenset(token for token in key.split() if token.isdigit())
+
+
+class FirmIndex:
+    """
+    In-memory blocking index from canonical firm names to firm IDs, persisted
+    as firm/firm_alias tables so other local tables can join on firm_id.
+    Pass path=None for a purely in-memory index. The persisted tables are
+    loaded before the first add or lookup, so a name seen early never gets a
+    second firm ID.
+    """
+
+    def __init__(self, path=INDEX_DB_PATH, threshold=0.7):
+        self.threshold = threshold
+        self.db = LocalDB(path) if path else None
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="firm-index")
+        self._key_ids = {}      # canonical key -> key id
+        self._keys = []         # key id -> canonical key
+        self._key_firm = []     # key id -> firm id
+        self._firm_names = {}   # firm id -> canonical name
+        self._buckets = {}      # band hash -> key id or list of key ids
+        self._signatures = None  # key id -> MinHash signature, allocated on first insert
+        self._loaded = not self.db
+        if self.db:
+            self.db.executescript(SCHEMA)
+
+    def __len__(self):
+        return len(self._firm_names)
+
+    def _store_keys(self, keys, signatures, firm_ids):
+        if not keys:
+            return
+        import numpy as np
+        start = len(self._keys)
+        needed = start + len(keys)
+        capacity = 0 if self._signatures is None else len(self._signatures)
+        if needed > capacity:
+            grown = np.empty((max(needed, 2 * capacity, 1024), NUM_PERM), dtype=np.uint32)
+            if start:
+                grown[:start] = self._signatures[:start]
+            self._signatures = grown
+        self._signatures[start:needed] = signatures
+        for offset, (key, firm_id) in enumerate(zip(keys, firm_ids)):
+            self._key_ids[key] = start + offset
+        self._keys.extend(keys)
+        self._key_firm.extend(firm_ids)
+
+    def _bucket_add(self, band_keys, key_id):
+        for band_key in band_keys:
+            bucket = self._buckets.get(band_key)
+            if bucket is None:
+                self._buckets[band_key] = key_id
+            elif isinstance(bucket, list):
+                bucket.append(key_id)
+            else:
+                self._buckets[band_key] = [bucket, key_id]
+
+    def _best_match(self, key, signature, band_keys):
+        candidates = set()
+        for band_key in band_keys:
+            bucket = self._buckets.get(band_key)
+            if bucket is None:
+                continue
+            if isinstance(bucket, list):
+                candidates.update(bucket[-MAX_BUCKET_CANDIDATES:])
+            else:
+                candidates.add(bucket)
+        if not candidates:
+            return None
+        import numpy as np
+        candidates = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        # Rank by estimated similarity, then confirm the best few exactly
+        estimate = (self._signatures[candidates] == signature).mean(axis=1)
+        grams = _trigrams(key)
+        digits = _digits(key)
+        best_firm, best_similarity = None, self.threshold
+        for position in np.argsort(-estimate)[:VERIFY_CANDIDATES]:
+            if estimate[position] < self.threshold - ESTIMATE_SLACK:
+                break
+            other = self._keys[int(candidates[position])]
+            # "Acme Medical 1" and "Acme Medical 2" are different firms
+            if _digits(other) != digits:
+                continue
+            other_grams = _trigrams(other)
+            similarity = len(grams & other_grams) / len(grams | other_grams)
+            if similarity >= best_similarity:
+                best_firm, best_similarity = self._key_firm[int(candidates[position])], similarity
+        return best_firm
+
+    def _new_firm(self, con, key):
+        if con is not None:
+            firm_id = con.execute("INSERT INTO firm (canonical_name) VALUES (?)", (key,)).lastrowid
+        else:
+            firm_id = len(self._firm_names) + 1
+        self._firm_names[firm_id] = key
+        return firm_id
+
+    def add_many(self, names, source):
+        """Resolve names from one source onto firm IDs, creating firms as needed."""
+        names = [name for name in names if name]
+        keys = [canonical_key(name) for name in names]
+        con = self.db.connection() if self.db else None
+        with self._lock:
+            self._ensure_loaded()
+            new_keys = list(dict.fromkeys(key for key in keys if key and key not in self._key_ids))
+            signatures = minhash_signatures(new_keys)
+            bands = band_hashes(signatures).tolist()
+            try:
+                for i, key in enumerate(new_keys):
+                    firm_id = self._best_match(key, signatures[i], bands[i])
+                    if firm_id is None:
+                        firm_id = self._new_firm(con, key)
+                    self._store_keys([key], signatures[i:i + 1], [firm_id])
+                    self._bucket_add(bands[i], len(self._keys) - 1)
+                firm_ids = [self._key_firm[self._key_ids[key]] if key else None for key in keys]
+
+                if con is not None:
+                    con.executemany("INSERT OR IGNORE INTO firm_alias (source, raw_name, name_key, firm_id) "
+                                    "VALUES (?, ?, ?, ?)",
+                                    [(source, name, key, firm_id)
+                                     for name, key, firm_id in zip(names, keys, firm_ids) if firm_id])
+                    con.commit()
+            except Exception:
+                if con is not None:
+                    con.rollback()
+                raise
+        return firm_ids
+
+    def add(self, name, source):
+        return self.add_many([name], source)[0]
+
+    def add_many_later(self, names, source):
+        """Queue names seen in an upstream response without delaying the request."""
+        names = [name for name in names if name]
+        if names:
+            self._executor.submit(self._add_quietly, names, source)
+
+    def _add_quietly(self, names, source):
+        try:
+            self.add_many(names, source)
+        except Exception as e:
+            logging.error(f"Error indexing firm names from {source}: {e}")
+
+    def resolve(self, name):
+        """Firm ID for a name without adding it, or None if no known firm is close enough."""
+        key = canonical_key(name)
+        if not key:
+            return None
+        with self._lock:
+            self._ensure_loaded()
+            if key in self._key_ids:
+                return self._key_firm[self._key_ids[key]]
+            signature = minhash_signatures([key])
+            return self._best_match(key, signature[0], band_hashes(signature)[0].tolist())
+
+    def canonical_name(self, firm_id):
+        return self._firm_names.get(firm_id)
+
+    def aliases(self, firm_id):
+        """Raw names of a firm grouped by source."""
+        grouped = {}
+        if self.db:
+            for row in self.db.execute("SELECT source, raw_name FROM firm_alias WHERE firm_id = ? "
+                                       "ORDER BY source, raw_name", (firm_id,)):
+                grouped.setdefault(row['source'], []).append(row['raw_name'])
+        return grouped
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def load(self):
+        """Rebuild the in-memory index from the persisted firm and alias tables."""
+        if not self.db:
+            return 0
+        with self._lock:
+            self._loaded = True
+            for row in self.db.execute("SELECT firm_id, canonical_name FROM firm"):
+                self._firm_names[row['firm_id']] = row['canonical_name']
+            rows = self.db.execute("SELECT DISTINCT name_key, firm_id FROM firm_alias").fetchall()
+            rows = [row for row in rows if row['name_key'] not in self._key_ids]
+            keys = [row['name_key'] for row in rows]
+            signatures = minhash_signatures(keys)
+            start = len(self._keys)
+            self._store_keys(keys, signatures, [row['firm_id'] for row in rows])
+            for offset, band_keys in enumerate(band_hashes(signatures).tolist()):
+                self._bucket_add(band_keys, start + offset)
+        logging.info(f"Firm index loaded {len(keys)} names for {len(self._firm_names)} firms")
+        return len(keys)
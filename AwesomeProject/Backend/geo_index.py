@@ -0,0 +1,173 @@
+# Offline geocoding and proximity search for licenses and DA contacts
+# Rows are placed at the centroid of their ZIP code, taken from a table loaded
+# from ZIP_CENTROIDS_PATH: either a zip,lat,lon CSV or the Census ZCTA
+# Gazetteer file as published (tab-separated GEOID ... INTPTLAT INTPTLONG),
+#   https://www.census.gov/geographies/reference-files/time-series/geo/gazetteer-files.html
+# Coordinates go into latitude/longitude columns of the license and contact
+# tables and into an SQLite R-tree per table, so a radius or nearest query
+# reads only the rows in a bounding box around the origin.
+
+import csv
+import logging
+import math
+import os
+import re
+
+
+ZIP_CENTROIDS_PATH = os.getenv('ZIP_CENTROIDS_PATH', 'zip_centroids.csv')
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE_LAT = 69.0
+# Nearest-neighbour searches widen the box from this radius up to the maximum
+NEAREST_START_MILES = 5
+NEAREST_MAX_MILES = 1000
+
+# table -> (id column, how to find the row's ZIP code)
+TABLES = {
+    'license': ('license_address_id', 'zip'),
+    'contact': ('id', 'address'),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS zip_centroid (
+    zip TEXT PRIMARY KEY,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS geo_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS license_geo USING rtree(id, min_lat, max_lat, min_lon, max_lon);
+CREATE VIRTUAL TABLE IF NOT EXISTS contact_geo USING rtree(id, min_lat, max_lat, min_lon, max_lon);
+"""
+
+_ZIP_AT_END = re.compile(r'\b(\d{5})(?:-\d{4})?\s*$')
+
+
+def read_zip_centroids(path):
+    """{zip: (lat, lon)} from a zip,lat,lon CSV or a Census ZCTA Gazetteer file."""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        header = f.readline()
+        delimiter = '\t' if '\t' in header else ','
+        names = [name.strip().lower() for name in header.split(delimiter)]
+        zip_col = names.index('geoid') if 'geoid' in names else names.index('zip')
+        lat_col = names.index('intptlat') if 'intptlat' in names else names.index('lat')
+        lon_col = names.index('intptlong') if 'intptlong' in names else names.index('lon')
+        centroids = {}
+        for row in csv.reader(f, delimiter=delimiter):
+            try:
+                centroids[row[zip_col].strip().zfill(5)] = (float(row[lat_col]), float(row[lon_col]))
+            except (IndexError, ValueError):
+                continue
+    return centroids
+
+
+def zip_of(table, value):
+    """Five-digit ZIP code of a license zip column or a contact address."""
+    value = (value or '').strip()
+    if table == 'contact':
+        match = _ZIP_AT_END.search(value)
+        return match.group(1) if match else None
+    return value[:5] if value[:5].isdigit() else None
+
+
+def haversine_miles(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(a))
+
+
+def _ensure_columns(con, table):
+    """Add latitude/longitude to tables created before they were part of the model."""
+    columns = {row[1] for row in con.execute(f"PRAGMA table_info({table})")}
+    for column in ('latitude', 'longitude'):
+        if column not in columns:
+            con.execute(f"ALTER TABLE {table} ADD COLUMN {column} REAL")
+
+
+def load_zip_centroids(con, path=ZIP_CENTROIDS_PATH):
+    """Load the centroid table if the file changed since the last load. Returns False if there is no file."""
+    if not os.path.exists(path):
+        return False
+    stat = os.stat(path)
+    stamp = f"{stat.st_size}:{stat.st_mtime_ns}"
+    row = con.execute("SELECT value FROM geo_meta WHERE key = 'zip_centroids'").fetchone()
+    if row and row[0] == stamp:
+        return True
+    centroids = read_zip_centroids(path)
+    with con:
+        con.execute("DELETE FROM zip_centroid")
+        con.executemany("INSERT INTO zip_centroid (zip, lat, lon) VALUES (?, ?, ?)",
+                        [(zip_code, lat, lon) for zip_code, (lat, lon) in centroids.items()])
+        con.execute("INSERT OR REPLACE INTO geo_meta (key, value) VALUES ('zip_centroids', ?)", (stamp,))
+        # Positions may have moved; place every row again
+        for table in TABLES:
+            con.execute(f"UPDATE {table} SET latitude = NULL, longitude = NULL")
+            con.execute(f"DELETE FROM {table}_geo")
+    logging.info(f"Loaded {len(centroids)} ZIP centroids from {path}")
+    return True
+
+
+def geocode(con, table, all_rows=False):
+    """
+    Place rows without coordinates (or every row) at their ZIP centroid and
+    add them to the table's R-tree. Only rows whose position changes are
+    written. Returns the number of rows placed.
+    """
+    id_column, zip_column = TABLES[table]
+    where = "" if all_rows else " WHERE latitude IS NULL"
+    rows = con.execute(f"SELECT {id_column}, {zip_column} FROM {table}{where}").fetchall()
+    placed = []
+    for row_id, value in rows:
+        zip_code = zip_of(table, value)
+        centroid = zip_code and con.execute("SELECT lat, lon FROM zip_centroid WHERE zip = ?", (zip_code,)).fetchone()
+        if centroid:
+            placed.append((row_id, centroid[0], centroid[1]))
+    with con:
+        con.executemany(f"UPDATE {table} SET latitude = ?, longitude = ? WHERE {id_column} = ? "
+                        f"AND (latitude IS NOT ? OR longitude IS NOT ?)",
+                        [(lat, lon, row_id, lat, lon) for row_id, lat, lon in placed])
+        con.executemany(f"INSERT OR REPLACE INTO {table}_geo (id, min_lat, max_lat, min_lon, max_lon) "
+                        f"VALUES (?, ?, ?, ?, ?)", [(row_id, lat, lat, lon, lon) for row_id, lat, lon in placed])
+    return len(placed)
+
+
+def init_geo(con, path=ZIP_CENTROIDS_PATH):
+    """Create the geo tables, load the centroids and place any rows not yet placed."""
+    con.executescript(SCHEMA)
+    for table in TABLES:
+        _ensure_columns(con, table)
+    con.commit()
+    if not load_zip_centroids(con, path):
+        logging.warning(f"No ZIP centroid file at {path}; proximity search is unavailable")
+        return {}
+    # The DA list sync rewrites contact addresses in place; with one row per
+    # county, placing them all again is cheap
+    return {table: geocode(con, table, all_rows=(table == 'contact')) for table in TABLES}
+
+
+def zip_centroid(con, zip_code):
+    row = con.execute("SELECT lat, lon FROM zip_centroid WHERE zip = ?", (str(zip_code).strip()[:5],)).fetchone()
+    return (row[0], row[1]) if row else None
+
+
+def within(con, table, lat, lon, radius_miles, limit=None):
+    """[(row id, distance in miles)] within the radius, nearest first."""
+    dlat = radius_miles / MILES_PER_DEGREE_LAT
+    dlon = radius_miles / (MILES_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 0.01))
+    candidates = con.execute(
+        f"SELECT g.id, t.latitude, t.longitude FROM {table}_geo g JOIN {table} t ON t.{TABLES[table][0]} = g.id "
+        f"WHERE g.min_lat <= ? AND g.max_lat >= ? AND g.min_lon <= ? AND g.max_lon >= ?",
+        (lat + dlat, lat - dlat, lon + dlon, lon - dlon)).fetchall()
+    matches = sorted((haversine_miles(lat, lon, row_lat, row_lon), row_id) for row_id, row_lat, row_lon in candidates)
+    return [(row_id, distance) for distance, row_id in matches if distance <= radius_miles][:limit]
+
+
+def nearest(con, table, lat, lon, k=1):
+    """The k nearest rows, widening the search box until k rows are inside the radius."""
+    radius = NEAREST_START_MILES
+    while True:
+        found = within(con, table, lat, lon, radius, k)
+        if len(found) >= k or radius >= NEAREST_MAX_MILES:
+            return found
+        radius *= 2
@@ -0,0 +1,41 @@
+# gunicorn settings for the backend
+#
+#   gunicorn -c gunicorn.conf.py main:app
+#
+# The master always imports main.py before forking, so the schema and data
+# setup at import (license load, contact sync, geo index, sync triggers,
+# expiry rollup) runs exactly once instead of racing in every worker. The
+# workers only open their own connections. Background threads are started in
+# each worker after the fork.
+#
+# The YOLO model is not loaded in the master: inference runs in each worker's
+# process pool, whose processes fork from a forkserver that loads the model
+# once (see inference.py). The pool processes of a worker share that copy
+# copy-on-write, so memory holds one model per worker (WEB_CONCURRENCY
+# copies), not one per pool process. A forkserver is a fresh interpreter and
+# cannot be shared across the workers, and forking the pool straight from a
+# worker that inherited the master's model is unsafe once the worker runs
+# threads. With PRELOAD_MODEL=1 each worker starts its pool, and so loads the
+# model, before its first request instead of on the first image.
+
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', 80)}"
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+preload_app = True
+
+# Threads started in the master would not exist in the forked workers
+os.environ['DEFER_BACKGROUND_TASKS'] = '1'
+
+
+def post_fork(server, worker):
+    import main
+    # Connections opened in the master must not be shared with the workers;
+    # LocalDB connections are reopened per process on their own
+    with main.app.app_context():
+        main.db.engine.dispose()
+    if os.getenv('PRELOAD_MODEL', '').lower() in ('1', 'true', 'yes'):
+        main.inference_service.start()
+    main.start_background_tasks()
@@ -0,0 +1,204 @@
+# Near-duplicate image cache for /predict and /serpapi-upload
+# Uploads are keyed by a 64-bit perceptual hash (pHash by default, or dHash)
+# and looked up by Hamming distance in a BK-tree, so a new photo of a device
+# that was recently photographed reuses the earlier detections or reverse
+# image search instead of running YOLO or paying for another SerpAPI call.
+# Detection boxes are cached as fractions of the image size and scaled to
+# each upload, since a near-duplicate may be a resized copy; annotated images
+# are only reused for an upload of the same size. The cache is per process.
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+PERCEPTUAL_HASH = os.getenv('PERCEPTUAL_HASH', 'phash')
+# Largest Hamming distance (out of 64 bits) still treated as the same picture
+PREDICT_CACHE_MAX_DISTANCE = int(os.getenv('PREDICT_CACHE_MAX_DISTANCE', 4))
+SERPAPI_CACHE_MAX_DISTANCE = int(os.getenv('SERPAPI_CACHE_MAX_DISTANCE', 6))
+PREDICT_CACHE_TTL = int(os.getenv('PREDICT_CACHE_TTL', 24 * 3600))
+SERPAPI_CACHE_TTL = int(os.getenv('SERPAPI_CACHE_TTL', 7 * 86400))
+# Annotated result images are ~200 KB each, reverse-search results far smaller
+PREDICT_CACHE_SIZE = int(os.getenv('PREDICT_CACHE_SIZE', 256))
+SERPAPI_CACHE_SIZE = int(os.getenv('SERPAPI_CACHE_SIZE', 2048))
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def _grayscale(image_bytes, size):
+    import numpy as np
+    import cv2
+    # A 1/8 scale JPEG decode is plenty for a 32x32 thumbnail
+    image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if image is None:
+        raise ValueError("Unsupported or corrupt image")
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def _bits_to_int(bits):
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def phash(image_bytes):
+    """DCT hash: low 8x8 frequencies of a 32x32 thumbnail against their median."""
+    import numpy as np
+    import cv2
+    thumbnail = _grayscale(image_bytes, (32, 32)).astype(np.float32)
+    low = cv2.dct(thumbnail)[:8, :8].flatten()
+    # The DC term only reflects overall brightness
+    return _bits_to_int(low > np.median(low[1:]))
+
+
+def dhash(image_bytes):
+    """Gradient hash: whether each pixel of a 9x8 thumbnail is brighter than its right neighbour."""
+    thumbnail = _grayscale(image_bytes, (9, 8)).astype(int)
+    return _bits_to_int((thumbnail[:, :-1] > thumbnail[:, 1:]).flatten())
+
+
+def perceptual_hash(image_bytes):
+    return dhash(image_bytes) if PERCEPTUAL_HASH == 'dhash' else phash(image_bytes)
+
+
+def image_size(image_bytes):
+    """(width, height) of an upload, read from its header only."""
+    import io
+    from PIL import Image
+    return Image.open(io.BytesIO(image_bytes)).size
+
+
+def normalize_boxes(detections, size):
+    """Detections with their pixel boxes turned into fractions of `size`."""
+    width, height = size
+    return [dict(d, box=[round(v / (width, height)[i % 2], 6) for i, v in enumerate(d["box"])]) for d in detections]
+
+
+def scale_boxes(detections, size):
+    """Detections with fractional boxes turned into pixels of `size`."""
+    width, height = size
+    return [dict(d, box=[round(v * (width, height)[i % 2], 1) for i, v in enumerate(d["box"])]) for d in detections]
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over integer hashes under Hamming distance. Removal
+    only marks a node deleted; the tree is rebuilt once deleted nodes
+    outnumber live ones.
+    """
+
+    def __init__(self):
+        self._root = None      # [hash, {distance: child}]
+        self._live = set()
+        self._deleted = 0
+
+    def __len__(self):
+        return len(self._live)
+
+    def add(self, value):
+        if value in self._live:
+            return
+        was_deleted = self._contains(value)
+        self._live.add(value)
+        if was_deleted:
+            self._deleted -= 1
+            return
+        if self._root is None:
+            self._root = [value, {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = [value, {}]
+                return
+            node = child
+
+    def _contains(self, value):
+        node = self._root
+        while node is not None:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                return True
+            node = node[1].get(distance)
+        return False
+
+    def remove(self, value):
+        if value in self._live:
+            self._live.discard(value)
+            self._deleted += 1
+            if self._deleted > len(self._live):
+                self._rebuild()
+
+    def _rebuild(self):
+        live = list(self._live)
+        self._root, self._live, self._deleted = None, set(), 0
+        for value in live:
+            self.add(value)
+
+    def search(self, value, radius):
+        """Live hashes within `radius` of value, as (distance, hash) sorted nearest first."""
+        found = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius and node[0] in self._live:
+                found.append((distance, node[0]))
+            # Triangle inequality: only children in [d - r, d + r] can match
+            for child_distance, child in node[1].items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        return sorted(found)
+
+
+class PerceptualCache:
+    """
+    Maps perceptual hashes to results. get() returns the result stored for
+    the nearest hash within max_distance. Entries expire after ttl seconds
+    and the least recently used are evicted beyond maxsize.
+    """
+
+    def __init__(self, max_distance, ttl, maxsize):
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()   # hash -> (expires, value)
+        self._tree = BKTree()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _drop(self, image_hash):
+        del self._entries[image_hash]
+        self._tree.remove(image_hash)
+
+    def get(self, image_hash):
+        now = time.time()
+        with self._lock:
+            for _, candidate in self._tree.search(image_hash, self.max_distance):
+                expires, value = self._entries[candidate]
+                if expires <= now:
+                    self._drop(candidate)
+                    continue
+                self._entries.move_to_end(candidate)
+                self.hits += 1
+                return value
+            self.misses += 1
+            return None
+
+    def set(self, image_hash, value):
+        with self._lock:
+            self._entries[image_hash] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(image_hash)
+            self._tree.add(image_hash)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
@@ -0,0 +1,209 @@
+# Vision inference for /predict, run in a separate pool of processes
+# The YOLO model lives in the worker processes, so CPU-heavy inference never
+# holds the web worker's GIL. Submissions beyond the queue bound are refused
+# (the route answers 429) instead of piling up behind each other.
+#
+# The pool workers are started by a forkserver (spawn where there is none),
+# never forked straight from the web worker: by the time /predict runs, the
+# worker has cache, sync and refresh threads, and a fork would copy locks
+# they hold (logging, sqlite, connection pools) into a child that can then
+# deadlock on them. The forkserver loads the model once (model_preload.py)
+# and the pool workers fork from it, sharing the model's pages copy-on-write.
+
+import base64
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+import metrics
+
+
+MODEL_PATH = os.getenv('MODEL_PATH', 'last.pt')
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', 1))
+# Images running or waiting in the pool before new ones are refused
+INFERENCE_QUEUE_SIZE = int(os.getenv('INFERENCE_QUEUE_SIZE', 4))
+INFERENCE_TIMEOUT = float(os.getenv('INFERENCE_TIMEOUT', 60))
+# Longest side the model runs at; uploads are shrunk to this while decoding
+MODEL_INPUT_SIZE = int(os.getenv('MODEL_INPUT_SIZE', 640))
+JPEG_QUALITY = int(os.getenv('RESULT_JPEG_QUALITY', 85))
+INFERENCE_START_METHOD = os.getenv(
+    'INFERENCE_START_METHOD', 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+# Imported once in the forkserver, so the pool workers share their pages;
+# model_preload also loads the model there
+FORKSERVER_PRELOAD = ['inference', 'ultralytics', 'model_preload']
+
+inference_in_flight = metrics.registry.register(metrics.Gauge(
+    'inference_requests_in_flight', 'Images running or queued in the inference pool'))
+inference_rejected = metrics.registry.register(metrics.Counter(
+    'inference_rejected_total', 'Images refused because the inference queue was full or timed out', ('reason',)))
+
+
+class QueueFull(Exception):
+    pass
+
+
+class InferenceTimeout(Exception):
+    pass
+
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def load_model(model_path=MODEL_PATH):
+    """
+    The YOLO model of this process, loaded on first use. The pool workers
+    call it in their initializer and inherit the forkserver's copy.
+    """
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from ultralytics import YOLO
+                _model = YOLO(model_path)
+    return _model
+
+
+def _reduced_decode_flag(width, height, target):
+    """Largest JPEG DCT-domain reduction that keeps the longest side at or above target."""
+    import cv2
+    longest = max(width, height)
+    for factor, flag in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                         (2, cv2.IMREAD_REDUCED_COLOR_2)):
+        if longest // factor >= target:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+def decode_image(image_bytes, target=MODEL_INPUT_SIZE):
+    """
+    Decode an upload straight from its buffer into a BGR array (the channel
+    order YOLO expects) whose longest side is at most `target`. Large JPEGs
+    are decoded at reduced resolution rather than decoded in full and then
+    shrunk. Returns the image and the factor from its pixels back to the
+    original image.
+    """
+    import io
+    import numpy as np
+    import cv2
+    from PIL import Image
+
+    # Only the header is read here; PIL does not decode the pixels
+    width, height = Image.open(io.BytesIO(image_bytes)).size
+    image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), _reduced_decode_flag(width, height, target))
+    if image is None:
+        raise ValueError("Unsupported or corrupt image")
+
+    longest = max(image.shape[:2])
+    if longest > target:
+        ratio = target / longest
+        image = cv2.resize(image, (round(image.shape[1] * ratio), round(image.shape[0] * ratio)),
+                           interpolation=cv2.INTER_AREA)
+    return image, max(width, height) / max(image.shape[:2])
+
+
+def encode_jpeg(image):
+    """JPEG-encode an array in memory and return it as base64 text."""
+    import cv2
+    ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    if not ok:
+        raise ValueError("Could not encode the result image")
+    return base64.b64encode(buffer).decode("utf-8")
+
+
+def detections(result, scale=1.0):
+    """Boxes of one YOLO result in the original image's pixel coordinates."""
+    names = result.names
+    return [{
+        "label": names[int(cls)],
+        "confidence": round(float(conf), 4),
+        "box": [round(float(v) * scale, 1) for v in xyxy],
+    } for xyxy, conf, cls in zip(result.boxes.xyxy.tolist(), result.boxes.conf.tolist(), result.boxes.cls.tolist())]
+
+
+def run_inference(image_bytes, detections_only=False):
+    """
+    Detect objects in an uploaded image. Returns the annotated image as
+    base64 JPEG under 'result', or only the detected boxes.
+    """
+    image, scale = decode_image(image_bytes)
+    result = load_model().predict(source=image, imgsz=MODEL_INPUT_SIZE, verbose=False)[0]
+    if detections_only:
+        return {'detections': detections(result, scale)}
+    return {'result': encode_jpeg(result.plot())}
+
+
+class InferenceService:
+    """
+    Bounded front end to a process pool. The pool is created on first use
+    (or by start()) in the process that uses it, so a preloading server never
+    shares one pool between its workers.
+    """
+
+    def __init__(self, task=run_inference, initializer=load_model, workers=INFERENCE_WORKERS,
+                 queue_size=INFERENCE_QUEUE_SIZE, timeout=INFERENCE_TIMEOUT, start_method=INFERENCE_START_METHOD):
+        self.task = task
+        self.initializer = initializer
+        self.workers = workers
+        self.start_method = start_method
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                context = multiprocessing.get_context(self.start_method)
+                if self.start_method == 'forkserver':
+                    context.set_forkserver_preload(FORKSERVER_PRELOAD)
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                                 initializer=self.initializer)
+                self._pid = os.getpid()
+            return self._pool
+
+    def start(self):
+        """Start the pool workers now, running their initializer, instead of on the first task."""
+        pool = self._executor()
+        for future in [pool.submit(int) for _ in range(self.workers)]:
+            future.result()
+
+    def _release(self, future):
+        self._slots.release()
+        inference_in_flight.dec()
+
+    def submit(self, *args):
+        """Queue a task without waiting for it; raises QueueFull when the queue is at its bound."""
+        if not self._slots.acquire(blocking=False):
+            inference_rejected.inc(reason='queue_full')
+            raise QueueFull()
+        inference_in_flight.inc()
+        try:
+            future = self._executor().submit(self.task, *args)
+        except Exception:
+            self._slots.release()
+            inference_in_flight.dec()
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def predict(self, *args, timeout=None):
+        """Run a task and wait for its result, at most `timeout` seconds."""
+        future = self.submit(*args)
+        try:
+            return future.result(timeout=self.timeout if timeout is None else timeout)
+        except FutureTimeout:
+            # A task that already started keeps its slot until it finishes
+            future.cancel()
+            inference_rejected.inc(reason='timeout')
+            logging.warning("Inference timed out")
+            raise InferenceTimeout()
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,112 @@
+# Expiring-license queries for inspection planning
+# License expiration dates are range-searched through an index on
+# (expiration_date, county_code, license_status_code), which also covers the
+# per-county counts, so neither touches the license rows themselves. The
+# counts for the dashboard windows (licenses expiring in the next 30, 60 and
+# 90 days, by county and status) are kept in license_expiry_rollup and rebuilt
+# when the day or the license data changes.
+
+import logging
+import os
+from datetime import date, datetime, timedelta
+
+
+EXPIRY_WINDOWS = tuple(sorted(int(days) for days in os.getenv('EXPIRY_WINDOWS', '30,60,90').split(',')))
+
+SCHEMA = """
+CREATE INDEX IF NOT EXISTS license_expiration_county_status
+    ON license (expiration_date, county_code, license_status_code);
+CREATE TABLE IF NOT EXISTS license_expiry_rollup (
+    county_code TEXT NOT NULL,
+    license_status_code TEXT NOT NULL,
+    window_days INTEGER NOT NULL,
+    licenses INTEGER NOT NULL,
+    PRIMARY KEY (county_code, license_status_code, window_days)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS license_expiry_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def parse_day(value):
+    """'2025-01-31' -> date; None if missing or malformed."""
+    try:
+        return datetime.strptime((value or '').strip()[:10], '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def window_bounds(days, today=None):
+    """
+    [start, end) datetimes of "expiring in the next `days` days", today and
+    the last day included. Datetimes compare the way the DateTime column is
+    stored, so the bounds work for ORM filters and raw SQL alike. The end
+    stops at date.max, so a window reaching 9999-12-31 ends a day short.
+    """
+    start = today or date.today()
+    end = start + timedelta(days=min(days + 1, (date.max - start).days))
+    return datetime.combine(start, datetime.min.time()), datetime.combine(end, datetime.min.time())
+
+
+def _stored(moment):
+    """A datetime as SQLAlchemy stores it in SQLite."""
+    return moment.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def refresh_rollup(con, stamp, today=None):
+    """
+    Recount the windows if the rollup was built for another day or data
+    version (`stamp`, e.g. the sync change-log version). Returns True if it
+    was rebuilt.
+    """
+    today = today or date.today()
+    stamp = f"{today.isoformat()}:{stamp}"
+    row = con.execute("SELECT value FROM license_expiry_meta WHERE key = 'rollup'").fetchone()
+    if row and row[0] == stamp:
+        return False
+
+    start, _ = window_bounds(0, today)
+    ends = [window_bounds(days, today)[1] for days in EXPIRY_WINDOWS]
+    counts = ", ".join(f"sum(expiration_date < '{_stored(end)}')" for end in ends)
+    rows = con.execute(
+        f"SELECT coalesce(county_code, ''), coalesce(license_status_code, ''), {counts} FROM license "
+        f"WHERE expiration_date >= ? AND expiration_date < ? GROUP BY 1, 2",
+        (_stored(start), _stored(ends[-1]))).fetchall()
+    with con:
+        con.execute("DELETE FROM license_expiry_rollup")
+        con.executemany("INSERT INTO license_expiry_rollup VALUES (?, ?, ?, ?)",
+                        [(county, status, days, n) for county, status, *window_counts in rows
+                         for days, n in zip(EXPIRY_WINDOWS, window_counts) if n])
+        con.execute("INSERT OR REPLACE INTO license_expiry_meta (key, value) VALUES ('rollup', ?)", (stamp,))
+    return True
+
+
+def init_expiry(con, stamp):
+    """Create the index and rollup tables and count the windows."""
+    con.executescript(SCHEMA)
+    con.commit()
+    if refresh_rollup(con, stamp):
+        logging.info(f"License expiry rollup rebuilt for windows {EXPIRY_WINDOWS}")
+
+
+def summary(con, stamp, county=None, status=None, today=None):
+    """
+    {asOf, windows, counties: {county: {days: licenses}}} from the rollup,
+    optionally for one county and/or status.
+    """
+    today = today or date.today()
+    refresh_rollup(con, stamp, today)
+    query = "SELECT county_code, window_days, sum(licenses) FROM license_expiry_rollup WHERE 1 = 1"
+    args = []
+    if county:
+        query += " AND county_code = ?"
+        args.append(county)
+    if status:
+        query += " AND license_status_code = ?"
+        args.append(status)
+    counties = {}
+    for county_code, days, licenses in con.execute(query + " GROUP BY 1, 2", args):
+        counties.setdefault(county_code, dict.fromkeys(map(str, EXPIRY_WINDOWS), 0))[str(days)] = licenses
+    return {"asOf": today.isoformat(), "windows": list(EXPIRY_WINDOWS), "counties": counties}
@@ -0,0 +1,41 @@
+# Shared helper for the backend's local SQLite index files
+# (warning letters and the other locally synced tables)
+
+import os
+import sqlite3
+import threading
+
+
+INDEX_DB_PATH = os.getenv('INDEX_DB_PATH', 'index.db')
+
+
+class LocalDB:
+    """
+    Hands out one SQLite connection per thread for a single database file,
+    so request threads and background sync threads never share a cursor.
+    Connections opened before a fork are not reused by the child.
+    """
+
+    def __init__(self, path=INDEX_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def connection(self):
+        con = getattr(self._local, 'con', None)
+        if con is None or self._local.pid != os.getpid():
+            con = sqlite3.connect(self.path, timeout=30)
+            con.row_factory = sqlite3.Row
+            # WAL lets lookups keep reading while a sync is writing
+            con.execute('PRAGMA journal_mode=WAL')
+            con.execute('PRAGMA synchronous=NORMAL')
+            self._local.con = con
+            self._local.pid = os.getpid()
+        return con
+
+    def execute(self, sql, params=()):
+        return self.connection().execute(sql, params)
+
+    def executescript(self, script):
+        con = self.connection()
+        con.executescript(script)
+        con.commit()
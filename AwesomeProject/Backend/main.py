@@ -3,25 +3,40 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 import requests
 from flask_sqlalchemy import SQLAlchemy
-import sqlite3
 import csv
 import os
-from bs4 import BeautifulSoup
 import re
 from urllib.parse import urljoin
 import time, uuid
-import serpapi
+import threading
+from contextlib import contextmanager
 from flask import send_from_directory, flash, redirect
-from ultralytics import YOLO
-from PIL import Image
-import io
-import numpy as np
-import base64
-import cv2
 import requests as rq
-from datetime import datetime
+from datetime import datetime, timedelta
 from flask_bcrypt import Bcrypt
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
+import metrics
+from metrics import track_upstream, log_payload, CacheStats
+from cache import stale_while_revalidate
+from cache_warming import CacheWarmer
+from chat import IntentMatcher, ConfluenceClient, RasaClient, CONFLUENCE_PAGES
+from firm_index import FirmIndex
+from device_facts import DeviceFacts
+from alerts import SavedSearches
+from autocomplete import Autocomplete, KINDS as AUTOCOMPLETE_KINDS, APP_DB_QUERIES, INDEX_DB_QUERIES, terms_from
+from sync_bundle import SyncBundle, ChangesPruned, current_version
+from contact_sync import read_contacts, sync_contacts
+import geo_index
+import license_expiry
+import openfda
+from rate_limit import RateLimitExceeded
+import singleflight
+import payload
+import connectors
+from inference import InferenceService, QueueFull, InferenceTimeout
+import image_cache
+from image_cache import PerceptualCache, perceptual_hash
+from warning_letters import WarningLetterIndex, dashboard_request_body, dashboard_headers, DASHBOARD_API_URL
 
 
 # define constants
@@ -29,6 +44,17 @@ UPLOAD_FOLDER = "/uploads"
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg"}
 MAX_FILE_TIME = 3 * 86400
 PUBLIC_IP = "api.healthly.dev"
+CONTACTS_SOURCE = os.getenv('CONTACTS_SOURCE', 'info.csv')  # .csv or .xlsx
+
+# Upstream base URLs, overridable so the app can run against local stubs
+CDPH_BASE_URL = os.getenv('CDPH_BASE_URL', 'https://www.cdph.ca.gov')
+BIZFILE_SEARCH_URL = os.getenv('BIZFILE_SEARCH_URL', 'https://bizfileonline.sos.ca.gov/api/Records/businesssearch')
+ELASTICSEARCH_URL = os.getenv('ELASTICSEARCH_URL', 'http://localhost:9200')
+
+# openFDA and warning-letter searches are answered from the last result for up
+# to SEARCH_HARD_TTL seconds, refreshed in the background after SEARCH_SOFT_TTL
+SEARCH_SOFT_TTL = int(os.getenv('SEARCH_SOFT_TTL', 15 * 60))
+SEARCH_HARD_TTL = int(os.getenv('SEARCH_HARD_TTL', 6 * 3600))
 
 # Initialize the Flask application
 app = Flask(__name__)
@@ -37,23 +63,24 @@ CORS(app)
 bcrypt = Bcrypt(app)
 jwt = JWTManager(app)
 
+# Per-route latency, in-flight and payload-size metrics on GET /metrics
+metrics.init_app(app)
+metrics.registry.register_cache('upstream_singleflight', singleflight.flights)
+# ?fields= projection, optional orjson encoding and negotiated compression
+payload.init_app(app)
+# Per-request upstream deadline and stale-response marking (see connectors.py)
+connectors.init_app(app)
+# Counts searches and replays the most frequent ones into the route caches off-peak
+cache_warmer = CacheWarmer()
+cache_warmer.init_app(app)
+
 # set up upload config
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024
 app.config["SECRET_KEY"] = os.getenv('APP_SECRET_KEY')
 
-# Set up logging configuration
-logging.basicConfig(level=logging.INFO)
-def normalize_legal_name(legal_name):
-    known_exceptions = {"medtronic-minimed-inc": "medtronic-inc"}
-    legal_name_key = re.sub(r'[^a-zA-Z0-9\s]', '', legal_name).replace(' ', '-').lower()
-    return known_exceptions.get(legal_name_key, legal_name_key)
-
-def construct_warning_letter_url(case_injunction_id, action_date, legal_name):
-    base_warning_letter_url = "https://www.fda.gov/inspections-compliance-enforcement-and-criminal-investigations/warning-letters"
-    formatted_date = datetime.strptime(action_date, "%Y-%m-%d").strftime("%m%d%Y")
-    normalized_legal_name = normalize_legal_name(legal_name)
-    return f"{base_warning_letter_url}/{normalized_legal_name}-{case_injunction_id}-{formatted_date}"
+# Set up logging configuration (LOG_LEVEL=DEBUG plus LOG_PAYLOADS=1 enables sampled payload logs)
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper())
 
 # SQLAlchemy configuration
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///contact_info.db'
@@ -77,6 +104,9 @@ class Contact(db.Model):
     phone = db.Column(db.String(20))
     fax = db.Column(db.String(20))
     link_to_website = db.Column(db.String(100))
+    # ZIP centroid of the office address (see geo_index.py)
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
 
     def to_dict(self):
         return {
@@ -86,7 +116,9 @@ class Contact(db.Model):
             'address': self.address,
             'phone': self.phone,
             'fax': self.fax,
-            'link_to_website': self.link_to_website
+            'link_to_website': self.link_to_website,
+            'latitude': self.latitude,
+            'longitude': self.longitude
         }
 
 # licenses
@@ -121,6 +153,9 @@ class License(db.Model):
     license_address_type_description = db.Column(db.String(80), unique=False, nullable=True) 
     exemptee_last_name = db.Column(db.String(80), unique=False, nullable=True) 
     exemptee_first_name = db.Column(db.String(80), unique=False, nullable=True)
+    # ZIP centroid of the license address (see geo_index.py)
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
  
 
 
@@ -155,29 +190,22 @@ class License(db.Model):
             "licenseAddressTypeCode": self.license_address_type_code,
             "licenseAddressTypeDescription": self.license_address_type_description,
             "exempteeLastName": self.exemptee_last_name,
-            "exempteeFirstName": self.exemptee_first_name
+            "exempteeFirstName": self.exemptee_first_name,
+            "latitude": self.latitude,
+            "longitude": self.longitude
         }
 
 # Initialize the database
 with app.app_context():
     db.create_all()
-    # Check if the database is empty and populate it with data from info.csv if needed
-    if not Contact.query.first():
-        with open('info.csv', mode='r', newline='') as file:
-            csv_reader = csv.reader(file)
-            next(csv_reader)  # Skip header
-            for row in csv_reader:
-                new_contact = Contact(
-                    county=row[0],
-                    name=row[1],
-                    address=row[2],
-                    phone=row[3],
-                    fax=row[4],
-                    link_to_website=row[5]
-                )
-                db.session.add(new_contact)
-            db.session.commit()
-        logging.info("Database populated with initial data from info.csv")
+    # Bring the contact table in line with the DA contact list. Only changed
+    # counties are written; contacts added through POST /contacts are kept
+    raw = db.engine.raw_connection()
+    try:
+        changes = sync_contacts(raw.driver_connection, read_contacts(CONTACTS_SOURCE), prune=False)
+    finally:
+        raw.close()
+    logging.info(f"Contacts synced from {CONTACTS_SOURCE}: {changes}")
 
     if not License.query.first():
         with open('license.csv', mode='r', newline='') as file:
@@ -220,6 +248,22 @@ with app.app_context():
             db.session.commit()
         logging.info("Database populated with initial data from license.csv")
 
+    # Place licenses and contacts at their ZIP centroids for proximity search
+    raw = db.engine.raw_connection()
+    try:
+        placed = geo_index.init_geo(raw.driver_connection)
+    finally:
+        raw.close()
+    if placed:
+        logging.info(f"Geocoded rows: {placed}")
+
+# Firm-name resolution index shared by the search routes; names seen in
+# upstream responses are added in the background
+firm_index = FirmIndex()
+# Normalized copy of the 510(k), recall and Maude records the searches return,
+# stored in the background
+device_facts = DeviceFacts()
+
 # User registration route
 @app.route('/register', methods=['POST'])
 def register():
@@ -246,7 +290,8 @@ def login():
     user = User.query.filter_by(username=username).first()
 
     if user and bcrypt.check_password_hash(user.password, password):
-        access_token = create_access_token(identity={'username': user.username})
+        # flask-jwt-extended 4.7+ only accepts string subjects
+        access_token = create_access_token(identity=user.username)
         return jsonify(access_token=access_token), 200
 
     return jsonify({"error": "Invalid credentials"}), 401
@@ -279,6 +324,9 @@ def manage_contacts():
         )
         db.session.add(new_contact)
         db.session.commit()
+        with geo_connection() as con:
+            geo_index.geocode(con, 'contact')
+        db.session.refresh(new_contact)
         return jsonify(new_contact.to_dict()), 201
 
 @app.route("/licenses", methods=['GET'])
@@ -289,6 +337,148 @@ def manage_licenses():
     return jsonify([license.to_json() for license in licenses])
 
 
+@contextmanager
+def geo_connection():
+    """The app database's sqlite3 connection, for the geo_index and sync_bundle queries."""
+    # The engine lives on the app; the sync refresh thread has no request context
+    with app.app_context():
+        raw = db.engine.raw_connection()
+    try:
+        yield raw.driver_connection
+    finally:
+        raw.close()
+
+def proximity_origin(con):
+    """(lat, lon) from ?lat=&lon= or the centroid of ?zip=, or an error response."""
+    if request.args.get('zip'):
+        origin = geo_index.zip_centroid(con, request.args['zip'])
+        return origin, None if origin else (jsonify({"error": "Unknown ZIP code"}), 404)
+    try:
+        lat, lon = float(request.args['lat']), float(request.args['lon'])
+    except (KeyError, ValueError):
+        return None, (jsonify({"error": "lat and lon, or zip, are required"}), 400)
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None, (jsonify({"error": "lat and lon are out of range"}), 400)
+    return (lat, lon), None
+
+@app.route("/licenses/nearby", methods=['GET'])
+def licenses_nearby():
+    """Licensed firms within ?radius= miles (default 10) of ?lat=&lon= or ?zip=, nearest first."""
+    try:
+        radius = min(float(request.args.get('radius', 10)), 100)
+        limit = int(request.args.get('limit', 100))
+    except ValueError:
+        return jsonify({"error": "radius and limit must be numbers"}), 400
+    with geo_connection() as con:
+        origin, error = proximity_origin(con)
+        if error:
+            return error
+        found = geo_index.within(con, 'license', origin[0], origin[1], radius, limit)
+    licenses = {row.license_address_id: row for row in
+                License.query.filter(License.license_address_id.in_([row_id for row_id, _ in found]))}
+    return jsonify([dict(licenses[row_id].to_json(), distanceMiles=round(distance, 2))
+                    for row_id, distance in found if row_id in licenses])
+
+@app.route("/contacts/nearest", methods=['GET'])
+def contacts_nearest():
+    """The DA office(s) nearest to ?lat=&lon= or ?zip= (?limit=, default 1)."""
+    try:
+        limit = max(1, min(int(request.args.get('limit', 1)), 10))
+    except ValueError:
+        return jsonify({"error": "limit must be a number"}), 400
+    with geo_connection() as con:
+        origin, error = proximity_origin(con)
+        if error:
+            return error
+        found = geo_index.nearest(con, 'contact', origin[0], origin[1], limit)
+    contacts = {row.id: row for row in Contact.query.filter(Contact.id.in_([row_id for row_id, _ in found]))}
+    return jsonify([dict(contacts[row_id].to_dict(), distanceMiles=round(distance, 2))
+                    for row_id, distance in found if row_id in contacts])
+
+
+# Versioned snapshot and change feed of the reference tables for the mobile
+# apps. Installed after init_geo so the triggers cover the coordinate columns
+sync = SyncBundle(geo_connection, fetch_cdph=lambda: fetch_cdph_recall_page().content, base_url=CDPH_BASE_URL)
+sync.install()
+
+@app.route("/sync/snapshot", methods=['GET'])
+def sync_snapshot():
+    """Every synced row as of the current version; ETag is the version."""
+    bundle = sync.snapshot()
+    etag = f"sync-{bundle.version}"
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    elif 'gzip' in (request.headers.get('Accept-Encoding') or ''):
+        # Compressed once per version instead of on every download
+        response = app.response_class(bundle.gzipped, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = app.response_class(bundle.body, mimetype='application/json')
+    response.set_etag(etag)
+    response.vary.add('Accept-Encoding')
+    return response
+
+@app.route("/sync/changes", methods=['GET'])
+def sync_changes():
+    """Rows changed since ?since=<version>; 410 if that version is older than the change log."""
+    since = request.args.get('since', '')
+    if not since.isdigit():
+        return jsonify({"error": "since must be a version number"}), 400
+    try:
+        return jsonify(sync.changes(int(since)))
+    except ChangesPruned:
+        return jsonify({"error": "Version is too old; download /sync/snapshot again"}), 410
+
+
+# Expiration-date index and the per-county expiring-soon counts. The rollup is
+# stamped with the sync version, so any license write makes it stale
+with geo_connection() as con:
+    license_expiry.init_expiry(con, current_version(con))
+
+@app.route("/licenses/expiring", methods=['GET'])
+def licenses_expiring():
+    """
+    Licenses expiring in the next ?days= days (default 30), or between
+    ?from= and ?to= (inclusive), soonest first. ?county= and ?status= narrow
+    the list; ?limit= and ?offset= page it.
+    """
+    if request.args.get('from') or request.args.get('to'):
+        first = license_expiry.parse_day(request.args.get('from'))
+        last = license_expiry.parse_day(request.args.get('to'))
+        if not (first and last and first <= last):
+            return jsonify({"error": "from and to must be YYYY-MM-DD dates, from first"}), 400
+        start, end = license_expiry.window_bounds((last - first).days, first)
+    else:
+        if not request.args.get('days', '30').isdigit():
+            return jsonify({"error": "days must be a number"}), 400
+        start, end = license_expiry.window_bounds(min(int(request.args.get('days', 30)), 3650))
+    try:
+        limit = max(1, min(int(request.args.get('limit', 100)), 1000))
+        offset = max(0, int(request.args.get('offset', 0)))
+    except ValueError:
+        return jsonify({"error": "limit and offset must be numbers"}), 400
+
+    query = License.query.filter(License.expiration_date >= start, License.expiration_date < end)
+    if request.args.get('county'):
+        query = query.filter(License.county_code == request.args['county'])
+    if request.args.get('status'):
+        query = query.filter(License.license_status_code == request.args['status'])
+    licenses = query.order_by(License.expiration_date, License.license_address_id).offset(offset).limit(limit).all()
+    return jsonify({
+        "from": start.date().isoformat(),
+        "to": (end.date() - timedelta(days=1)).isoformat(),
+        "total": query.count(),
+        "licenses": [license.to_json() for license in licenses],
+    })
+
+@app.route("/licenses/expiring/summary", methods=['GET'])
+def licenses_expiring_summary():
+    """Licenses expiring within each dashboard window, by county (?county=, ?status= to narrow)."""
+    with geo_connection() as con:
+        return jsonify(license_expiry.summary(con, current_version(con), request.args.get('county'),
+                                              request.args.get('status')))
+
+
 @app.route("/license-search", methods=["POST"])
 def search_licenses():
     business_name = request.get_json().get('businessName')
@@ -301,21 +491,23 @@ def search_licenses():
     zip_code = request.get_json().get('zip')
     county_code = request.get_json().get('countyCode')
     expiration_date = request.get_json().get('expirationDate')
+    expiration_from = request.get_json().get('expirationFrom')
+    expiration_to = request.get_json().get('expirationTo')
 
     # Query the database and apply filtering dynamically using SQLAlchemy
     query = License.query
     
     # Apply filters dynamically only if the parameter exists
     if business_name:
-        query = query.filter(License.businessName == business_name)
+        query = query.filter(License.business_name == business_name)
     if license_code_description:
-        query = query.filter(License.licenseCodeDescription == license_code_description)
+        query = query.filter(License.license_code_description == license_code_description)
     if license_status_code:
-        query = query.filter(License.licenseStatusCode == license_status_code)
+        query = query.filter(License.license_status_code == license_status_code)
     if license_address_type_description:
-        query = query.filter(License.licenseAddressTypeDescription == license_address_type_description)
+        query = query.filter(License.license_address_type_description == license_address_type_description)
     if address_line1:
-        query = query.filter(License.addressLine1 == address_line1)
+        query = query.filter(License.address_line_1 == address_line1)
     if city:
         query = query.filter(License.city == city)
     if state:
@@ -323,9 +515,18 @@ def search_licenses():
     if zip_code:
         query = query.filter(License.zip == zip_code)
     if county_code:
-        query = query.filter(License.countyCode == county_code)
+        query = query.filter(License.county_code == county_code)
+    # Expiration is stored as a datetime; a date matches the whole day, and
+    # expirationFrom/expirationTo give an inclusive range
     if expiration_date:
-        query = query.filter(License.expirationDate == expiration_date)
+        expiration_from = expiration_to = expiration_date
+    if expiration_from or expiration_to:
+        first = license_expiry.parse_day(expiration_from or '0001-01-01')
+        last = license_expiry.parse_day(expiration_to or '9998-12-31')
+        if not (first and last):
+            return jsonify({"error": "Expiration dates must be YYYY-MM-DD"}), 400
+        start, end = license_expiry.window_bounds((last - first).days, first)
+        query = query.filter(License.expiration_date >= start, License.expiration_date < end)
 
     # Execute the query and get all matching contacts
     licenses = query.all()
@@ -336,10 +537,11 @@ def search_licenses():
 
 # Define a route for the root URL that accepts POST requests
 @app.route("/", methods=['POST'])
+@stale_while_revalidate(SEARCH_SOFT_TTL, SEARCH_HARD_TTL)
 def search_fda():
     logging.info("Received a request.")  # Log that a request has been received
     data = request.get_json()  # Get JSON data from the request
-    logging.info(f"Request data: {data}")  # Log the received data
+    log_payload("Request data", data)  # Log the received data (sampled, opt-in)
 
     # Extract parameters from the request data
     product_description = data.get('productDescription', '')
@@ -358,37 +560,26 @@ def search_fda():
     if not apikey:
         return jsonify({"error": "API key is missing"}), 500
 
-    # Build query parameters based on the request data
-    query_params = []
-    if product_description:
-        query_params.append(f'product_description:"{product_description}"')
-    if recalling_firm:
-        query_params.append(f'recalling_firm:"{recalling_firm}"')
-    if recall_number:
-        query_params.append(f'recall_number:"{recall_number}"')
-    if recall_class:
-        query_params.append(f'classification:"{recall_class}"')
+    # Build the query string from the request data
     # Temporarily remove the date filter to test the basic query
-
-    # Construct the final query string
-    query = ' AND '.join(query_params)
-    url = f'https://api.fda.gov/device/enforcement.json?api_key={apikey}&search={query}&limit=100'
+    query = openfda.build_query('recall', data)
 
     try:
-        logging.info(f"Sending request to FDA API: {url}")  # Log the API request URL
-        response = requests.get(url)  # Send the request to the FDA API
-        response.raise_for_status()  # Raise an error for bad responses
-        return jsonify(response.json())  # Return the JSON response from the API
+        out = openfda.search('recall', query)  # Send the request to the FDA API
+        firm_index.add_many_later([r.get('recalling_firm') for r in out.get('results', [])], 'enforcement')
+        device_facts.add_later('recall', out.get('results', []))
+        return jsonify(out)  # Return the JSON response from the API
     except requests.RequestException as e:
         logging.error(f"Error fetching data from FDA API: {e}")  # Log any errors
-        return jsonify({"error": "Failed to fetch data from the API", "details": str(e).replace(apikey, "<HIDDEN>")}), 500
+        return jsonify({"error": "Failed to fetch data from the API", "details": connectors.redact(str(e))}), 500
 
 # Define a new route for K510 database search
 @app.route("/k510", methods=['POST'])
+@stale_while_revalidate(SEARCH_SOFT_TTL, SEARCH_HARD_TTL)
 def search_k510():
     logging.info("Received a K510 search request.")  # Log that a K510 request has been received
     data = request.get_json()  # Get JSON data from the request
-    logging.info(f"K510 request data: {data}")  # Log the received data
+    log_payload("K510 request data", data)  # Log the received data (sampled, opt-in)
 
     # Extract parameters from the request data
     k510_number = data.get('k510Number', '')
@@ -406,34 +597,24 @@ def search_k510():
     if not apikey:
         return jsonify({"error": "API key is missing"}), 500
 
-    # Build query parameters based on the request data
-    query_params = []
-    if k510_number:
-        query_params.append(f'k_number.exact:"{k510_number}"')
-    if applicant_name:
-        query_params.append(f'applicant:"{applicant_name}"')
-    if device_name:
-        query_params.append(f'device_name:"{device_name}"')
-
-    # Construct the final query string
-    query = ' AND '.join(query_params)
-    url = f'https://api.fda.gov/device/510k.json?api_key={apikey}&search={query}&limit=100'
+    # Build the query string from the request data
+    query = openfda.build_query('k510', data)
 
     try:
-        logging.info(f"Sending request to FDA K510 API: {url}")  # Log the API request URL
-        response = requests.get(url)  # Send the request to the FDA API
-        response.raise_for_status()  # Raise an error for bad responses
-        return jsonify(response.json())  # Return the JSON response from the API
+        out = openfda.search('k510', query)  # Send the request to the FDA API
+        firm_index.add_many_later([r.get('applicant') for r in out.get('results', [])], '510k')
+        device_facts.add_later('k510', out.get('results', []))
+        return jsonify(out)  # Return the JSON response from the API
     except requests.RequestException as e:
         logging.error(f"Error fetching data from FDA K510 API: {e}")  # Log any errors
-        return jsonify({"error": "Failed to fetch data from the API", "details": str(e).replace(apikey, "<HIDDEN>")}), 500
+        return jsonify({"error": "Failed to fetch data from the API", "details": connectors.redact(str(e))}), 500
 
 # Define a new route for CDPH device recall search
 @app.route("/cdph", methods=['POST'])
 def search_cdph():
     logging.info("Received a CDPH search request.")  # Log that a CDPH request has been received
     data = request.get_json()  # Get JSON data from the request
-    logging.info(f"CDPH request data: {data}")  # Log the received data
+    log_payload("CDPH request data", data)  # Log the received data (sampled, opt-in)
 
     # Extract parameters from the request data
     device_name = data.get('deviceName', '')
@@ -451,42 +632,48 @@ def search_cdph():
         logging.error(f"Error fetching data from CDPH: {e}")  # Log any errors
         return jsonify({"error": "Failed to fetch data from the CDPH website", "details": str(e)}), 500
 
-def perform_cdph_search(device_name, firm_name):
-    base_url = "https://www.cdph.ca.gov"
-    url = base_url + "/Programs/CEH/DFDCS/Pages/FDBPrograms/DeviceRecalls.aspx"
+def fetch_cdph_recall_page():
+    url = CDPH_BASE_URL + "/Programs/CEH/DFDCS/Pages/FDBPrograms/DeviceRecalls.aspx"
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
     }  # Some websites require a User-Agent header to mimic a web browser
 
-    response = requests.get(url, headers=headers)
+    # The recall page is the same for every search, so concurrent searches share one fetch
+    response = singleflight.fetch('cdph', 'GET', url, raise_for_status=False, headers=headers)
+    if response.status_code != 200:
+        raise Exception("Failed to retrieve data from the website.")
+    return response
 
-    if response.status_code == 200:
-        soup = BeautifulSoup(response.content, "html.parser")
-        links = soup.find_all("a", href=True)
+def perform_cdph_search(device_name, firm_name):
+    base_url = CDPH_BASE_URL
+    response = fetch_cdph_recall_page()
+
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(response.content, "html.parser")
+    links = soup.find_all("a", href=True)
+
+    results = []
+    for link in links:
+        if ((device_name and re.search(r'\b{}\b'.format(re.escape(device_name)), link.text, re.IGNORECASE)) or
+            (firm_name and re.search(r'\b{}\b'.format(re.escape(firm_name)), link.text, re.IGNORECASE)) or
+            (device_name and re.search(r'\b{}\b'.format(re.escape(device_name)), link["href"], re.IGNORECASE)) or
+            (firm_name and re.search(r'\b{}\b'.format(re.escape(firm_name)), link["href"], re.IGNORECASE))):
+            result = {
+                "text": link.text.strip(),
+                "url": urljoin(base_url, link["href"])
+            }
+            results.append(result)
 
-        results = []
-        for link in links:
-            if ((device_name and re.search(r'\b{}\b'.format(re.escape(device_name)), link.text, re.IGNORECASE)) or
-                (firm_name and re.search(r'\b{}\b'.format(re.escape(firm_name)), link.text, re.IGNORECASE)) or
-                (device_name and re.search(r'\b{}\b'.format(re.escape(device_name)), link["href"], re.IGNORECASE)) or
-                (firm_name and re.search(r'\b{}\b'.format(re.escape(firm_name)), link["href"], re.IGNORECASE))):
-                result = {
-                    "text": link.text.strip(),
-                    "url": urljoin(base_url, link["href"])
-                }
-                results.append(result)
-
-        logging.info(f"CDPH search results: {results}")  # Log the search results
-        return results
-    else:
-        raise Exception("Failed to retrieve data from the website.")
+    log_payload("CDPH search results", results)  # Log the search results (sampled, opt-in)
+    return results
 
 # Define a new route for Maude database search
 @app.route("/maude", methods=['POST'])
+@stale_while_revalidate(SEARCH_SOFT_TTL, SEARCH_HARD_TTL)
 def search_maude():
     logging.info("Received a Maude search request.")  # Log that a Maude request has been received
     data = request.get_json()  # Get JSON data from the request
-    logging.info(f"Maude request data: {data}")  # Log the received data
+    log_payload("Maude request data", data)  # Log the received data (sampled, opt-in)
 
     # Extract parameters from the request data
     device_generic_name = data.get('deviceName', '')  # Use deviceName for the generic name
@@ -503,30 +690,84 @@ def search_maude():
     if not apikey:
         return jsonify({"error": "API key is missing"}), 500
 
-    # Build query parameters based on the request data
-    query_params = []
-    if device_generic_name:
-        query_params.append(f'device.generic_name:"{device_generic_name}"')
-
-    # Construct the final query string
-    query = ' AND '.join(query_params)
-    url = f'https://api.fda.gov/device/event.json?api_key={apikey}&search={query}&limit=100'
+    # Build the query string from the request data
+    query = openfda.build_query('maude', data)
 
     try:
-        logging.info(f"Sending request to FDA Maude API: {url}")  # Log the API request URL
-        response = requests.get(url)  # Send the request to the FDA API
-        response.raise_for_status()  # Raise an error for bad responses
-        return jsonify(response.json())  # Return the JSON response from the API
+        out = openfda.search('maude', query)  # Send the request to the FDA API
+        device_facts.add_later('maude', out.get('results', []))
+        return jsonify(out)  # Return the JSON response from the API
     except requests.RequestException as e:
         logging.error(f"Error fetching data from FDA Maude API: {e}")  # Log any errors
-        return jsonify({"error": "Failed to fetch data from the API", "details": str(e).replace(apikey, "<HIDDEN>")}), 500
+        return jsonify({"error": "Failed to fetch data from the API", "details": connectors.redact(str(e))}), 500
+
+# openFDA searches that could not get a rate-limit token in time
+@app.errorhandler(RateLimitExceeded)
+def rate_limit_exceeded(e):
+    response = jsonify({"error": "The FDA API is busy. Please try again shortly."})
+    response.headers['Retry-After'] = str(max(1, round(e.retry_after)))
+    return response, 503
+
+# Batch versions of the recall, 510(k) and Maude searches. Each query takes the
+# same fields as the single route; /batch queries also name their "type"
+# ("recall", "k510" or "maude"). Results come back in the order of the queries.
+def batch_search(kind=None):
+    data = request.get_json(silent=True)
+    queries = data.get('queries') if isinstance(data, dict) else None
+    if not isinstance(queries, list) or not queries:
+        return jsonify({"error": "A non-empty list of queries is required"}), 400
+    if not all(isinstance(query, dict) for query in queries):
+        return jsonify({"error": "Each query must be an object of search parameters"}), 400
+    if len(queries) > openfda.BATCH_MAX_QUERIES:
+        return jsonify({"error": f"At most {openfda.BATCH_MAX_QUERIES} queries are allowed per batch"}), 400
+    if not os.getenv('FDA_API_KEY'):
+        return jsonify({"error": "API key is missing"}), 500
+
+    planned = []
+    for query in queries:
+        query_kind = kind or query.get('type')
+        if query_kind not in openfda.QUERY_BUILDERS:
+            return jsonify({"error": "Each query needs a type of recall, k510 or maude"}), 400
+        planned.append((query_kind, query))
+
+    results = openfda.run_batch(planned)
+    # Batch queries wait for rate-limit tokens only as long as the request's
+    # deadline allows; if none got one, the client should retry the batch
+    limited = [result['retryAfter'] for result in results if 'retryAfter' in result]
+    if len(limited) == len(results):
+        response = jsonify({"error": "The FDA API is busy. Please try again shortly.", "results": results})
+        response.headers['Retry-After'] = str(max(1, max(limited)))
+        return response, 429
+    for (query_kind, _), result in zip(planned, results):
+        device_facts.add_later(query_kind, result.get('results', []))
+        if query_kind == 'recall':
+            firm_index.add_many_later([r.get('recalling_firm') for r in result.get('results', [])], 'enforcement')
+        elif query_kind == 'k510':
+            firm_index.add_many_later([r.get('applicant') for r in result.get('results', [])], '510k')
+    return jsonify({"results": results})
+
+@app.route("/batch", methods=['POST'])
+def search_batch():
+    return batch_search()
+
+@app.route("/recalls/batch", methods=['POST'])
+def search_recalls_batch():
+    return batch_search('recall')
+
+@app.route("/k510/batch", methods=['POST'])
+def search_k510_batch():
+    return batch_search('k510')
+
+@app.route("/maude/batch", methods=['POST'])
+def search_maude_batch():
+    return batch_search('maude')
 
 # Define a new route for OpenHistorical search
 @app.route("/openhistorical", methods=['POST'])
 def search_openhistorical():
     logging.info("Received an OpenHistorical search request.")
     data = request.get_json()
-    logging.info(f"OpenHistorical request data: {data}")
+    log_payload("OpenHistorical request data", data)
 
     keyword = data.get("keyword", "")
     year = data.get("year", "")
@@ -571,14 +812,12 @@ def search_openhistorical():
             }
         )
 
-    url = "http://localhost:9200/document-with-vector/_search"
+    url = f"{ELASTICSEARCH_URL}/document-with-vector/_search"
 
     try:
         logging.info(f"Sending request to FDA OpenHistorical API: {url}")
-        response = requests.get(
-            url, json=query_params, headers={"Content-Type": "application/json"}
-        )
-        response.raise_for_status()
+        response = singleflight.fetch('elasticsearch', 'GET', url, json=query_params,
+                                      headers={"Content-Type": "application/json"})
 
         response_data = response.json()
 
@@ -611,14 +850,9 @@ def search_openhistorical():
         return jsonify({"error": "API key is missing"}), 500
 
     query_string = " AND ".join(query_params)
-    url = f"https://api.fda.gov/other/historicaldocument.json?api_key={apikey}&search={query_string}&limit=100"
 
     try:
-        logging.info(f"Sending request to FDA OpenHistorical API: {url}")
-        response = requests.get(url)
-        response.raise_for_status()
-
-        response_data = response.json()
+        response_data = openfda.search('historical', query_string)
 
         # Ensure we correctly handle the API response structure
         results = [
@@ -635,7 +869,7 @@ def search_openhistorical():
     except requests.RequestException as e:
         logging.error(f"Error fetching data from FDA OpenHistorical API: {e}")
         return (
-            jsonify({"error": "Failed to fetch data from the API", "details": str(e).replace(apikey, "<HIDDEN>")}),
+            jsonify({"error": "Failed to fetch data from the API", "details": connectors.redact(str(e))}),
             500,
         )
 
@@ -644,7 +878,7 @@ def search_openhistorical():
 def search_ca_business_entity():
     logging.info("Received a CA business entity search request.")
     data = request.get_json()
-    logging.info(f"CA business entity request data: {data}")
+    log_payload("CA business entity request data", data)
 
     search_term = data.get('searchTerm', '')
 
@@ -652,7 +886,7 @@ def search_ca_business_entity():
         return jsonify({"error": "Search term is required"}), 400
 
     # Build the search URL for the new data source
-    search_url = "https://bizfileonline.sos.ca.gov/api/Records/businesssearch"
+    search_url = BIZFILE_SEARCH_URL
 
     try:
         # Perform the initial request to get the search page
@@ -683,9 +917,8 @@ def search_ca_business_entity():
         }
 
         # Use the form data to perform the search
-        logging.info(f"Performing search with criteria: {json_data}")
-        response = requests.post(search_url, json=json_data, headers=headers)
-        response.raise_for_status()
+        log_payload("Performing search with criteria", json_data)
+        response = singleflight.fetch('bizfile', 'POST', search_url, json=json_data, headers=headers)
 
         # Parse the search results
         table_rows = response.json()["rows"]
@@ -701,11 +934,19 @@ def search_ca_business_entity():
             }
             results.append(result)
 
+        firm_index.add_many_later([r["entityInformation"] for r in results], 'business_entity')
         return jsonify(results)
     except requests.RequestException as e:
         logging.error(f"Error fetching data from CA Secretary of State business search: {e}")
         return jsonify({"error": "Failed to fetch data from the website", "details": str(e)}), 500
     
+# Keyword matcher for Confluence pages, built once, plus cached page bodies
+# and a keep-alive pool to RASA
+intent_matcher = IntentMatcher(CONFLUENCE_PAGES)
+confluence = ConfluenceClient.from_env()
+metrics.registry.register_cache('confluence_pages', confluence.pages)
+rasa = RasaClient()
+
 @app.route('/chat', methods=['POST'])
 def chat_with_rasa_and_confluence():
     """
@@ -718,73 +959,24 @@ def chat_with_rasa_and_confluence():
     if not message:
         return jsonify({"error": "Message is required"}), 400
 
-    # Pre-defined map of Confluence-related keywords to page IDs
-    content_map = {
-        "product requirements": "30507017",
-        "masvs checklist": "41353217",
-        "privacy": "29655042",
-        "build .ipa": "33325058",
-        "unit testing": "56262659",
-        "samd": "29032449",
-        "pytorch": "28835843",
-        "hardware considerations": "27131907",
-        "mysql database": "60391427",
-        "mysql backend": "59834369",
-        "flask api": "74088449"
-    }
-
     # Check if the message matches any Confluence keyword
-    for keyword, page_id in content_map.items():
-        if keyword in message:
-            # Fetch the content from Confluence
-            confluence_base_url = os.getenv('CONFLUENCE_BASE_URL')
-            confluence_api_token = os.getenv('CONFLUENCE_API_TOKEN')
-            confluence_email = os.getenv('CONFLUENCE_EMAIL')
-
-            if not all([confluence_base_url, confluence_api_token, confluence_email]):
-                return jsonify({"reply": "There is an issue with the server configuration. Please try again later."}), 500
-
-            # Create Basic Auth header
-            auth_string = f"{confluence_email}:{confluence_api_token}"
-            auth_bytes = base64.b64encode(auth_string.encode('utf-8')).decode('utf-8')
-
-            headers = {
-                'Authorization': f'Basic {auth_bytes}',
-                'Content-Type': 'application/json'
-            }
-
-            # URL to fetch page content by ID
-            url = f"{confluence_base_url}/wiki/rest/api/content/{page_id}?expand=body.storage"
+    page_id = intent_matcher.match(message)
+    if page_id:
+        if not confluence.is_configured():
+            return jsonify({"reply": "There is an issue with the server configuration. Please try again later."}), 500
 
-            try:
-                response = requests.get(url, headers=headers)
-                response.raise_for_status()
-                data = response.json()
+        try:
+            # Served from the page cache; fetched from Confluence only on a miss
+            page_content = confluence.page(page_id)
+            return jsonify({"reply": page_content}), 200
 
-                # Extract the HTML content of the page
-                page_content = data.get('body', {}).get('storage', {}).get('value', 'No content available')
-                return jsonify({"reply": page_content}), 200
-
-            except requests.RequestException as e:
-                logging.error(f"Error fetching data from Confluence: {e}")
-                return jsonify({"reply": "I'm having trouble accessing the information at the moment. Please try again later."}), 500
+        except requests.RequestException as e:
+            logging.error(f"Error fetching data from Confluence: {e}")
+            return jsonify({"reply": "I'm having trouble accessing the information at the moment. Please try again later."}), 500
 
     # If no Confluence-related keyword is matched, forward the message to RASA
-    rasa_url = "http://localhost:5005/webhooks/rest/webhook"  # RASA REST API endpoint
-
     try:
-        # Send the user message to RASA
-        response = requests.post(rasa_url, json={"sender": "user", "message": message})
-        response.raise_for_status()
-
-        # Parse the response from RASA
-        bot_responses = response.json()
-        if bot_responses:
-            # Combine responses if RASA sends multiple messages
-            reply_text = " ".join([resp.get("text", "") for resp in bot_responses])
-        else:
-            reply_text = "I'm not sure how to respond to that."
-
+        reply_text = rasa.reply(message)
         return jsonify({"reply": reply_text}), 200
 
     except requests.RequestException as e:
@@ -793,7 +985,15 @@ def chat_with_rasa_and_confluence():
 
 
 
-serp_client = serpapi.Client(api_key=os.getenv('SERP_API_KEY'))
+# serpapi is imported and the client created on the first reverse image search
+serp_client = None
+
+def get_serp_client():
+    global serp_client
+    if serp_client is None:
+        import serpapi
+        serp_client = serpapi.Client(api_key=os.getenv('SERP_API_KEY'))
+    return serp_client
 
 
 
@@ -801,6 +1001,19 @@ def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+# Reverse image search results of recent uploads, reused for near-duplicate photos
+serpapi_cache = PerceptualCache(image_cache.SERPAPI_CACHE_MAX_DISTANCE, image_cache.SERPAPI_CACHE_TTL,
+                                image_cache.SERPAPI_CACHE_SIZE)
+metrics.registry.register_cache('serpapi_images', serpapi_cache)
+
+def upload_hash(image_bytes):
+    """Perceptual hash of an upload, or None when it cannot be decoded."""
+    try:
+        return perceptual_hash(image_bytes)
+    except Exception as e:
+        logging.warning(f"Could not hash upload: {e}")
+        return None
+
 @app.route("/serpapi-upload", methods=["GET", "POST"])
 def upload_file():
     if request.method == "POST":
@@ -817,8 +1030,15 @@ def upload_file():
         # if file is allowed upload to /uploads
         if file and allowed_file(file.filename):
             # filename = secure_filename(file.filename)
+            image_bytes = file.read()
+            image_hash = upload_hash(image_bytes)
+            cached = serpapi_cache.get(image_hash) if image_hash is not None else None
+            if cached is not None:
+                return cached
+
             filename = str(uuid.uuid4()) + ".png"
-            file.save(os.path.join(app.config["UPLOAD_FOLDER"], filename))
+            with open(os.path.join(app.config["UPLOAD_FOLDER"], filename), "wb") as f:
+                f.write(image_bytes)
 
             # setup google reverse image search
             params = {
@@ -828,10 +1048,16 @@ def upload_file():
                 + "/serpapi-uploads/"
                 + filename,
             }
-            search = serp_client.search(params)
+            def send(timeout):
+                with track_upstream('serpapi'):
+                    return get_serp_client().search(params)
+
+            search = connectors.get('serpapi').call(send)
 
             # parsing results, looking for object name
             results = search.as_dict()
+            if image_hash is not None and "error" not in results:
+                serpapi_cache.set(image_hash, results)
 
             # if "search_information" in results:
             #     results = results["search_information"]["query_displayed"]
@@ -866,90 +1092,265 @@ def uploaded_file(filename):
     return send_from_directory(app.config["UPLOAD_FOLDER"], filename)
 
 
-# Initialize the YOLO model
-model = YOLO("last.pt")
+# YOLO inference runs in a separate process pool with a bounded queue. The
+# model loads in the pool workers, on the first image or at worker start when
+# PRELOAD_MODEL is set (see gunicorn.conf.py)
+inference_service = InferenceService()
+
+# Results of recent images by output mode, reused for near-duplicate photos
+predict_cache = PerceptualCache(image_cache.PREDICT_CACHE_MAX_DISTANCE, image_cache.PREDICT_CACHE_TTL,
+                                image_cache.PREDICT_CACHE_SIZE)
+metrics.registry.register_cache('predict_images', predict_cache)
 
 @app.route('/predict', methods=['POST'])
 def predict():
     try:
         file = request.files['file'].read()
-        image = Image.open(io.BytesIO(file)).convert("RGB")
-        image_np = np.array(image)
-
-        results = model.predict(source=image_np, save=True)
-
-        result_image_path = "/app/runs/detect/predict/image0.jpg"
-        cv2.imwrite(result_image_path, results[0].plot())
-
-        with open(result_image_path, "rb") as image_file:
-            img_str = base64.b64encode(image_file.read()).decode("utf-8")
-
-        return jsonify({'result': img_str})
+        # ?output=detections returns the boxes without the annotated image
+        detections_only = (request.args.get('output') or request.form.get('output')) == 'detections'
+        output = 'detections' if detections_only else 'image'
+
+        # A near-duplicate may be a resized copy: boxes are cached as fractions
+        # of the image size, and annotated images only match the same size
+        image_hash = upload_hash(file)
+        cached = (predict_cache.get(image_hash) if image_hash is not None else None) or {}
+        size = image_cache.image_size(file) if image_hash is not None else None
+        if detections_only and 'detections' in cached:
+            return jsonify({'detections': image_cache.scale_boxes(cached['detections'], size)})
+        if not detections_only and 'image' in cached and cached['size'] == size:
+            return jsonify(cached['image'])
+
+        result = inference_service.predict(file, detections_only)
+        if image_hash is not None:
+            kept = {'detections': cached['detections']} if 'detections' in cached else {}
+            if 'image' in cached and cached['size'] == size:
+                kept['image'] = cached['image']
+            stored = image_cache.normalize_boxes(result['detections'], size) if detections_only else result
+            predict_cache.set(image_hash, {**kept, 'size': size, output: stored})
+        return jsonify(result)
+    except QueueFull:
+        response = jsonify({"error": "Too many images are being processed. Please try again shortly."})
+        response.headers['Retry-After'] = '5'
+        return response, 429
+    except InferenceTimeout:
+        return jsonify({"error": "Image processing timed out"}), 504
     except Exception as e:
         logging.error(f"Error in prediction: {e}")
         return jsonify({"error": str(e)}), 500
 
+# Local index of Device/Biologics warning letters, synced in the background
+warning_letter_index = WarningLetterIndex()
+# Saved searches, checked against new recalls and warning letters in the background
+saved_searches = SavedSearches(warning_letters=warning_letter_index)
+warning_letter_stats = CacheStats()
+metrics.registry.register_cache('warning_letters', warning_letter_stats)
+
+def index_firm_names():
+    """Load the firm index and add names from the local license and warning-letter tables."""
+    firm_index.load()
+    with app.app_context():
+        firm_index.add_many([row.business_name for row in db.session.query(License.business_name)], 'license')
+    firm_index.add_many(warning_letter_index.legal_names(), 'warning_letter')
+
+
 @app.route("/warning_letters", methods=['POST'])
+@stale_while_revalidate(SEARCH_SOFT_TTL, SEARCH_HARD_TTL)
 def search_warning_letters():
     data = request.get_json()
     keyword = data.get('firmName', '')  # Assume 'firmName' is sent as the keyword
+    fei_number = data.get('feiNumber', '')
 
     logging.info(f"Received keyword: {keyword}")  # Log the received keyword
 
-    api_url = 'https://api-datadashboard.fda.gov/v1/compliance_actions'
-    request_body = {
-        "start": 1,
-        "rows": 50,
-        "returntotalcount": "true",
-        "sort": "ActionTakenDate",
-        "sortorder": "DESC",
-        "filters": {
-            "ProductType": ["Biologics", "Devices"],
-            "ActionType": ["Warning Letter"],
-            "LegalName": [keyword]
-        },
-        "columns": [
-            "FirmProfile",
-            "FEINumber",
-            "ActionType",
-            "State",
-            "ActionTakenDate",
-            "LegalName",
-            "CaseInjunctionID"  # Add CaseInjunctionID column
-        ]
-    }
+    # Answer from the local index once it has completed a sync
+    if warning_letter_index.is_ready():
+        warning_letter_stats.hit()
+        return jsonify(warning_letter_index.lookup(legal_name=keyword, fei_number=fei_number))
+    warning_letter_stats.miss()
 
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization-User': os.getenv('AUTHORIZATION_USER'),  # Should ideally be secured
-        'Authorization-Key': os.getenv('AUTHORIZATION_KEY')  # Should ideally be secured
-    }
+    request_body = dashboard_request_body(1, 50, keyword)
 
     try:
-        response = rq.post(api_url, json=request_body, headers=headers)
-        response.raise_for_status()  # Will raise an HTTPError if the HTTP request returned an unsuccessful status code
+        # Raises an HTTPError if the HTTP request returned an unsuccessful status code
+        response = singleflight.fetch('fda_dashboard', 'POST', DASHBOARD_API_URL, json=request_body,
+                                      headers=dashboard_headers())
         out = response.json()
-        
-        logging.info(f"API response: {out}")  # Log the API response
 
-        # Construct URLs to warning letters and add to response data
+        log_payload("API response", out)  # Log the API response (sampled, opt-in)
+
+        # Construct URLs to warning letters and add to response data,
+        # preferring links already verified by the index
         results = []
         for result in out.get('result', []):  # Corrected to 'result'
-            logging.info(f"Processing result: {result}")  # Log each result being processed
             if all(key in result for key in ['CaseInjunctionID', 'ActionTakenDate', 'LegalName']):
-                warning_letter_url = construct_warning_letter_url(
+                warning_letter_url, verified = warning_letter_index.letter_url(
                     result['CaseInjunctionID'], result['ActionTakenDate'], result['LegalName'])
                 result['warning_letter_url'] = warning_letter_url
+                result['warning_letter_url_verified'] = verified
                 results.append(result)
 
-        logging.info(f"Processed results: {results}")  # Log the processed results
+        log_payload("Processed results", results)  # Log the processed results (sampled, opt-in)
+        firm_index.add_many_later([r['LegalName'] for r in results], 'warning_letter')
         return jsonify(results)
     except rq.RequestException as e:
         logging.error(f"Error fetching data from FDA API: {e}")  # Log any errors
         return jsonify({"error": "Failed to fetch data from FDA API", "details": str(e)}), 500
 
+metrics.registry.register_cache('recall_search_swr', search_fda.cache)
+metrics.registry.register_cache('k510_search_swr', search_k510.cache)
+metrics.registry.register_cache('maude_search_swr', search_maude.cache)
+metrics.registry.register_cache('warning_letter_search_swr', search_warning_letters.cache)
+
+
+# Typeahead for the firm, device and product search fields, built in the
+# background from the local tables and rebuilt periodically
+def autocomplete_terms():
+    with geo_connection() as con:
+        terms = list(terms_from(con, APP_DB_QUERIES))
+    return terms + list(terms_from(device_facts.db.connection(), INDEX_DB_QUERIES))
+
+typeahead = Autocomplete(autocomplete_terms)
+
+@app.route("/autocomplete/<kind>", methods=['GET'])
+def autocomplete(kind):
+    """Most common names in the local data starting with ?q= (at word starts), heaviest first."""
+    if kind not in AUTOCOMPLETE_KINDS:
+        return jsonify({"error": f"kind must be one of {', '.join(AUTOCOMPLETE_KINDS)}"}), 404
+    if not request.args.get('limit', '10').isdigit():
+        return jsonify({"error": "limit must be a number"}), 400
+    limit = max(1, min(int(request.args.get('limit', 10)), 50))
+    return jsonify({"kind": kind, "q": request.args.get('q', ''),
+                    "suggestions": typeahead.suggest(kind, request.args.get('q', ''), limit)})
+
+
+@app.route("/firms/resolve", methods=['POST'])
+def resolve_firm():
+    """
+    Resolve a firm name to its firm ID and the spellings of that firm seen
+    in each data source.
+    """
+    data = request.get_json()
+    firm_name = data.get('firmName', '')
+
+    if not firm_name:
+        return jsonify({"error": "Firm name is required"}), 400
+
+    firm_id = firm_index.resolve(firm_name)
+    if firm_id is None:
+        return jsonify({"firmId": None, "canonicalName": None, "aliases": {}})
+    return jsonify({
+        "firmId": firm_id,
+        "canonicalName": firm_index.canonical_name(firm_id),
+        "aliases": firm_index.aliases(firm_id)
+    })
+
+
+def current_username():
+    identity = get_jwt_identity()
+    # Tokens from older releases carried {'username': ...}
+    return identity['username'] if isinstance(identity, dict) else identity
+
+@app.route("/saved-searches", methods=['GET', 'POST'])
+@jwt_required()
+def manage_saved_searches():
+    """
+    GET lists the user's saved searches. POST saves one: {"kind": "recall" or
+    "warning_letter", "criteria": {...}} with the same fields as the / and
+    /warning_letters request bodies.
+    """
+    if request.method == 'GET':
+        return jsonify(saved_searches.list(current_username()))
+
+    data = request.get_json() or {}
+    try:
+        search_id = saved_searches.save(current_username(), data.get('kind'), data.get('criteria'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"id": search_id}), 201
+
+@app.route("/saved-searches/<int:search_id>", methods=['DELETE'])
+@jwt_required()
+def delete_saved_search(search_id):
+    if not saved_searches.delete(current_username(), search_id):
+        return jsonify({"error": "Saved search not found"}), 404
+    return '', 204
+
+@app.route("/notifications", methods=['GET'])
+@jwt_required()
+def list_notifications():
+    """New records matching the user's saved searches, after the ?after= cursor (a notification id)."""
+    after = request.args.get('after', '0')
+    if not after.isdigit():
+        return jsonify({"error": "after must be a notification id"}), 400
+    notifications = saved_searches.notifications(current_username(), int(after))
+    cursor = notifications[-1]['id'] if notifications else int(after)
+    return jsonify({"notifications": notifications, "cursor": cursor})
+
+@app.route("/product-codes/<product_code>/activity", methods=['GET'])
+def product_code_activity(product_code):
+    """
+    Everything stored locally for one product code: its device name, class
+    and registration count, and its latest 510(k) clearances, recalls and
+    Maude reports (?limit= per list, default 50).
+    """
+    limit = request.args.get('limit', '50')
+    if not limit.isdigit():
+        return jsonify({"error": "limit must be a number"}), 400
+    activity = device_facts.activity(product_code.strip().upper(), int(limit))
+    if activity is None:
+        return jsonify({"error": "Unknown product code"}), 404
+    return jsonify(activity)
+
+@app.route("/analytics/<dataset>", methods=['GET'])
+def analytics_report(dataset):
+    """
+    Record counts over the enforcement or 510(k) history, grouped by the
+    columns in ?by= (plus 'year' or 'month'), e.g.
+    /analytics/enforcement?by=classification,month&from=2020-01-01&to=2023-12-31&product_code=DZE
+    Any other query parameter naming a column filters on that value.
+    """
+    # numpy is only loaded once reports are used
+    from analytics_store import analytics_store, DATASETS, parse_date
+
+    if dataset not in DATASETS:
+        return jsonify({"error": f"Unknown dataset, expected one of {sorted(DATASETS)}"}), 404
+
+    keys = [key.strip() for key in request.args.get('by', '').split(',') if key.strip()]
+    filters = {column: value for column, value in request.args.items()
+               if column not in ('by', 'from', 'to', 'limit', 'fields')}
+    date_from = parse_date(request.args.get('from', '0001-01-01'))
+    date_to = parse_date(request.args.get('to', '9999-12-31'))
+    if not (date_from and date_to):
+        return jsonify({"error": "Dates must be YYYY-MM-DD"}), 400
+    if not request.args.get('limit', '100').isdigit():
+        return jsonify({"error": "limit must be a number"}), 400
+
+    try:
+        report = analytics_store.report(dataset, keys, filters, date_from, date_to, int(request.args.get('limit', 100)))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"dataset": dataset, "groupBy": keys, **report})
 
 
 # Run the Flask app on the specified host and port
+def start_background_tasks():
+    """
+    Start the background sync and refresh threads. Threads do not survive a
+    fork, so a preloading server defers this to each worker (see
+    gunicorn.conf.py); otherwise it runs at import.
+    """
+    if os.getenv('AUTHORIZATION_USER') and os.getenv('AUTHORIZATION_KEY'):
+        warning_letter_index.start()
+    confluence.start_refresh(CONFLUENCE_PAGES.values())
+    if os.getenv('FDA_API_KEY'):
+        saved_searches.start()
+    sync.start()
+    cache_warmer.start()
+    typeahead.start()
+    threading.Thread(target=index_firm_names, name="firm-index-load", daemon=True).start()
+
+if not os.getenv('DEFER_BACKGROUND_TASKS'):
+    start_background_tasks()
+
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=80)
+    app.run(host='0.0.0.0', port=int(os.getenv('PORT', 80)))
@@ -0,0 +1,256 @@
+# Request and upstream instrumentation exposed in Prometheus text format
+# Metrics are per process; scrape each worker (or run a single worker) when
+# deployed under a multi-process server.
+
+import logging
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+import requests
+from flask import Response, g, request
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# Full request/response payloads are only logged when LOG_PAYLOADS is set,
+# and then only for a sample of requests
+LOG_PAYLOADS = os.getenv('LOG_PAYLOADS', '').lower() in ('1', 'true', 'yes')
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv('LOG_PAYLOAD_SAMPLE_RATE', 0.01))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+                                for key, value in items]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, ([*state[0]], state[1], state[2])) for key, state in self._values.items())
+        lines = self.header()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, [le])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._caches = {}
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_cache(self, name, cache):
+        """Report hits and misses of an object with hits/misses attributes."""
+        self._caches[name] = cache
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        lines.append("# HELP cache_requests_total Lookups served by in-process caches and local indexes")
+        lines.append("# TYPE cache_requests_total counter")
+        for name, cache in sorted(self._caches.items()):
+            lines.append(f'cache_requests_total{{cache="{_escape(name)}",result="hit"}} {cache.hits}')
+            lines.append(f'cache_requests_total{{cache="{_escape(name)}",result="miss"}} {cache.misses}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+    'http_request_duration_seconds', 'Time spent handling a request', ('route', 'method', 'status')))
+http_response_bytes = registry.register(Histogram(
+    'http_response_bytes', 'Size of response bodies', ('route',), buckets=SIZE_BUCKETS))
+http_requests_in_flight = registry.register(Gauge(
+    'http_requests_in_flight', 'Requests currently being handled', ('route',)))
+upstream_request_duration = registry.register(Histogram(
+    'upstream_request_duration_seconds', 'Time spent waiting on an upstream service', ('upstream',)))
+upstream_response_bytes = registry.register(Histogram(
+    'upstream_response_bytes', 'Size of upstream response bodies', ('upstream',), buckets=SIZE_BUCKETS))
+upstream_errors = registry.register(Counter(
+    'upstream_errors_total', 'Failed upstream calls by kind (timeout, connection, http_<status>, error)',
+    ('upstream', 'kind')))
+upstream_in_flight = registry.register(Gauge(
+    'upstream_requests_in_flight', 'Upstream calls currently waiting on a response', ('upstream',)))
+
+
+class CacheStats:
+    """Hit/miss counters for lookups that are not backed by a TTLCache."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def hit(self):
+        self.hits += 1
+
+    def miss(self):
+        self.misses += 1
+
+
+class _UpstreamCall:
+    response = None
+
+
+def _error_kind(error):
+    if isinstance(error, requests.Timeout):
+        return 'timeout'
+    if isinstance(error, requests.ConnectionError):
+        return 'connection'
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return f'http_{error.response.status_code}'
+    return 'error'
+
+
+@contextmanager
+def track_upstream(name):
+    """
+    Time an upstream call. Assign the response to the yielded object to also
+    record its size:
+
+        with track_upstream('openfda') as call:
+            call.response = requests.get(url)
+    """
+    call = _UpstreamCall()
+    upstream_in_flight.inc(upstream=name)
+    start = time.perf_counter()
+    try:
+        yield call
+    except Exception as e:
+        upstream_errors.inc(upstream=name, kind=_error_kind(e))
+        raise
+    finally:
+        upstream_request_duration.observe(time.perf_counter() - start, upstream=name)
+        upstream_in_flight.dec(upstream=name)
+        if call.response is not None:
+            upstream_response_bytes.observe(len(call.response.content), upstream=name)
+
+
+def log_payload(message, payload):
+    """Debug-log a full payload, only when enabled and only for a sample of calls."""
+    if LOG_PAYLOADS and random.random() < LOG_PAYLOAD_SAMPLE_RATE and logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(f"{message}: {payload}")
+
+
+def _route():
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+def init_app(app):
+    """Instrument every route of the app and expose GET /metrics."""
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_route = _route()
+        g.metrics_start = time.perf_counter()
+        http_requests_in_flight.inc(route=g.metrics_route)
+
+    @app.after_request
+    def _record(response):
+        route = g.get('metrics_route')
+        if route is not None:
+            http_request_duration.observe(time.perf_counter() - g.metrics_start,
+                                          route=route, method=request.method, status=response.status_code)
+            if not response.direct_passthrough:
+                http_response_bytes.observe(response.calculate_content_length() or 0, route=route)
+        return response
+
+    @app.teardown_request
+    def _finish(error=None):
+        route = g.pop('metrics_route', None)
+        if route is not None:
+            http_requests_in_flight.dec(route=route)
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
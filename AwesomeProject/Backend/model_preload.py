@@ -0,0 +1,14 @@
+# Loads the YOLO model in the inference forkserver (see
+# inference.FORKSERVER_PRELOAD). The pool workers are forked from the
+# forkserver after this import, so they share the model's memory pages
+# copy-on-write and their load_model() initializer finds it already loaded.
+
+import logging
+
+from inference import load_model
+
+try:
+    load_model()
+except Exception as e:
+    # The pool workers load it themselves and report the error per image
+    logging.warning(f"Could not preload the model in the forkserver: {e}")
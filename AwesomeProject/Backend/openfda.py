@@ -0,0 +1,218 @@
+# openFDA device queries shared by the single-search routes and the batch routes
+# A batch is planned before anything is sent: identical sub-queries run once,
+# lookups by recall number or 510(k) number are merged into OR queries and
+# mapped back to their inputs, and the remaining searches run concurrently.
+
+import contextvars
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import connectors
+from metrics import track_upstream
+from rate_limit import openfda_limiter, RateLimitExceeded, INTERACTIVE, BATCH
+from singleflight import flights, request_key
+
+
+OPENFDA_BASE_URL = os.getenv('OPENFDA_BASE_URL', 'https://api.fda.gov')
+BATCH_MAX_QUERIES = int(os.getenv('OPENFDA_BATCH_MAX_QUERIES', 50))
+BATCH_CONCURRENCY = int(os.getenv('OPENFDA_BATCH_CONCURRENCY', 4))
+# Identifiers per OR query, small enough to keep the URL well under limits
+OR_CHUNK_SIZE = 50
+
+ENDPOINTS = {
+    'recall': '/device/enforcement.json',
+    'k510': '/device/510k.json',
+    'maude': '/device/event.json',
+    'historical': '/other/historicaldocument.json',
+}
+
+
+def recall_clauses(data):
+    clauses = []
+    if data.get('productDescription'):
+        clauses.append(f'product_description:"{data["productDescription"]}"')
+    if data.get('recallingFirm'):
+        clauses.append(f'recalling_firm:"{data["recallingFirm"]}"')
+    if data.get('recallNumber'):
+        clauses.append(f'recall_number:"{data["recallNumber"]}"')
+    if data.get('recallClass'):
+        clauses.append(f'classification:"{data["recallClass"]}"')
+    return clauses
+
+
+def k510_clauses(data):
+    clauses = []
+    if data.get('k510Number'):
+        clauses.append(f'k_number.exact:"{data["k510Number"]}"')
+    if data.get('applicantName'):
+        clauses.append(f'applicant:"{data["applicantName"]}"')
+    if data.get('deviceName'):
+        clauses.append(f'device_name:"{data["deviceName"]}"')
+    return clauses
+
+
+def maude_clauses(data):
+    clauses = []
+    if data.get('deviceName'):
+        clauses.append(f'device.generic_name:"{data["deviceName"]}"')
+    return clauses
+
+
+QUERY_BUILDERS = {'recall': recall_clauses, 'k510': k510_clauses, 'maude': maude_clauses}
+
+# Queries that only look up one of these identifiers can share an OR query:
+# kind -> (request field, openFDA search field, field in each result)
+IDENTIFIER_LOOKUPS = {
+    'recall': ('recallNumber', 'recall_number', 'recall_number'),
+    'k510': ('k510Number', 'k_number.exact', 'k_number'),
+}
+
+
+def build_query(kind, data):
+    return ' AND '.join(QUERY_BUILDERS[kind](data))
+
+
+def search(kind, query, limit=100, priority=INTERACTIVE, attempts=3, skip=0):
+    """
+    Run one openFDA search and return the decoded response; raises on HTTP
+    errors. Waits for a token from the shared openFDA rate limiter first
+    (RateLimitExceeded if that takes too long), and waits and retries when
+    openFDA answers 429 anyway. Identical searches already in flight are
+    joined rather than repeated.
+    """
+    apikey = os.getenv('FDA_API_KEY')
+    url = f'{OPENFDA_BASE_URL}{ENDPOINTS[kind]}?api_key={apikey}&search={query}&limit={limit}'
+    if skip:
+        url += f'&skip={skip}'
+
+    key = request_key('GET', url)
+
+    def send(timeout):
+        return requests.get(url, timeout=timeout)
+
+    def fetch():
+        logging.info(f"Sending request to openFDA {ENDPOINTS[kind]}: {query}")
+        for attempt in range(attempts):
+            # Never wait for a token past the request's deadline
+            openfda_limiter.acquire(priority, max_wait=connectors.remaining())
+            with track_upstream('openfda') as call:
+                # Breaker, hedging, deadline and stale fallback (see connectors.py).
+                # A hedge is a second openFDA call and needs its own token
+                response = call.response = connectors.get('openfda').call(
+                    send, idempotent=True, key=key, hedge_permit=lambda: openfda_limiter.try_acquire(priority))
+                if response.status_code == 429 and attempt < attempts - 1:
+                    # Someone else is using the key too; back everyone off
+                    openfda_limiter.drain(60)
+                    continue
+                response.raise_for_status()
+            return response
+
+    # Each caller decodes its own copy of the shared response
+    return flights.do(key, fetch).json()
+
+
+def _error(e):
+    return {"error": "Failed to fetch data from the API", "details": connectors.redact(str(e))}
+
+
+def _no_matches(e):
+    # openFDA answers 404 when a search matches nothing
+    return isinstance(e, requests.HTTPError) and e.response is not None and e.response.status_code == 404
+
+
+def _identifier(kind, data):
+    """The identifier a query looks up, if that is all it does."""
+    lookup = IDENTIFIER_LOOKUPS.get(kind)
+    if lookup is None or not data.get(lookup[0]) or len(QUERY_BUILDERS[kind](data)) != 1:
+        return None
+    return str(data[lookup[0]]).strip().upper()
+
+
+def _rate_limited(e):
+    return {"error": "openFDA rate limit reached", "retryAfter": round(e.retry_after)}
+
+
+def _run_single(kind, query, priority):
+    try:
+        return search(kind, query, priority=priority)
+    except RateLimitExceeded as e:
+        return _rate_limited(e)
+    except requests.RequestException as e:
+        if _no_matches(e):
+            return {"results": []}
+        logging.error(f"Error fetching data from openFDA {ENDPOINTS[kind]}: {e}")
+        return _error(e)
+
+
+def _run_identifiers(kind, identifiers, priority):
+    """One OR query for a chunk of identifiers; returns identifier -> result."""
+    _, search_field, result_field = IDENTIFIER_LOOKUPS[kind]
+    # openFDA treats space-separated terms as OR
+    query = ' '.join(f'{search_field}:"{value}"' for value in identifiers)
+    try:
+        records = search(kind, query, limit=1000, priority=priority).get('results', [])
+    except RateLimitExceeded as e:
+        return {value: _rate_limited(e) for value in identifiers}
+    except requests.RequestException as e:
+        if _no_matches(e):
+            records = []
+        else:
+            logging.error(f"Error fetching data from openFDA {ENDPOINTS[kind]}: {e}")
+            return {value: _error(e) for value in identifiers}
+    grouped = {value: [] for value in identifiers}
+    for record in records:
+        value = str(record.get(result_field) or '').upper()
+        if value in grouped:
+            grouped[value].append(record)
+    return {value: {"results": matched} for value, matched in grouped.items()}
+
+
+_executor = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY, thread_name_prefix="openfda-batch")
+
+
+def run_batch(queries, priority=BATCH):
+    """
+    Run (kind, data) queries and return one result per query, in order. Each
+    result is the openFDA response ({"results": [...]}) or {"error": ...}.
+    Batches yield the rate limiter's reserve to single searches.
+    """
+    results = [None] * len(queries)
+    keys = [None] * len(queries)
+    searches = {}      # (kind, query), in first-seen order
+    identifiers = {}   # kind -> identifiers, in first-seen order
+
+    for position, (kind, data) in enumerate(queries):
+        identifier = _identifier(kind, data)
+        if identifier:
+            keys[position] = (kind, 'id', identifier)
+            identifiers.setdefault(kind, {})[identifier] = None
+            continue
+        query = build_query(kind, data)
+        if not query:
+            results[position] = {"error": "At least one search parameter is required"}
+            continue
+        keys[position] = (kind, 'query', query)
+        searches[(kind, query)] = None
+
+    tasks = [(lambda kind=kind, query=query: {(kind, 'query', query): _run_single(kind, query, priority)})
+             for kind, query in searches]
+    for kind, values in identifiers.items():
+        values = list(values)
+        for start in range(0, len(values), OR_CHUNK_SIZE):
+            chunk = values[start:start + OR_CHUNK_SIZE]
+            tasks.append(lambda kind=kind, chunk=chunk: {(kind, 'id', value): result for value, result
+                                                         in _run_identifiers(kind, chunk, priority).items()})
+
+    answers = {}
+    # Each task runs in a copy of this request's context, so its upstream
+    # calls keep the request deadline
+    contexts = [contextvars.copy_context() for _ in tasks]
+    for answer in _executor.map(lambda task, context: context.run(task), tasks, contexts):
+        answers.update(answer)
+    for position, key in enumerate(keys):
+        if key is not None:
+            results[position] = answers[key]
+    return results
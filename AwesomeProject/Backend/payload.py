@@ -0,0 +1,156 @@
+# Response payload handling for every route: optional field projection of
+# JSON bodies (?fields=), an orjson encoder behind FAST_JSON, and gzip,
+# brotli or zstd compression negotiated from Accept-Encoding for bodies
+# above a size threshold. brotli, zstandard and orjson are optional; without
+# them the app falls back to gzip and the standard json encoder.
+
+import gzip
+import os
+
+from flask import has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+FAST_JSON = os.getenv('FAST_JSON', '').lower() in ('1', 'true', 'yes')
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+COMPRESS_GZIP_LEVEL = int(os.getenv('COMPRESS_GZIP_LEVEL', 6))
+COMPRESS_BROTLI_QUALITY = int(os.getenv('COMPRESS_BROTLI_QUALITY', 5))
+COMPRESS_ZSTD_LEVEL = int(os.getenv('COMPRESS_ZSTD_LEVEL', 3))
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/html', 'text/plain', 'text/csv'}
+
+
+def parse_fields(value):
+    """'results.k_number,meta' -> {'results': {'k_number': {}}, 'meta': {}}"""
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for part in filter(None, path.strip().split('.')):
+            node = node.setdefault(part, {})
+    return tree
+
+
+def project(obj, tree):
+    """
+    Keep only the fields named in `tree`. Lists are projected item by item,
+    and a field whose subtree is empty is kept whole.
+    """
+    if not tree:
+        return obj
+    if isinstance(obj, list):
+        return [project(item, tree) for item in obj]
+    if isinstance(obj, dict):
+        return {key: project(obj[key], subtree) for key, subtree in tree.items() if key in obj}
+    return obj
+
+
+class ProjectingJSONProvider(DefaultJSONProvider):
+    """jsonify() that applies the request's ?fields= projection before encoding."""
+
+    def _prepare_response_obj(self, args, kwargs):
+        obj = super()._prepare_response_obj(args, kwargs)
+        fields = request.args.get('fields') if has_request_context() else None
+        # Error bodies are returned whole
+        if not fields or (isinstance(obj, dict) and 'error' in obj):
+            return obj
+        return project(obj, parse_fields(fields))
+
+
+class OrjsonProvider(ProjectingJSONProvider):
+    """
+    orjson encoding with the default provider's sorted keys and HTTP dates
+    (through Flask's default()). Unlike the default provider, which escapes
+    non-ASCII text as \\uXXXX, orjson writes it as raw UTF-8: the JSON is
+    the same, but bodies and their ETags change when FAST_JSON is switched.
+    """
+
+    def dumps(self, obj, **kwargs):
+        return self._encode(obj, pretty='indent' in kwargs).decode('utf-8')
+
+    def _encode(self, obj, pretty=False):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self._encode(obj, pretty) + b"\n", mimetype=self.mimetype)
+
+
+def _accepted_encodings(header):
+    """Accept-Encoding as {coding: q}, dropping codings with q=0."""
+    accepted = {}
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if coding and quality > 0:
+            accepted[coding.strip().lower()] = quality
+    return accepted
+
+
+def choose_encoding(header):
+    """Best supported coding the client accepts, preferring zstd, then br, then gzip on ties."""
+    accepted = _accepted_encodings(header or '')
+    available = [coding for coding, module in (('zstd', zstandard), ('br', brotli), ('gzip', gzip)) if module]
+    candidates = [(accepted.get(coding, accepted.get('*', 0)), -rank, coding)
+                  for rank, coding in enumerate(available)]
+    candidates = [c for c in candidates if c[0] > 0]
+    return max(candidates)[2] if candidates else None
+
+
+def compress(data, encoding):
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=COMPRESS_ZSTD_LEVEL).compress(data)
+    if encoding == 'br':
+        return brotli.compress(data, quality=COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=COMPRESS_GZIP_LEVEL)
+
+
+def init_app(app):
+    """Install the JSON provider and compress responses. Call after metrics.init_app so sizes are on-wire sizes."""
+    app.json = OrjsonProvider(app) if FAST_JSON and orjson else ProjectingJSONProvider(app)
+
+    @app.after_request
+    def _compress(response):
+        if (response.direct_passthrough or response.status_code < 200 or response.status_code >= 300
+                or response.status_code == 204 or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+        response.vary.add('Accept-Encoding')
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+        if encoding is None:
+            return response
+
+        response.set_data(compress(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+        # The representation changed, so a strong validator can only stay as a weak one
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,132 @@
+# Token-bucket rate limiting for upstream API keys, shared through SQLite
+# Every process that opens the same RATE_LIMIT_DB_PATH (gunicorn workers,
+# background syncs, export scripts) draws from the same buckets, so together
+# they stay under openFDA's per-minute and per-day quotas. Callers wait for a
+# token instead of failing; interactive calls may use the whole bucket while
+# batch work leaves a reserve for them.
+
+import os
+import time
+
+import metrics
+from local_db import LocalDB
+
+
+RATE_LIMIT_DB_PATH = os.getenv('RATE_LIMIT_DB_PATH', 'rate_limit.db')
+# openFDA limits per API key
+OPENFDA_PER_MINUTE = int(os.getenv('OPENFDA_RATE_PER_MINUTE', 240))
+OPENFDA_PER_DAY = int(os.getenv('OPENFDA_RATE_PER_DAY', 120000))
+# Share of each bucket that batch work may not use
+BATCH_RESERVE = float(os.getenv('RATE_LIMIT_BATCH_RESERVE', 0.25))
+INTERACTIVE_MAX_WAIT = float(os.getenv('RATE_LIMIT_INTERACTIVE_MAX_WAIT', 15))
+BATCH_MAX_WAIT = float(os.getenv('RATE_LIMIT_BATCH_MAX_WAIT', 120))
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_bucket (
+    name TEXT NOT NULL,
+    period REAL NOT NULL,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (name, period)
+);
+"""
+
+rate_limit_wait = metrics.registry.register(metrics.Histogram(
+    'rate_limit_wait_seconds', 'Time spent waiting for an upstream rate-limit token', ('limiter', 'priority')))
+rate_limit_rejected = metrics.registry.register(metrics.Counter(
+    'rate_limit_rejected_total', 'Calls given up after waiting too long for a token', ('limiter', 'priority')))
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Rate limit reached, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class TokenBucketLimiter:
+    """
+    One token bucket per (capacity, period) limit. acquire() takes a token
+    from every bucket at once, waiting while any of them is empty.
+    """
+
+    def __init__(self, name, limits, path=RATE_LIMIT_DB_PATH, batch_reserve=BATCH_RESERVE, poll=0.05):
+        self.name = name
+        self.limits = list(limits)
+        self.batch_reserve = batch_reserve
+        self.poll = poll
+        self.db = LocalDB(path)
+        self._schema_ready = False
+
+    def _connection(self):
+        if not self._schema_ready:
+            self.db.executescript(SCHEMA)
+            self._schema_ready = True
+        return self.db.connection()
+
+    def _try_take(self, priority):
+        """Take a token if possible; otherwise return how long to wait for one."""
+        con = self._connection()
+        now = time.time()
+        con.execute('BEGIN IMMEDIATE')
+        try:
+            stored = {row['period']: (row['tokens'], row['updated']) for row in con.execute(
+                'SELECT period, tokens, updated FROM rate_bucket WHERE name = ?', (self.name,))}
+            levels = []
+            wait = 0.0
+            for capacity, period in self.limits:
+                tokens, updated = stored.get(period, (capacity, now))
+                rate = capacity / period
+                tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+                floor = capacity * self.batch_reserve if priority == BATCH else 0.0
+                if tokens - 1 < floor:
+                    wait = max(wait, (floor + 1 - tokens) / rate)
+                levels.append((period, tokens))
+            if not wait:
+                levels = [(period, tokens - 1) for period, tokens in levels]
+            con.executemany('INSERT OR REPLACE INTO rate_bucket (name, period, tokens, updated) VALUES (?, ?, ?, ?)',
+                            [(self.name, period, tokens, now) for period, tokens in levels])
+            con.commit()
+        except Exception:
+            con.rollback()
+            raise
+        return wait
+
+    def acquire(self, priority=INTERACTIVE, max_wait=None):
+        """
+        Block until a token is available. Raises RateLimitExceeded instead if
+        that would take longer than the priority's maximum wait, or than
+        max_wait seconds when that is shorter (e.g. what is left of a request).
+        """
+        limit = INTERACTIVE_MAX_WAIT if priority == INTERACTIVE else BATCH_MAX_WAIT
+        max_wait = limit if max_wait is None else min(max_wait, limit)
+        start = time.monotonic()
+        while True:
+            wait = self._try_take(priority)
+            waited = time.monotonic() - start
+            if not wait:
+                rate_limit_wait.observe(waited, limiter=self.name, priority=priority)
+                return waited
+            if waited + wait > max_wait:
+                rate_limit_rejected.inc(limiter=self.name, priority=priority)
+                raise RateLimitExceeded(wait)
+            # Interactive callers re-check often so they get in ahead of waiting batch work
+            time.sleep(wait if priority == BATCH else min(wait, self.poll))
+
+    def try_acquire(self, priority=INTERACTIVE):
+        """Take a token if one is available right now; never waits."""
+        return not self._try_take(priority)
+
+    def drain(self, period=None):
+        """Empty the buckets (or the one for `period`), e.g. after the upstream answered 429."""
+        con = self._connection()
+        with con:
+            for capacity, bucket_period in self.limits:
+                if period is None or period == bucket_period:
+                    con.execute('INSERT OR REPLACE INTO rate_bucket (name, period, tokens, updated) VALUES (?, ?, 0, ?)',
+                                (self.name, bucket_period, time.time()))
+
+
+openfda_limiter = TokenBucketLimiter('openfda', [(OPENFDA_PER_MINUTE, 60), (OPENFDA_PER_DAY, 86400)])
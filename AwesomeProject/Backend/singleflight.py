@@ -0,0 +1,115 @@
+# Request coalescing for upstream calls
+# While a call is in flight, identical calls (same method, URL, parameters
+# and body) wait for it and share its response instead of sending their own.
+# This works with or without a cache in front.
+
+import json
+import threading
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import requests
+
+import connectors
+from metrics import track_upstream
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    do(key, fn) runs fn once per key at a time; callers arriving while it
+    runs get the same result (or exception). Results are shared objects, so
+    callers must not modify them.
+    """
+
+    def __init__(self):
+        self.hits = 0      # calls that joined one already in flight
+        self.misses = 0    # calls that went upstream
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+def _pairs(fields):
+    """A mapping or sequence of pairs as sorted (name, value) strings; list values are repeated."""
+    items = fields.items() if hasattr(fields, 'items') else fields
+    return sorted((str(name), str(value)) for name, values in items
+                  for value in (values if isinstance(values, (list, tuple)) else [values]))
+
+
+def request_key(method, url, params=None, json_body=None, data=None):
+    """
+    Normalized identity of an HTTP request: query parameters, form fields and
+    JSON keys in sorted order. Bytes and text bodies are used as they are.
+    """
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True) + _pairs(params or {})
+    normalized_url = urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path,
+                                 urlencode(sorted(query)), ''))
+    if json_body is not None:
+        body = json.dumps(json_body, sort_keys=True)
+    elif data is None or isinstance(data, (str, bytes)):
+        body = data
+    else:
+        body = urlencode(_pairs(data))
+    return (method.upper(), normalized_url, body)
+
+
+flights = SingleFlight()
+
+
+def fetch(upstream, method, url, raise_for_status=True, **kwargs):
+    """
+    requests.request timed under track_upstream(upstream), sent through the
+    upstream's connector and coalesced with identical calls in flight. GETs
+    are hedged and fall back to the last good response when the upstream is
+    down. Callers share the Response, but each response.json() call decodes
+    a fresh copy.
+    """
+    key = request_key(method, url, kwargs.get('params'), kwargs.get('json'), kwargs.get('data'))
+    idempotent = method.upper() in ('GET', 'HEAD')
+    timeout = kwargs.pop('timeout', None)
+
+    def send(timeout):
+        with track_upstream(upstream) as tracked:
+            response = tracked.response = requests.request(method, url, timeout=timeout, **kwargs)
+            if raise_for_status:
+                response.raise_for_status()
+        return response
+
+    def call():
+        return connectors.get(upstream).call(send, idempotent=idempotent, key=key if idempotent else None,
+                                             timeout=timeout)
+
+    return flights.do(key, call)
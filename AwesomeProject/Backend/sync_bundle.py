@@ -0,0 +1,262 @@
+# Offline sync for the mobile clients
+# The reference tables (DA contacts, licenses and an index of the CDPH device
+# recall notices) are served as one versioned snapshot, plus the rows changed
+# since a version the device already holds. Triggers on each table append the
+# key of every changed row to sync_change; the newest change number is the
+# data version. A device downloads the snapshot once, then asks for
+# /sync/changes?since=<version> and answers lookups from its local copy.
+#
+# The change log is kept for SYNC_RETENTION_DAYS. A device that has been
+# offline for longer gets 410 Gone and downloads the snapshot again.
+
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import urljoin
+
+
+SYNC_RETENTION_DAYS = int(os.getenv('SYNC_RETENTION_DAYS', 30))
+CDPH_REFRESH_INTERVAL = int(os.getenv('CDPH_REFRESH_INTERVAL', 6 * 3600))
+
+# table -> key column
+SYNC_TABLES = {
+    'contact': 'id',
+    'license': 'license_address_id',
+    'cdph_recall': 'url',
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sync_change (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name TEXT NOT NULL,
+    row_key NOT NULL,
+    changed_at INTEGER NOT NULL DEFAULT (strftime('%s', 'now'))
+);
+CREATE INDEX IF NOT EXISTS sync_change_changed_at ON sync_change (changed_at);
+CREATE TABLE IF NOT EXISTS sync_meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER
+);
+CREATE TABLE IF NOT EXISTS cdph_recall (
+    url TEXT PRIMARY KEY,
+    text TEXT
+);
+"""
+
+Snapshot = namedtuple('Snapshot', 'version body gzipped')
+
+
+class ChangesPruned(Exception):
+    """The requested version is older than the change log."""
+
+
+def _columns(con, table):
+    return [row[1] for row in con.execute(f"PRAGMA table_info({table})")]
+
+
+def install_triggers(con, table):
+    """
+    (Re)create the change-log triggers of a table. The update trigger only
+    fires when a column value actually changes, so rewriting a row with the
+    same values does not send it to every device again.
+    """
+    key = SYNC_TABLES[table]
+    changed = " OR ".join(f"OLD.{column} IS NOT NEW.{column}" for column in _columns(con, table))
+    log = "INSERT INTO sync_change (table_name, row_key) VALUES ('{table}', {row}.{key});"
+    con.executescript(f"""
+        DROP TRIGGER IF EXISTS {table}_sync_insert;
+        DROP TRIGGER IF EXISTS {table}_sync_update;
+        DROP TRIGGER IF EXISTS {table}_sync_delete;
+        CREATE TRIGGER {table}_sync_insert AFTER INSERT ON {table}
+        BEGIN {log.format(table=table, row='NEW', key=key)} END;
+        CREATE TRIGGER {table}_sync_update AFTER UPDATE ON {table} WHEN {changed}
+        BEGIN
+            {log.format(table=table, row='NEW', key=key)}
+            INSERT INTO sync_change (table_name, row_key) SELECT '{table}', OLD.{key} WHERE OLD.{key} IS NOT NEW.{key};
+        END;
+        CREATE TRIGGER {table}_sync_delete AFTER DELETE ON {table}
+        BEGIN {log.format(table=table, row='OLD', key=key)} END;
+    """)
+
+
+def current_version(con):
+    row = con.execute("SELECT seq FROM sqlite_sequence WHERE name = 'sync_change'").fetchone()
+    return row[0] if row else 0
+
+
+def _horizon(con):
+    row = con.execute("SELECT value FROM sync_meta WHERE key = 'horizon'").fetchone()
+    return row[0] if row else 0
+
+
+def prune(con, retention_days=SYNC_RETENTION_DAYS):
+    """Drop change-log entries older than the retention window. Returns the new horizon."""
+    cutoff = int(time.time()) - retention_days * 86400
+    with con:
+        row = con.execute("SELECT max(version) FROM sync_change WHERE changed_at < ?", (cutoff,)).fetchone()
+        if row[0] is not None:
+            con.execute("DELETE FROM sync_change WHERE version <= ?", (row[0],))
+            con.execute("INSERT OR REPLACE INTO sync_meta (key, value) VALUES ('horizon', ?)", (row[0],))
+    return _horizon(con)
+
+
+def _rows(con, table, keys, chunk=500):
+    """Current rows of the given keys, in table column order."""
+    rows = []
+    for i in range(0, len(keys), chunk):
+        batch = keys[i:i + chunk]
+        rows += con.execute(f"SELECT * FROM {table} WHERE {SYNC_TABLES[table]} IN "
+                            f"({','.join('?' * len(batch))})", batch).fetchall()
+    return rows
+
+
+def snapshot(con):
+    """{version, tables: {table: {key, columns, rows}}}, read in one transaction."""
+    con.execute("BEGIN")
+    try:
+        document = {"version": current_version(con), "tables": {}}
+        for table, key in SYNC_TABLES.items():
+            document["tables"][table] = {
+                "key": key,
+                "columns": _columns(con, table),
+                "rows": [list(row) for row in con.execute(f"SELECT * FROM {table} ORDER BY {key}")],
+            }
+    finally:
+        con.commit()
+    return document
+
+
+def changes(con, since):
+    """
+    {version, changes: {table: {columns, upserts, deletes}}} for the rows
+    changed after version `since`. A row changed several times is sent once,
+    as it is now; a row that no longer exists is a delete.
+    """
+    con.execute("BEGIN")
+    try:
+        if since < _horizon(con):
+            raise ChangesPruned(since)
+        version = current_version(con)
+        touched = {}
+        for table, row_key in con.execute("SELECT DISTINCT table_name, row_key FROM sync_change WHERE version > ?",
+                                          (since,)):
+            touched.setdefault(table, []).append(row_key)
+
+        out = {}
+        for table, keys in touched.items():
+            columns = _columns(con, table)
+            key_index = columns.index(SYNC_TABLES[table])
+            upserts = [list(row) for row in _rows(con, table, keys)]
+            present = {row[key_index] for row in upserts}
+            out[table] = {
+                "columns": columns,
+                "upserts": upserts,
+                "deletes": [key for key in keys if key not in present],
+            }
+    finally:
+        con.commit()
+    return {"version": version, "changes": out}
+
+
+def recall_links(html, base_url):
+    """{url: text} of the recall notices linked from the CDPH device recall page."""
+    from bs4 import BeautifulSoup
+    links = {}
+    for link in BeautifulSoup(html, "html.parser").find_all("a", href=True):
+        # Notices are documents in the FDB recall library; everything else is navigation
+        if '/recalls/' in link["href"].lower():
+            links[urljoin(base_url, link["href"])] = link.text.strip()
+    return links
+
+
+def update_cdph_index(con, links):
+    """Bring cdph_recall in line with the page, writing only what changed. Returns the counts."""
+    current = dict(con.execute("SELECT url, text FROM cdph_recall"))
+    added = [(url, text) for url, text in links.items() if url not in current]
+    updated = [(text, url) for url, text in links.items() if url in current and current[url] != text]
+    removed = [(url,) for url in current if url not in links]
+    with con:
+        con.executemany("INSERT INTO cdph_recall (url, text) VALUES (?, ?)", added)
+        con.executemany("UPDATE cdph_recall SET text = ? WHERE url = ?", updated)
+        con.executemany("DELETE FROM cdph_recall WHERE url = ?", removed)
+    return {"added": len(added), "updated": len(updated), "removed": len(removed)}
+
+
+class SyncBundle:
+    """
+    Snapshot and change feed over the app database. `connect` is a context
+    manager yielding an sqlite3 connection; `fetch_cdph` returns the HTML of
+    the CDPH device recall page. The encoded snapshot is kept per process
+    until the version moves.
+    """
+
+    def __init__(self, connect, fetch_cdph=None, base_url='', refresh_interval=CDPH_REFRESH_INTERVAL):
+        self.connect = connect
+        self.fetch_cdph = fetch_cdph
+        self.base_url = base_url
+        self.refresh_interval = refresh_interval
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def install(self):
+        """Create the sync tables and triggers. Run after any column is added to a synced table."""
+        with self.connect() as con:
+            con.executescript(SCHEMA)
+            for table in SYNC_TABLES:
+                install_triggers(con, table)
+            con.commit()
+
+    def snapshot(self):
+        """The current Snapshot, encoded once per version."""
+        with self.connect() as con:
+            version = current_version(con)
+            cached = self._snapshot
+            if cached and cached.version == version:
+                return cached
+            with self._lock:
+                if self._snapshot and self._snapshot.version == current_version(con):
+                    return self._snapshot
+                document = snapshot(con)
+        body = json.dumps(document, separators=(',', ':'), default=str).encode()
+        self._snapshot = Snapshot(document["version"], body, gzip.compress(body, 6))
+        return self._snapshot
+
+    def changes(self, since):
+        with self.connect() as con:
+            return changes(con, since)
+
+    def refresh_cdph(self):
+        links = recall_links(self.fetch_cdph(), self.base_url)
+        if not links:
+            # A redesigned or error page would otherwise empty every device's index
+            logging.warning("No recall links on the CDPH recall page; keeping the current index")
+            return None
+        with self.connect() as con:
+            return update_cdph_index(con, links)
+
+    def _run(self):
+        while True:
+            try:
+                counts = self.refresh_cdph()
+                if counts:
+                    logging.info(f"CDPH recall index refreshed: {counts}")
+                with self.connect() as con:
+                    prune(con)
+            except Exception as e:
+                logging.error(f"Sync bundle refresh failed: {e}")
+            if self._stop.wait(self.refresh_interval):
+                return
+
+    def start(self):
+        if self._thread is None and self.fetch_cdph:
+            self._thread = threading.Thread(target=self._run, name="sync-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
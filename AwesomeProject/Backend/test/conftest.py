@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Make the backend modules importable from the test directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
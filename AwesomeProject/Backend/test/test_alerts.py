@@ -0,0 +1,83 @@
+import pytest
+
+from alerts import SavedSearches, SearchIndex, RECALL, WARNING_LETTER
+
+
+def recall(number, date, description, firm="Acme Medical", classification="Class II"):
+	return {"recall_number": number, "report_date": date, "product_description": description,
+	        "recalling_firm": firm, "classification": classification}
+
+
+class FakeWarningLetters:
+	def __init__(self, letters):
+		self.letters = letters
+
+	def is_ready(self):
+		return True
+
+	def since(self, action_date):
+		return [letter for letter in self.letters if letter["ActionTakenDate"] >= action_date]
+
+
+def test_search_index_needs_every_term():
+	index = SearchIndex(RECALL, [
+		(1, {"productDescription": "infusion pump"}),
+		(2, {"productDescription": "pump", "recallClass": "Class I"}),
+		(3, {"recallNumber": "Z-0001-2024"}),
+	])
+	assert sorted(index.match(recall("Z-0001-2024", "20240102", "Large volume infusion pump"))) == [1, 3]
+	assert index.match(recall("Z-2", "20240102", "Syringe pump", classification="Class I")) == [2]
+	assert index.match(recall("Z-3", "20240102", "Catheter")) == []
+
+
+def test_poll_alerts_only_on_new_records(tmp_path):
+	upstream = [recall("Z-1", "20240101", "Infusion pump")]
+	searches = SavedSearches(str(tmp_path / "index.db"), fetch_recalls=lambda since: list(upstream))
+	search_id = searches.save("inspector", RECALL, {"productDescription": "pump", "ignored": "x"})
+	assert searches.list("inspector")[0]["criteria"] == {"productDescription": "pump"}
+
+	# The first poll only sets the high-water mark
+	assert searches.poll_recalls() == 0
+	upstream.append(recall("Z-2", "20240105", "Syringe pump"))
+	upstream.append(recall("Z-3", "20240105", "Catheter"))
+	assert searches.poll_recalls() == 1
+	assert searches.poll_recalls() == 0
+
+	notifications = searches.notifications("inspector")
+	assert [(n["searchId"], n["record"]["recall_number"]) for n in notifications] == [(search_id, "Z-2")]
+	assert searches.notifications("inspector", after=notifications[-1]["id"]) == []
+	assert searches.notifications("someone-else") == []
+
+
+def test_warning_letters_poll_from_local_index(tmp_path):
+	letters = FakeWarningLetters([])
+	searches = SavedSearches(str(tmp_path / "index.db"), warning_letters=letters)
+	searches.save("inspector", WARNING_LETTER, {"firmName": "Medtronic"})
+	searches.poll_warning_letters()
+
+	letters.letters.append({"CaseInjunctionID": "1", "ActionTakenDate": "2999-01-01", "LegalName": "Medtronic, Inc."})
+	letters.letters.append({"CaseInjunctionID": "2", "ActionTakenDate": "2999-01-01", "LegalName": "Baxter"})
+	assert searches.poll_warning_letters() == 1
+	assert searches.notifications("inspector")[0]["record"]["CaseInjunctionID"] == "1"
+
+
+def test_save_validation_and_delete(tmp_path):
+	searches = SavedSearches(str(tmp_path / "index.db"), fetch_recalls=lambda since: [])
+	with pytest.raises(ValueError):
+		searches.save("inspector", RECALL, {"productDescription": "  "})
+	with pytest.raises(ValueError):
+		searches.save("inspector", "maude", {"deviceName": "pump"})
+	search_id = searches.save("inspector", RECALL, {"recallingFirm": "Acme"})
+	assert not searches.delete("someone-else", search_id)
+	assert searches.delete("inspector", search_id)
+	assert searches.list("inspector") == []
+
+
+def test_only_one_poller_claims_each_interval(tmp_path):
+	calls = []
+	path = str(tmp_path / "index.db")
+	workers = [SavedSearches(path, fetch_recalls=lambda since: calls.append(since) or [], poll_interval=3600)
+	           for _ in range(3)]
+	for worker in workers:
+		worker.poll()
+	assert len(calls) == 1
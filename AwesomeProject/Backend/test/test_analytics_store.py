@@ -0,0 +1,94 @@
+import pytest
+
+import analytics_store
+from analytics_store import AnalyticsStore
+
+
+RECALLS = {
+	2019: [
+		{"report_date": "20190105", "classification": "Class II", "recalling_firm": "Medtronic, Inc.", "product_code": "DZE"},
+		{"report_date": "20190120", "classification": "Class II", "recalling_firm": "Baxter", "product_code": "FRN"},
+		{"report_date": "20190301", "classification": "Class I", "recalling_firm": "Medtronic, Inc.", "product_code": "DZE"},
+	],
+	2020: [
+		{"report_date": "20200115", "classification": "Class II", "recalling_firm": "Baxter", "product_code": "FRN"},
+		{"report_date": "20201231", "classification": "Class III", "recalling_firm": "Baxter", "product_code": "FRN"},
+	],
+}
+
+
+@pytest.fixture
+def store(tmp_path):
+	store = AnalyticsStore(str(tmp_path))
+	for year, records in RECALLS.items():
+		store.write_partition('enforcement', year, records)
+	return store
+
+
+def test_group_by_counts_across_partitions(store):
+	assert store.years('enforcement') == [2019, 2020]
+	assert store.group_by('enforcement', ['classification']) == {
+		("Class II",): 3, ("Class I",): 1, ("Class III",): 1}
+	assert store.group_by('enforcement', ['firm', 'year']) == {
+		("Medtronic, Inc.", 2019): 2, ("Baxter", 2019): 1, ("Baxter", 2020): 2}
+	assert store.group_by('enforcement', []) == {(): 5}
+
+
+def test_filters_and_date_range(store):
+	counts = store.group_by('enforcement', ['month'], filters={"product_code": "FRN"}, date_from=20190115, date_to=20200131)
+	assert counts == {(201901,): 1, (202001,): 1}
+	assert store.group_by('enforcement', ['month'], filters={"product_code": "XXX"}) == {}
+	with pytest.raises(ValueError):
+		store.group_by('enforcement', ['recall_number'])
+
+
+def test_report_rows_and_rewritten_partition(store):
+	report = store.report('enforcement', ['classification', 'month'], limit=1)
+	assert report["total"] == 5 and report["groups"] == 4
+	assert report["rows"] == [{"classification": "Class II", "month": "2019-01", "count": 2}]
+
+	store.write_partition('enforcement', 2020, RECALLS[2020][:1])
+	assert store.report('enforcement', [])["total"] == 4
+
+
+def test_fetch_year_pages_through_openfda(monkeypatch):
+	calls = []
+
+	def fake_search(kind, query, limit=100, priority=None, skip=0):
+		calls.append((kind, query, skip))
+		records = [{"decision_date": "2021-02-03"}] * min(limit, 2500 - skip)
+		return {"meta": {"results": {"total": 2500}}, "results": records}
+
+	monkeypatch.setattr(analytics_store.openfda, 'search', fake_search)
+	records = analytics_store.fetch_year('510k', 2021)
+	assert len(records) == 2500
+	assert [skip for _, _, skip in calls] == [0, 1000, 2000]
+	assert calls[0][1] == 'decision_date:[2021-01-01+TO+2021-12-31]'
+
+
+def test_large_year_is_fetched_by_calendar_month(monkeypatch):
+	ranges = []
+
+	def fake_search(kind, query, limit=100, priority=None, skip=0):
+		if query.endswith('20240101+TO+20241231]'):
+			return {"meta": {"results": {"total": 10 ** 6}}, "results": [{}] * limit}
+		ranges.append(query)
+		return {"meta": {"results": {"total": 1}}, "results": [{}]}
+
+	monkeypatch.setattr(analytics_store.openfda, 'search', fake_search)
+	assert len(analytics_store.fetch_year('enforcement', 2024)) == 12
+	assert ranges[1] == 'report_date:[20240201+TO+20240229]'
+	assert ranges[3] == 'report_date:[20240401+TO+20240430]'
+	assert ranges[11] == 'report_date:[20241201+TO+20241231]'
+
+
+def test_group_by_many_distinct_values_stays_sparse(tmp_path):
+	store = AnalyticsStore(str(tmp_path))
+	rows = [{"report_date": f"2021{n % 12 + 1:02d}01", "recalling_firm": f"Firm {n}", "product_code": f"P{n * 7}",
+	         "state": f"S{n * 13}"} for n in range(20000)]
+	store.write_partition('enforcement', 2021, rows)
+	store.write_partition('enforcement', 2022, rows[:10])
+	# 20000^3 combinations: a dense index over them would not fit in memory
+	counts = store.group_by('enforcement', ['firm', 'product_code', 'state'])
+	assert len(counts) == 20000
+	assert counts[("Firm 3", "P21", "S39")] == 2 and counts[("Firm 19999", "P139993", "S259987")] == 1
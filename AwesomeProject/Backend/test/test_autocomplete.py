@@ -0,0 +1,37 @@
+import sqlite3
+
+from autocomplete import Autocomplete, PrefixIndex, APP_DB_QUERIES, terms_from
+
+
+def test_prefix_matches_word_starts_by_weight():
+	index = PrefixIndex({"Pump, Infusion": 40, "Pump, Syringe": 12, "Infusion Set": 25, "Pulse Oximeter": 30,
+	                     "Catheter, Infusion Pump Line": 3})
+	assert [s["text"] for s in index.suggest("pu")] == [
+		"Pump, Infusion", "Pulse Oximeter", "Pump, Syringe", "Catheter, Infusion Pump Line"]
+	assert [s["text"] for s in index.suggest("infusion", limit=2)] == ["Pump, Infusion", "Infusion Set"]
+	assert [s["text"] for s in index.suggest("INFUSION p")] == ["Catheter, Infusion Pump Line"]
+	assert index.suggest("pump s")[0] == {"text": "Pump, Syringe", "weight": 12}
+	assert index.suggest("  ") == [] and index.suggest("zz") == []
+
+
+def test_precomputed_short_prefixes_match_ranking():
+	names = {f"Firm {n} Medical": n % 17 + 1 for n in range(500)}
+	index = PrefixIndex(names, precompute_depth=2)
+	for prefix in ("f", "fi", "m", "me", "1"):
+		assert index.suggest(prefix) == index._rank(prefix, 10)
+
+
+def test_build_merges_spellings_across_sources():
+	con = sqlite3.connect(":memory:")
+	con.execute("CREATE TABLE license (business_name TEXT, corporate_name TEXT, doing_business_as TEXT)")
+	con.executemany("INSERT INTO license VALUES (?, ?, ?)", [
+		("Medtronic", "MEDTRONIC INC", None), ("Medtronic", "Medtronic, Inc.", None), ("Acme", None, "Acme Labs")])
+	typeahead = Autocomplete(lambda: [])
+	# cdph_recall does not exist here and is skipped
+	typeahead.build(list(terms_from(con, APP_DB_QUERIES)) + [("device", "Stent,  Coronary", 5)])
+
+	suggestions = typeahead.suggest("firm", "med")
+	assert [s["text"] for s in suggestions] == ["Medtronic", "MEDTRONIC INC"]
+	assert suggestions[1]["weight"] == 2
+	assert typeahead.suggest("device", "coro") == [{"text": "Stent, Coronary", "weight": 5}]
+	assert typeahead.suggest("product", "a") == []
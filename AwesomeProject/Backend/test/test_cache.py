@@ -0,0 +1,57 @@
+import threading
+import time
+
+from flask import Flask, jsonify, request
+
+from cache import stale_while_revalidate
+
+
+def make_app(soft_ttl, hard_ttl):
+	app = Flask(__name__)
+	calls = []
+	refreshed = threading.Event()
+
+	@app.route("/search", methods=["POST"])
+	@stale_while_revalidate(soft_ttl, hard_ttl)
+	def search():
+		calls.append(request.get_json()["q"])
+		if len(calls) > 1:
+			refreshed.set()
+		if request.get_json()["q"] == "broken":
+			return jsonify({"error": "upstream"}), 500
+		return jsonify({"q": request.get_json()["q"], "call": len(calls)})
+
+	return app, search, calls, refreshed
+
+
+def test_fresh_answers_come_from_cache():
+	app, search, calls, _ = make_app(60, 600)
+	client = app.test_client()
+	first = client.post("/search", json={"q": "pump"})
+	assert first.headers["X-Cache"] == "miss"
+	second = client.post("/search", json={"q": "pump"})
+	assert second.headers["X-Cache"] == "hit" and second.get_json() == first.get_json()
+	assert second.headers["Cache-Control"] == "max-age=60, stale-while-revalidate=540"
+	assert client.post("/search", json={"q": "stent"}).headers["X-Cache"] == "miss"
+	assert calls == ["pump", "stent"]
+
+
+def test_stale_answer_is_served_then_refreshed():
+	app, search, calls, refreshed = make_app(0, 600)
+	client = app.test_client()
+	client.post("/search", json={"q": "pump"})
+	stale = client.post("/search", json={"q": "pump"})
+	assert stale.headers["X-Cache"] == "stale" and stale.get_json()["call"] == 1
+	assert refreshed.wait(2)
+	while search.cache._refreshing:
+		time.sleep(0.01)
+	assert client.post("/search", json={"q": "pump"}).get_json()["call"] == 2
+
+
+def test_errors_are_not_cached():
+	app, search, calls, _ = make_app(60, 600)
+	client = app.test_client()
+	assert client.post("/search", json={"q": "broken"}).status_code == 500
+	response = client.post("/search", json={"q": "broken"})
+	assert response.status_code == 500 and "X-Cache" not in response.headers
+	assert calls == ["broken", "broken"]
@@ -0,0 +1,62 @@
+import random
+from collections import Counter
+from datetime import datetime
+
+from flask import Flask, jsonify, request
+
+from cache import stale_while_revalidate
+from cache_warming import CacheWarmer, CountMinSketch, HeavyHitters, parse_hours
+
+
+def test_sketch_never_undercounts():
+	sketch = CountMinSketch(width=256, depth=4)
+	rng = random.Random(3)
+	truth = Counter(f"term{int(rng.paretovariate(1.2))}" for _ in range(5000))
+	for item, count in truth.items():
+		sketch.add(item, count)
+	assert all(sketch.estimate(item) >= count for item, count in truth.items())
+	assert sketch.estimate("term1") <= truth["term1"] + 2 * 5000 / 256
+
+
+def test_heavy_hitters_find_the_skewed_top():
+	hitters = HeavyHitters(5)
+	rng = random.Random(7)
+	stream = [f"firm{n}" for n in range(5) for _ in range(200)] + [f"rare{rng.randrange(2000)}" for _ in range(3000)]
+	rng.shuffle(stream)
+	for item in stream:
+		hitters.add(item)
+	assert {item for item, _ in hitters.most_common()} == {f"firm{n}" for n in range(5)}
+	hitters.decay()
+	assert all(90 <= count <= 120 for _, count in hitters.most_common())
+
+
+def test_off_peak_hours():
+	assert parse_hours("2-6") == {2, 3, 4, 5}
+	assert parse_hours("22-2") == {22, 23, 0, 1}
+
+
+def test_warming_fills_route_cache_within_budget():
+	app = Flask(__name__)
+	calls = []
+
+	@app.route("/search", methods=["POST"])
+	@stale_while_revalidate(600, 3600)
+	def search():
+		calls.append(request.get_json()["q"])
+		return jsonify({"q": request.get_json()["q"]})
+
+	warmer = CacheWarmer(routes=["/search"], budget=2, hours="2-6", pause=0)
+	warmer.init_app(app)
+	client = app.test_client()
+	for q, n in (("pump", 3), ("stent", 2), ("catheter", 1)):
+		for _ in range(n):
+			client.post("/search", json={"q": q})
+	search.cache.entries._data.clear()
+	calls.clear()
+
+	assert warmer.due(datetime(2024, 5, 1, 3)) and not warmer.due(datetime(2024, 5, 1, 9))
+	assert warmer.run() == {"warmed": 2, "fresh": 0, "failed": 0}
+	assert calls == ["pump", "stent"]
+	# Field order and padding do not matter to the warmed entry
+	assert client.post("/search", json={"q": " pump", "class": ""}).headers["X-Cache"] == "hit"
+	assert warmer.run()["fresh"] == 2
@@ -0,0 +1,42 @@
+from chat import IntentMatcher, ConfluenceClient, CONFLUENCE_PAGES
+
+
+class FakeResponse:
+	content = b"{}"
+
+	def __init__(self, page_id):
+		self.page_id = page_id
+
+	def raise_for_status(self):
+		pass
+
+	def json(self):
+		return {"body": {"storage": {"value": f"<p>page {self.page_id}</p>"}}}
+
+
+class FakeSession:
+	def __init__(self):
+		self.calls = []
+
+	def get(self, url, timeout=None):
+		self.calls.append(url)
+		return FakeResponse(url.rsplit("/", 1)[1].split("?")[0])
+
+
+def test_matcher_follows_keyword_priority():
+	matcher = IntentMatcher(CONFLUENCE_PAGES)
+
+	assert matcher.match("where is the privacy policy?") == "29655042"
+	assert matcher.match("unit testing for the flask api") == "56262659"
+	assert matcher.match("mysql backend or mysql database") == "60391427"
+	assert matcher.match("how do i build .ipa files") == "33325058"
+	assert matcher.match("hello there") is None
+
+
+def test_confluence_pages_are_cached():
+	client = ConfluenceClient("https://wiki.example", "me@example.com", "token")
+	client.session = FakeSession()
+
+	assert client.page("29655042") == "<p>page 29655042</p>"
+	assert client.page("29655042") == "<p>page 29655042</p>"
+	assert client.session.calls == ["https://wiki.example/wiki/rest/api/content/29655042?expand=body.storage"]
@@ -0,0 +1,126 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+import connectors
+from connectors import Connector, CircuitOpen, DeadlineExceeded
+
+
+class FakeResponse:
+	def __init__(self, status_code=200, body="fresh"):
+		self.status_code = status_code
+		self.body = body
+
+
+def failing(timeout):
+	raise requests.ConnectionError("down")
+
+
+def test_breaker_opens_fails_fast_and_recovers(monkeypatch):
+	connector = Connector("demo", timeout=1)
+	connector.breaker.threshold = 3
+	for _ in range(3):
+		with pytest.raises(requests.ConnectionError):
+			connector.call(failing)
+	assert connector.breaker.state == "open"
+
+	calls = []
+	with pytest.raises(CircuitOpen):
+		connector.call(lambda timeout: calls.append(timeout))
+	assert calls == []
+
+	# After the reset time one trial goes through and closes the breaker
+	connector.breaker.opened_at -= connector.breaker.reset_after
+	assert connector.call(lambda timeout: FakeResponse()).body == "fresh"
+	assert connector.breaker.state == "closed"
+
+
+def test_client_errors_do_not_open_the_breaker():
+	connector = Connector("demo", timeout=1)
+	for _ in range(10):
+		assert connector.call(lambda timeout: FakeResponse(404)).status_code == 404
+	assert connector.breaker.state == "closed"
+
+
+def test_stale_copy_served_while_upstream_is_down():
+	connector = Connector("demo", timeout=1)
+	connector.breaker.threshold = 1
+	connectors.set_deadline(None)
+	connector.call(lambda timeout: FakeResponse(body="old"), idempotent=True, key="k")
+
+	assert connector.call(lambda timeout: FakeResponse(503), idempotent=True, key="k").body == "old"
+	assert connector.breaker.state == "open"
+	assert connector.call(failing, idempotent=True, key="k").body == "old"
+	assert connectors.stale_age() is not None
+	with pytest.raises(CircuitOpen):
+		connector.call(failing, idempotent=True, key="other")
+
+
+def test_slow_call_is_hedged():
+	connector = Connector("demo", timeout=5, hedge_after=0.05)
+	calls = []
+	lock = threading.Lock()
+
+	def send(timeout):
+		with lock:
+			calls.append(timeout)
+			first = len(calls) == 1
+		if first:
+			time.sleep(1)
+			return FakeResponse(body="slow")
+		return FakeResponse(body="hedge")
+
+	start = time.perf_counter()
+	assert connector.call(send, idempotent=True).body == "hedge"
+	assert time.perf_counter() - start < 0.5
+	assert len(calls) == 2
+
+
+def test_busy_hedge_pool_does_not_delay_the_first_request(monkeypatch):
+	pool = ThreadPoolExecutor(max_workers=1)
+	release = threading.Event()
+	pool.submit(release.wait, 5)
+	monkeypatch.setattr(connectors, '_hedges', pool)
+	connector = Connector("demo", timeout=5, hedge_after=0.05)
+	try:
+		start = time.perf_counter()
+		assert connector.call(lambda timeout: time.sleep(0.2) or FakeResponse(body="first"), idempotent=True).body == "first"
+		assert time.perf_counter() - start < 1
+	finally:
+		release.set()
+		pool.shutdown()
+
+
+def test_hedge_is_skipped_without_permit():
+	connector = Connector("demo", timeout=5, hedge_after=0.05)
+	calls = []
+
+	def send(timeout):
+		calls.append(timeout)
+		time.sleep(0.2)
+		return FakeResponse(body="slow")
+
+	assert connector.call(send, idempotent=True, hedge_permit=lambda: False).body == "slow"
+	assert len(calls) == 1
+
+
+def test_deadline_caps_timeout_and_stops_calls():
+	connector = Connector("demo", timeout=30)
+	timeouts = []
+	connectors.set_deadline(2)
+	try:
+		connector.call(lambda timeout: timeouts.append(timeout) or FakeResponse())
+		assert timeouts[0] <= 2
+		connectors.set_deadline(0)
+		with pytest.raises(DeadlineExceeded):
+			connector.call(lambda timeout: FakeResponse())
+	finally:
+		connectors.set_deadline(None)
+
+
+def test_redact_hides_secrets(monkeypatch):
+	monkeypatch.setenv("FDA_API_KEY", "s3cret")
+	assert connectors.redact("https://api.fda.gov/?api_key=s3cret") == "https://api.fda.gov/?api_key=<HIDDEN>"
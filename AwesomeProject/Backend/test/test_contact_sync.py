@@ -0,0 +1,49 @@
+import sqlite3
+
+import openpyxl
+
+from contact_sync import read_contacts, sync_contacts
+
+
+def _contacts(con):
+	return con.execute("SELECT County, Name, Phone FROM contact ORDER BY County").fetchall()
+
+
+def test_sync_applies_only_the_differences(tmp_path):
+	con = sqlite3.connect(str(tmp_path / "contact_info.db"))
+	first = [
+		('Alameda', 'Pamela Price', 'Oakland', '(510) 272-6222', None, None),
+		('Alpine', 'Robert Priscaro', 'Markleeville', '(530) 694-2971', None, None),
+	]
+	assert sync_contacts(con, first) == {'inserted': 2, 'updated': 0, 'deleted': 0}
+	assert sync_contacts(con, first) == {'inserted': 0, 'updated': 0, 'deleted': 0}
+
+	second = [
+		('Alameda', 'Ursula Jones Dickson', 'Oakland', '(510) 272-6222', None, None),
+		('Amador', 'Todd Riebe', 'Jackson', '(209) 223-6444', None, None),
+	]
+	assert sync_contacts(con, second) == {'inserted': 1, 'updated': 1, 'deleted': 1}
+	assert _contacts(con) == [('Alameda', 'Ursula Jones Dickson', '(510) 272-6222'),
+							  ('Amador', 'Todd Riebe', '(209) 223-6444')]
+
+
+def test_sync_without_prune_keeps_other_counties(tmp_path):
+	con = sqlite3.connect(str(tmp_path / "contact_info.db"))
+	sync_contacts(con, [('Alpine', 'Robert Priscaro', None, None, None, None)])
+
+	changes = sync_contacts(con, [('Amador', 'Todd Riebe', None, None, None, None)], prune=False)
+
+	assert changes == {'inserted': 1, 'updated': 0, 'deleted': 0}
+	assert [row[0] for row in _contacts(con)] == ['Alpine', 'Amador']
+
+
+def test_read_contacts_strips_xlsx_cells(tmp_path):
+	path = str(tmp_path / "contacts.xlsx")
+	workbook = openpyxl.Workbook()
+	workbook.active.append(['County', 'Name', 'Address', 'Phone', 'Fax', 'Link to Website'])
+	workbook.active.append([' Alameda ', 'Pamela Price ', 'Oakland', '(510) 272-6222', '', 'https://www.alcoda.org/'])
+	workbook.active.append([None, None, None, None, None, None])
+	workbook.save(path)
+
+	assert read_contacts(path) == [
+		('Alameda', 'Pamela Price', 'Oakland', '(510) 272-6222', None, 'https://www.alcoda.org/')]
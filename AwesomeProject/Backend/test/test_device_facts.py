@@ -0,0 +1,42 @@
+from device_facts import DeviceFacts
+
+
+BLOB = {"device_name": "Pump, Infusion", "device_class": "2", "regulation_number": "880.5725",
+        "medical_specialty_description": "General Hospital",
+        "registration_number": ["111", "222", "333"], "fei_number": ["9111", "9222", "9333"]}
+
+
+def test_records_share_product_code_dimension(tmp_path):
+	facts = DeviceFacts(str(tmp_path / "index.db"))
+	facts.add('k510', [
+		{"k_number": "K1", "product_code": "FRN", "decision_date": "2020-05-01", "applicant": "Acme", "openfda": BLOB},
+		{"k_number": "K2", "product_code": "FRN", "decision_date": "2021-07-09", "applicant": "Acme", "openfda": BLOB},
+	])
+	facts.add('recall', [{"recall_number": "Z-1-2022", "product_code": "FRN", "report_date": "20220302",
+	                      "classification": "Class II"}])
+	facts.add('maude', [{"mdr_report_key": "77", "date_received": "20230101", "event_type": "Malfunction",
+	                     "device": [{"device_report_product_code": "FRN", "brand_name": "Flow"},
+	                                {"device_report_product_code": "DZE", "brand_name": "Other"}]}])
+
+	con = facts.db.connection()
+	assert con.execute('SELECT count(*) FROM product_code_dim').fetchone()[0] == 2
+	assert con.execute('SELECT count(*) FROM registration_dim').fetchone()[0] == 3
+
+	activity = facts.activity('FRN', limit=1)
+	assert activity["deviceName"] == "Pump, Infusion" and activity["registrations"] == 3
+	assert activity["counts"] == {"k510": 2, "recalls": 1, "maude": 1}
+	assert [row["k_number"] for row in activity["k510"]] == ["K2"]
+	assert activity["k510"][0]["decision_date"] == "2021-07-09"
+	assert activity["recalls"][0]["classification"] == "Class II"
+	assert facts.activity('XXX') is None
+
+
+def test_blob_arriving_later_fills_dimension_and_reloads_replace(tmp_path):
+	facts = DeviceFacts(str(tmp_path / "index.db"))
+	facts.add('recall', [{"recall_number": "Z-1", "product_code": "FRN", "status": "Ongoing"}])
+	assert facts.activity('FRN')["deviceName"] is None
+
+	facts.add('recall', [{"recall_number": "Z-1", "product_code": "FRN", "status": "Terminated", "openfda": BLOB}])
+	activity = facts.activity('FRN')
+	assert activity["deviceName"] == "Pump, Infusion" and activity["registrations"] == 3
+	assert [row["status"] for row in activity["recalls"]] == ["Terminated"]
@@ -0,0 +1,53 @@
+from firm_index import FirmIndex, canonical_key
+
+
+def test_canonical_key_strips_suffixes_and_punctuation():
+	assert canonical_key("Medtronic, Inc.") == "medtronic"
+	assert canonical_key("MEDTRONIC MINIMED INC") == "medtronic"
+	assert canonical_key("Johnson & Johnson Co.") == "johnson and johnson"
+	assert canonical_key("Acme Mfg. L.L.C. dba Acme Pumps") == "acme manufacturing"
+	assert canonical_key("The Cooper Companies") == "cooper companies"
+
+
+def test_sources_map_onto_one_firm(tmp_path):
+	index = FirmIndex(str(tmp_path / "index.db"))
+	recall, = index.add_many(["Boston Scientific Corporation"], "enforcement")
+	applicant, = index.add_many(["BOSTON SCIENTIFIC CORP."], "510k")
+	typo, = index.add_many(["Boston Scientifc Corp"], "warning_letter")
+	other, = index.add_many(["Abbott Laboratories"], "license")
+
+	assert recall == applicant == typo
+	assert other != recall
+	assert index.resolve("boston scientific") == recall
+	assert index.aliases(recall) == {
+		"510k": ["BOSTON SCIENTIFIC CORP."],
+		"enforcement": ["Boston Scientific Corporation"],
+		"warning_letter": ["Boston Scientifc Corp"],
+	}
+
+
+def test_numbered_firms_stay_separate():
+	index = FirmIndex(None)
+	first, second = index.add_many(["Acme Medical Systems 1 LLC", "Acme Medical Systems 2 LLC"], "license")
+	assert first != second
+
+
+def test_load_restores_firm_ids(tmp_path):
+	path = str(tmp_path / "index.db")
+	firm_id = FirmIndex(path).add("Stryker Corporation", "enforcement")
+
+	reloaded = FirmIndex(path)
+	reloaded.load()
+	assert reloaded.resolve("STRYKER CORP") == firm_id
+	assert reloaded.add("Stryker Corp.", "510k") == firm_id
+
+
+def test_names_added_before_load_reuse_persisted_firms(tmp_path):
+	path = str(tmp_path / "index.db")
+	firm_id = FirmIndex(path).add("Baxter Healthcare Corporation", "enforcement")
+
+	restarted = FirmIndex(path)
+	# A request adds a name before the background load has run
+	assert restarted.add("BAXTER HEALTHCARE CORP", "510k") == firm_id
+	restarted.load()
+	assert len(restarted) == 1
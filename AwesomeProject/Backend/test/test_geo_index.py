@@ -0,0 +1,50 @@
+import sqlite3
+
+import pytest
+
+import geo_index
+
+
+CENTROIDS = "zip,lat,lon\n95814,38.5804,-121.4922\n94612,37.8085,-122.2708\n90012,34.0614,-118.2385\n"
+GAZETTEER = "GEOID\tALAND\tAWATER\tALAND_SQMI\tAWATER_SQMI\tINTPTLAT\tINTPTLONG\n95814\t1\t0\t0\t0\t38.5804\t-121.4922\n"
+
+
+@pytest.fixture
+def con(tmp_path):
+	con = sqlite3.connect(":memory:")
+	con.execute("CREATE TABLE license (license_address_id INTEGER PRIMARY KEY, zip TEXT)")
+	con.execute("CREATE TABLE contact (id INTEGER PRIMARY KEY, address TEXT)")
+	con.executemany("INSERT INTO license VALUES (?, ?)", [(1, "95814"), (2, "94612-1234"), (3, "90012"), (4, "")])
+	con.executemany("INSERT INTO contact VALUES (?, ?)", [
+		(1, "901 G Street Sacramento, CA 95814"), (2, "1225 Fallon Street, Room 900 Oakland, CA 94612"),
+		(3, "210 W. Temple St. Los Angeles, CA 90012")])
+	path = tmp_path / "zip_centroids.csv"
+	path.write_text(CENTROIDS)
+	assert geo_index.init_geo(con, str(path)) == {"license": 3, "contact": 3}
+	return con
+
+
+def test_reads_census_gazetteer_format(tmp_path):
+	path = tmp_path / "gaz.txt"
+	path.write_text(GAZETTEER)
+	assert geo_index.read_zip_centroids(str(path)) == {"95814": (38.5804, -121.4922)}
+
+
+def test_within_radius_nearest_first(con):
+	# Sacramento to Oakland is about 70 miles
+	assert geo_index.within(con, 'license', 38.58, -121.49, 10) == [(1, pytest.approx(0.1, abs=0.1))]
+	found = geo_index.within(con, 'license', 38.58, -121.49, 100)
+	assert [row_id for row_id, _ in found] == [1, 2]
+	assert 60 < found[1][1] < 80
+
+
+def test_nearest_widens_the_search(con):
+	# Fresno: Oakland and Sacramento are both 140+ miles away, Los Angeles further
+	assert [row_id for row_id, _ in geo_index.nearest(con, 'contact', 36.74, -119.79, k=1)] == [2]
+	assert [row_id for row_id, _ in geo_index.nearest(con, 'contact', 36.74, -119.79, k=3)] == [2, 1, 3]
+
+
+def test_new_rows_are_placed_incrementally(con):
+	con.execute("INSERT INTO license (license_address_id, zip) VALUES (5, '90012')")
+	assert geo_index.geocode(con, 'license') == 1
+	assert {row_id for row_id, _ in geo_index.within(con, 'license', 34.06, -118.24, 5)} == {3, 5}
@@ -0,0 +1,65 @@
+import random
+
+import cv2
+import numpy as np
+
+from image_cache import BKTree, PerceptualCache, hamming, phash, dhash, image_size, normalize_boxes, scale_boxes
+
+
+def _photo(seed):
+	rng = np.random.RandomState(seed)
+	small = rng.randint(0, 256, size=(24, 32, 3), dtype=np.uint8)
+	return cv2.resize(small, (1280, 960), interpolation=cv2.INTER_CUBIC)
+
+
+def _jpeg(image, quality=90):
+	ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+	return buffer.tobytes()
+
+
+def test_bk_tree_search_matches_brute_force():
+	rng = random.Random(3)
+	values = [rng.getrandbits(64) for _ in range(500)]
+	tree = BKTree()
+	for value in values:
+		tree.add(value)
+	for value in values[:100]:
+		tree.remove(value)
+	live = values[100:]
+
+	for query in [rng.getrandbits(64) for _ in range(20)] + live[:5]:
+		expected = sorted((hamming(query, v), v) for v in live if hamming(query, v) <= 24)
+		assert tree.search(query, 24) == expected
+
+
+def test_near_duplicate_photos_share_a_hash_neighbourhood():
+	original = _photo(1)
+	recompressed = _jpeg(cv2.resize(original, (1000, 750)), quality=60)
+	other = _jpeg(_photo(2))
+
+	for image_hash in (phash, dhash):
+		assert hamming(image_hash(_jpeg(original)), image_hash(recompressed)) <= 4
+		assert hamming(image_hash(_jpeg(original)), image_hash(other)) > 10
+
+
+def test_cache_returns_nearest_entry_and_evicts_oldest():
+	cache = PerceptualCache(max_distance=2, ttl=60, maxsize=2)
+	cache.set(0b0000, 'a')
+	cache.set(0b1111 << 8, 'b')
+
+	assert cache.get(0b0001) == 'a'
+	assert cache.get(0b111 << 20) is None
+
+	cache.set(0b1111 << 16, 'c')  # evicts 'b', the least recently used
+	assert cache.get(0b1111 << 8) is None
+	assert cache.get(0b0000) == 'a'
+	assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_cached_boxes_follow_the_upload_size():
+	found = [{"label": "pump", "confidence": 0.9, "box": [400.0, 300.0, 800.0, 600.0]}]
+	fractions = normalize_boxes(found, (1600, 1200))
+	assert fractions[0]["box"] == [0.25, 0.25, 0.5, 0.5]
+	# The same photo uploaded at half size
+	assert scale_boxes(fractions, (800, 600)) == [{"label": "pump", "confidence": 0.9, "box": [200.0, 150.0, 400.0, 300.0]}]
+	assert image_size(_jpeg(np.zeros((60, 80, 3), dtype=np.uint8))) == (80, 60)
@@ -0,0 +1,88 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from inference import InferenceService, QueueFull, InferenceTimeout, decode_image
+
+
+def _sleep_and_echo(seconds, value):
+	time.sleep(seconds)
+	return value
+
+
+_held = threading.Lock()
+
+
+def _held_lock_is_free():
+	if _held.acquire(timeout=1):
+		_held.release()
+		return True
+	return False
+
+
+def test_workers_do_not_inherit_locks_held_by_other_threads():
+	service = InferenceService(task=_held_lock_is_free, initializer=None, workers=1, queue_size=2, timeout=30)
+	release = threading.Event()
+	holder = threading.Thread(target=lambda: _held.acquire() and release.wait(30))
+	holder.start()
+	try:
+		service.start()
+		assert service.predict() is True
+	finally:
+		release.set()
+		holder.join()
+		_held.release()
+		service.shutdown()
+
+
+def test_service_returns_worker_result():
+	service = InferenceService(task=_sleep_and_echo, initializer=None, workers=1, queue_size=2, timeout=30)
+	try:
+		assert service.predict(0, 'done') == 'done'
+	finally:
+		service.shutdown()
+
+
+def test_full_queue_is_refused_and_slots_are_released():
+	service = InferenceService(task=_sleep_and_echo, initializer=None, workers=1, queue_size=2, timeout=30)
+	try:
+		futures = [service.submit(0.5, n) for n in range(2)]
+		with pytest.raises(QueueFull):
+			service.submit(0, 'extra')
+
+		assert [f.result(timeout=30) for f in futures] == [0, 1]
+		# Slots are released by a done callback that may run just after result()
+		deadline = time.time() + 5
+		while True:
+			try:
+				assert service.predict(0, 'again') == 'again'
+				break
+			except QueueFull:
+				assert time.time() < deadline
+				time.sleep(0.01)
+	finally:
+		service.shutdown()
+
+
+def test_slow_task_times_out():
+	service = InferenceService(task=_sleep_and_echo, initializer=None, workers=1, queue_size=2, timeout=0.2)
+	try:
+		with pytest.raises(InferenceTimeout):
+			service.predict(2, 'late')
+	finally:
+		service.shutdown()
+
+
+def test_decode_shrinks_large_photos_to_model_size():
+	photo = np.zeros((3024, 4032, 3), dtype=np.uint8)
+	photo[:, :2016] = (255, 0, 0)  # left half blue in BGR
+	ok, buffer = cv2.imencode('.jpg', photo)
+
+	image, scale = decode_image(buffer.tobytes(), target=640)
+
+	assert image.shape == (480, 640, 3)
+	assert scale == pytest.approx(4032 / 640)
+	assert image[240, 100, 0] > 200 and image[240, 100, 2] < 50
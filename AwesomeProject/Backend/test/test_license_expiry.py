@@ -0,0 +1,66 @@
+import sqlite3
+from datetime import date, datetime
+
+import license_expiry
+
+
+TODAY = date(2025, 1, 1)
+
+
+def stored(day):
+	return datetime.strptime(day, '%Y-%m-%d').strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def make_db():
+	con = sqlite3.connect(":memory:")
+	con.execute("CREATE TABLE license (license_address_id INTEGER PRIMARY KEY, expiration_date DATETIME, "
+	            "county_code TEXT, license_status_code TEXT)")
+	con.executemany("INSERT INTO license VALUES (?, ?, ?, ?)", [
+		(1, stored("2024-12-31"), "SAC", "A"),  # already expired
+		(2, stored("2025-01-01"), "SAC", "A"),
+		(3, stored("2025-01-31"), "SAC", "B"),  # last day of the 30-day window
+		(4, stored("2025-02-01"), "ALA", "A"),
+		(5, stored("2025-03-15"), "ALA", "A"),
+		(6, stored("2025-06-01"), "ALA", "A"),  # beyond every window
+	])
+	license_expiry.init_expiry(con, 0)
+	return con
+
+
+def test_windows_are_counted_per_county():
+	con = make_db()
+	out = license_expiry.summary(con, 0, today=TODAY)
+	assert out["asOf"] == "2025-01-01" and out["windows"] == [30, 60, 90]
+	assert out["counties"] == {"SAC": {"30": 2, "60": 2, "90": 2}, "ALA": {"30": 0, "60": 1, "90": 2}}
+	assert license_expiry.summary(con, 0, county="SAC", status="B", today=TODAY)["counties"] == {
+		"SAC": {"30": 1, "60": 1, "90": 1}}
+
+
+def test_rollup_rebuilds_only_when_stale():
+	con = make_db()
+	assert license_expiry.refresh_rollup(con, 1, TODAY)
+	assert not license_expiry.refresh_rollup(con, 1, TODAY)
+	con.execute("INSERT INTO license VALUES (7, ?, 'SAC', 'A')", (stored("2025-01-10"),))
+	assert license_expiry.refresh_rollup(con, 2, TODAY)
+	assert license_expiry.summary(con, 2, county="SAC", today=TODAY)["counties"]["SAC"]["30"] == 3
+	# The next day the window moves on
+	assert license_expiry.refresh_rollup(con, 2, date(2025, 1, 2))
+
+
+def test_range_query_uses_covering_index():
+	con = make_db()
+	start, end = license_expiry.window_bounds(30, TODAY)
+	plan = " ".join(row[-1] for row in con.execute(
+		"EXPLAIN QUERY PLAN SELECT county_code, count(*) FROM license "
+		"WHERE expiration_date >= ? AND expiration_date < ? GROUP BY county_code",
+		(license_expiry._stored(start), license_expiry._stored(end))))
+	assert "COVERING INDEX license_expiration_county_status" in plan
+	assert license_expiry.parse_day("2025-13-01") is None
+
+
+def test_window_stops_at_the_last_representable_day():
+	start, end = license_expiry.window_bounds(30, date(2025, 1, 1))
+	assert (start, end) == (datetime(2025, 1, 1), datetime(2025, 2, 1))
+	first = date(9999, 12, 1)
+	start, end = license_expiry.window_bounds((date(9999, 12, 31) - first).days, first)
+	assert end == datetime(9999, 12, 31)
@@ -0,0 +1,45 @@
+import pytest
+import requests
+from flask import Flask
+
+import metrics
+
+
+def test_histogram_renders_cumulative_buckets():
+	histogram = metrics.Histogram('demo_seconds', 'Demo', ('route',), buckets=(0.1, 1))
+	histogram.observe(0.05, route='/')
+	histogram.observe(0.5, route='/')
+	histogram.observe(5, route='/')
+
+	lines = histogram.render()
+	assert 'demo_seconds_bucket{route="/",le="0.1"} 1' in lines
+	assert 'demo_seconds_bucket{route="/",le="1"} 2' in lines
+	assert 'demo_seconds_bucket{route="/",le="+Inf"} 3' in lines
+	assert 'demo_seconds_count{route="/"} 3' in lines
+
+
+def test_track_upstream_counts_timeouts():
+	before = metrics.upstream_errors.value(upstream='demo', kind='timeout')
+	with pytest.raises(requests.Timeout):
+		with metrics.track_upstream('demo'):
+			raise requests.Timeout()
+
+	assert metrics.upstream_errors.value(upstream='demo', kind='timeout') == before + 1
+	assert metrics.upstream_in_flight.value(upstream='demo') == 0
+
+
+def test_metrics_endpoint_reports_routes():
+	app = Flask(__name__)
+	metrics.init_app(app)
+
+	@app.route('/ping')
+	def ping():
+		return 'pong'
+
+	client = app.test_client()
+	client.get('/ping')
+	body = client.get('/metrics').get_data(as_text=True)
+
+	assert 'http_request_duration_seconds_count{route="/ping",method="GET",status="200"} 1' in body
+	assert 'http_response_bytes_count{route="/ping"} 1' in body
+	assert 'http_requests_in_flight{route="/ping"} 0' in body
@@ -0,0 +1,110 @@
+import threading
+import time
+
+import pytest
+import requests
+
+import connectors
+import openfda
+from rate_limit import TokenBucketLimiter
+
+
+@pytest.fixture(autouse=True)
+def limiter(tmp_path, monkeypatch):
+	limiter = TokenBucketLimiter('openfda', [(240, 60)], path=str(tmp_path / "rate_limit.db"))
+	monkeypatch.setattr(openfda, 'openfda_limiter', limiter)
+	return limiter
+
+
+class FakeResponse:
+	def __init__(self, payload, status_code=200):
+		self.payload = payload
+		self.status_code = status_code
+		self.content = b"{}"
+
+	def json(self):
+		return self.payload
+
+	def raise_for_status(self):
+		if self.status_code >= 400:
+			raise requests.HTTPError(f"{self.status_code} Error", response=self)
+
+
+def test_batch_merges_lookups_and_dedupes_searches(monkeypatch):
+	urls = []
+	lock = threading.Lock()
+
+	def fake_get(url, **kwargs):
+		with lock:
+			urls.append(url)
+		if 'k_number' in url:
+			return FakeResponse({"results": [{"k_number": "K123456"}, {"k_number": "K654321"}]})
+		if 'pump' in url:
+			return FakeResponse({"results": [{"device_name": "Infusion pump"}]})
+		return FakeResponse({"error": {"code": "NOT_FOUND"}}, status_code=404)
+
+	monkeypatch.setenv('FDA_API_KEY', 'secret')
+	monkeypatch.setattr(openfda.requests, 'get', fake_get)
+
+	results = openfda.run_batch([
+		('k510', {"k510Number": "K123456"}),
+		('k510', {"k510Number": "k654321"}),
+		('k510', {"k510Number": "K000000"}),
+		('k510', {"deviceName": "pump"}),
+		('k510', {"deviceName": "pump"}),
+		('maude', {"deviceName": "catheter"}),
+		('maude', {}),
+	])
+
+	assert len(urls) == 3  # one OR query, one device search, one Maude search
+	assert results[0] == {"results": [{"k_number": "K123456"}]}
+	assert results[1] == {"results": [{"k_number": "K654321"}]}
+	assert results[2] == {"results": []}
+	assert results[3] == results[4] == {"results": [{"device_name": "Infusion pump"}]}
+	assert results[5] == {"results": []}
+	assert "error" in results[6]
+
+
+def test_batch_hides_api_key_in_errors(monkeypatch):
+	def fake_get(url, **kwargs):
+		raise requests.ConnectionError(f"cannot reach {url}")
+
+	monkeypatch.setenv('FDA_API_KEY', 'secret')
+	monkeypatch.setattr(openfda.requests, 'get', fake_get)
+
+	result, = openfda.run_batch([('recall', {"productDescription": "stent"})])
+	assert "secret" not in result["details"]
+
+
+def test_batch_searches_keep_the_request_deadline(monkeypatch):
+	urls = []
+	monkeypatch.setattr(openfda.requests, 'get', lambda url, **kwargs: urls.append(url) or FakeResponse({"results": []}))
+	connectors.set_deadline(0)
+	try:
+		result, = openfda.run_batch([('maude', {"deviceName": "ventilator"})])
+	finally:
+		connectors.set_deadline(None)
+	assert urls == [] and "error" in result
+
+
+def test_batch_waits_for_tokens_only_until_the_deadline(monkeypatch, limiter):
+	monkeypatch.setattr(openfda.requests, 'get', lambda url, **kwargs: FakeResponse({"results": []}))
+	limiter.drain()
+	connectors.set_deadline(0.5)
+	start = time.monotonic()
+	try:
+		result, = openfda.run_batch([('maude', {"deviceName": "infusion pump"})])
+	finally:
+		connectors.set_deadline(None)
+	assert time.monotonic() - start < 0.5
+	assert result["error"] == "openFDA rate limit reached"
+
+
+def test_search_backs_off_and_retries_on_429(monkeypatch, limiter):
+	responses = [FakeResponse({}, status_code=429), FakeResponse({"results": [{"k_number": "K1"}]})]
+	monkeypatch.setenv('FDA_API_KEY', 'secret')
+	monkeypatch.setattr(openfda.requests, 'get', lambda url, **kwargs: responses.pop(0))
+	monkeypatch.setattr(limiter, 'limits', [(1000, 1)])
+
+	assert openfda.search('k510', 'k_number.exact:"K1"') == {"results": [{"k_number": "K1"}]}
+	assert not responses
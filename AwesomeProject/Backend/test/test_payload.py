@@ -0,0 +1,99 @@
+import gzip
+import json
+
+import pytest
+from flask import Flask, jsonify
+
+import payload
+from payload import parse_fields, project, choose_encoding
+
+
+RECORDS = {"meta": {"total": 2}, "results": [
+	{"k_number": "K1", "applicant": "Acme", "openfda": {"device_name": "Pump", "fei_number": ["1"]}},
+	{"k_number": "K2", "applicant": "Zeta", "openfda": {"device_name": "Stent", "fei_number": ["2"]}},
+]}
+
+
+def make_app(provider=None):
+	app = Flask(__name__)
+	payload.init_app(app)
+	if provider is not None:
+		app.json = provider(app)
+
+	@app.route('/records')
+	def records():
+		return jsonify(RECORDS)
+
+	@app.route('/large')
+	def large():
+		return jsonify({"results": [RECORDS["results"][0]] * 100})
+
+	@app.route('/broken')
+	def broken():
+		return jsonify({"error": "Failed", "details": "upstream"}), 500
+
+	return app
+
+
+def test_project_keeps_named_fields_through_lists():
+	assert parse_fields('results.k_number, results.openfda.device_name,meta') == {
+		"results": {"k_number": {}, "openfda": {"device_name": {}}}, "meta": {}}
+	projected = project(RECORDS, parse_fields('results.k_number,results.openfda.device_name'))
+	assert projected == {"results": [
+		{"k_number": "K1", "openfda": {"device_name": "Pump"}},
+		{"k_number": "K2", "openfda": {"device_name": "Stent"}},
+	]}
+
+
+def test_fields_query_projects_json_responses_but_not_errors():
+	client = make_app().test_client()
+	assert client.get('/records?fields=meta').get_json() == {"meta": {"total": 2}}
+	assert client.get('/broken?fields=meta').get_json() == {"error": "Failed", "details": "upstream"}
+
+
+def test_choose_encoding_honours_quality_and_preference(monkeypatch):
+	monkeypatch.setattr(payload, 'brotli', None)
+	monkeypatch.setattr(payload, 'zstandard', None)
+	assert choose_encoding('gzip, deflate') == 'gzip'
+	assert choose_encoding('gzip;q=0, identity') is None
+	assert choose_encoding('*') == 'gzip'
+	assert choose_encoding(None) is None
+
+	monkeypatch.setattr(payload, 'brotli', object())
+	monkeypatch.setattr(payload, 'zstandard', object())
+	assert choose_encoding('gzip, br, zstd') == 'zstd'
+	assert choose_encoding('gzip;q=1, br;q=0.5') == 'gzip'
+
+
+def test_large_responses_are_compressed_small_ones_are_not():
+	client = make_app().test_client()
+
+	response = client.get('/large', headers={'Accept-Encoding': 'gzip'})
+	assert response.headers['Content-Encoding'] == 'gzip'
+	assert 'Accept-Encoding' in response.headers['Vary']
+	assert json.loads(gzip.decompress(response.data))["results"][0]["k_number"] == "K1"
+
+	response = client.get('/records', headers={'Accept-Encoding': 'gzip'})
+	assert 'Content-Encoding' not in response.headers
+	assert response.get_json() == RECORDS
+
+	response = client.get('/large')
+	assert 'Content-Encoding' not in response.headers
+
+
+@pytest.mark.skipif(payload.orjson is None, reason="orjson is not installed")
+def test_orjson_provider_writes_non_ascii_as_utf8():
+	app = make_app()
+	fast = payload.OrjsonProvider(app)
+	firm = {"applicant": "Dräger Medical", "city": "Lübeck"}
+	with app.app_context():
+		assert app.json.dumps(firm) == '{"applicant": "Dr\\u00e4ger Medical", "city": "L\\u00fcbeck"}'
+		assert fast.dumps(firm) == '{"applicant":"Dräger Medical","city":"Lübeck"}'
+		assert json.loads(fast.dumps(firm)) == json.loads(app.json.dumps(firm))
+
+
+def test_orjson_provider_matches_default_output():
+	default = make_app().test_client().get('/records?fields=results.k_number,meta')
+	fast = make_app(payload.OrjsonProvider).test_client().get('/records?fields=results.k_number,meta')
+	assert fast.data == default.data
+	assert fast.mimetype == 'application/json'
@@ -0,0 +1,33 @@
+import pytest
+
+from rate_limit import TokenBucketLimiter, RateLimitExceeded, INTERACTIVE, BATCH
+
+
+def test_bucket_is_shared_through_the_database(tmp_path):
+	path = str(tmp_path / "rate_limit.db")
+	first = TokenBucketLimiter('demo', [(5, 60)], path=path)
+	second = TokenBucketLimiter('demo', [(5, 60)], path=path)
+
+	for limiter in (first, second, first, second, first):
+		assert limiter.acquire(max_wait=0) == pytest.approx(0, abs=0.05)
+	with pytest.raises(RateLimitExceeded) as excinfo:
+		second.acquire(max_wait=1)
+	assert excinfo.value.retry_after == pytest.approx(12, abs=0.5)
+
+
+def test_batch_leaves_a_reserve_for_interactive_calls(tmp_path):
+	limiter = TokenBucketLimiter('demo', [(8, 60), (1000, 86400)], path=str(tmp_path / "rate_limit.db"),
+								 batch_reserve=0.5)
+	for _ in range(4):
+		limiter.acquire(BATCH, max_wait=0)
+	with pytest.raises(RateLimitExceeded):
+		limiter.acquire(BATCH, max_wait=0)
+	for _ in range(4):
+		limiter.acquire(INTERACTIVE, max_wait=0)
+
+
+def test_short_waits_are_queued_rather_than_refused(tmp_path):
+	limiter = TokenBucketLimiter('demo', [(20, 1)], path=str(tmp_path / "rate_limit.db"))
+	for _ in range(20):
+		limiter.acquire(max_wait=0)
+	assert 0.02 < limiter.acquire(max_wait=1) < 0.5
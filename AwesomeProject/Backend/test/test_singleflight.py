@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+
+import singleflight
+from singleflight import SingleFlight, request_key
+
+
+class FakeResponse:
+	status_code = 200
+	content = b'{"results": []}'
+
+	def json(self):
+		return {"results": []}
+
+	def raise_for_status(self):
+		pass
+
+
+def test_hundred_concurrent_identical_requests_make_one_upstream_call(monkeypatch):
+	calls = []
+
+	def fake_request(method, url, **kwargs):
+		calls.append(url)
+		time.sleep(0.2)
+		return FakeResponse()
+
+	monkeypatch.setattr(singleflight.requests, 'request', fake_request)
+	start = threading.Barrier(100)
+	responses = []
+
+	def client(n):
+		start.wait()
+		# Same request, with parameters and body keys in a different order
+		params = {"search": "heart", "limit": 100} if n % 2 else {"limit": 100, "search": "heart"}
+		body = {"a": 1, "b": 2} if n % 2 else {"b": 2, "a": 1}
+		responses.append(singleflight.fetch('demo', 'POST', 'https://example.com/api', params=params, json=body))
+
+	threads = [threading.Thread(target=client, args=(n,)) for n in range(100)]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+
+	assert len(calls) == 1
+	assert len(responses) == 100 and all(r is responses[0] for r in responses)
+
+
+def test_waiting_callers_share_the_error():
+	flights = SingleFlight()
+	started = threading.Event()
+	errors = []
+
+	def failing():
+		started.set()
+		time.sleep(0.1)
+		raise ValueError("upstream down")
+
+	def follower():
+		started.wait()
+		try:
+			flights.do('key', lambda: 'not called')
+		except ValueError as e:
+			errors.append(e)
+
+	thread = threading.Thread(target=follower)
+	thread.start()
+	with pytest.raises(ValueError):
+		flights.do('key', failing)
+	thread.join()
+
+	assert len(errors) == 1
+	# Nothing stays in flight, so the next call runs again
+	assert flights.do('key', lambda: 'fresh') == 'fresh'
+
+
+def test_request_key_distinguishes_different_queries():
+	assert request_key('get', 'HTTPS://API.FDA.GOV/x?b=2&a=1') == request_key('GET', 'https://api.fda.gov/x?a=1&b=2')
+	assert request_key('GET', 'https://api.fda.gov/x?a=1') != request_key('GET', 'https://api.fda.gov/x?a=2')
+	assert request_key('POST', 'https://x', json_body={"a": 1}) != request_key('POST', 'https://x', json_body={"a": 2})
+
+
+def test_request_key_accepts_form_bodies():
+	key = request_key('POST', 'https://x', data={"b": "2", "a": ["1", "3"]})
+	assert hash(key) == hash(request_key('POST', 'https://x', data=[("a", "1"), ("b", "2"), ("a", "3")]))
+	assert key[2] == "a=1&a=3&b=2"
+	assert request_key('POST', 'https://x', data={"a": "1"}) != request_key('POST', 'https://x', data={"a": "2"})
+	assert request_key('POST', 'https://x', data=b"raw")[2] == b"raw"
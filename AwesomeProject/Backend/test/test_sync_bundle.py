@@ -0,0 +1,87 @@
+import gzip
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import pytest
+
+import sync_bundle
+from sync_bundle import SyncBundle, ChangesPruned
+
+
+PAGE = """<a href="/Programs/Page1.aspx">Home</a>
+<a href="/Programs/CEH/DFDCS/CDPH%20Document%20Library/FDB/Recalls/Pump.pdf">Acme Infusion Pump</a>
+<a href="https://www.cdph.ca.gov/Programs/CEH/DFDCS/CDPH%20Document%20Library/FDB/Recalls/Stent.pdf">Stent</a>"""
+
+
+@pytest.fixture
+def bundle(tmp_path):
+	path = str(tmp_path / "app.db")
+	con = sqlite3.connect(path)
+	con.execute("CREATE TABLE contact (id INTEGER PRIMARY KEY, county TEXT, address TEXT)")
+	con.execute("CREATE TABLE license (license_address_id INTEGER PRIMARY KEY, business_name TEXT)")
+	con.executemany("INSERT INTO contact VALUES (?, ?, ?)", [(1, "Alameda", "Oakland"), (2, "Yolo", "Woodland")])
+	con.commit()
+	con.close()
+
+	@contextmanager
+	def connect():
+		con = sqlite3.connect(path)
+		try:
+			yield con
+		finally:
+			con.close()
+
+	bundle = SyncBundle(connect, fetch_cdph=lambda: PAGE, base_url="https://www.cdph.ca.gov")
+	bundle.install()
+	return bundle
+
+
+def test_snapshot_then_changes(bundle):
+	first = bundle.snapshot()
+	document = json.loads(gzip.decompress(first.gzipped))
+	assert document["tables"]["contact"]["rows"] == [[1, "Alameda", "Oakland"], [2, "Yolo", "Woodland"]]
+	assert bundle.snapshot() is first
+
+	with bundle.connect() as con:
+		con.execute("UPDATE contact SET address = 'Oakland' WHERE id = 1")  # unchanged, not logged
+		con.execute("UPDATE contact SET address = 'Davis' WHERE id = 2")
+		con.execute("UPDATE contact SET address = 'Woodland' WHERE id = 2")
+		con.execute("DELETE FROM contact WHERE id = 1")
+		con.execute("INSERT INTO license VALUES (7, 'Acme')")
+		con.commit()
+
+	delta = bundle.changes(first.version)
+	assert delta["changes"]["contact"] == {"columns": ["id", "county", "address"],
+	                                       "upserts": [[2, "Yolo", "Woodland"]], "deletes": [1]}
+	assert delta["changes"]["license"]["upserts"] == [[7, "Acme"]]
+	assert bundle.changes(delta["version"]) == {"version": delta["version"], "changes": {}}
+	assert bundle.snapshot().version == delta["version"]
+
+
+def test_cdph_index_is_diffed(bundle):
+	assert bundle.refresh_cdph() == {"added": 2, "updated": 0, "removed": 0}
+	version = bundle.snapshot().version
+	assert bundle.refresh_cdph() == {"added": 0, "updated": 0, "removed": 0}
+	assert bundle.snapshot().version == version
+
+	bundle.fetch_cdph = lambda: PAGE.split("\n", 2)[2]
+	assert bundle.refresh_cdph() == {"added": 0, "updated": 0, "removed": 1}
+	assert bundle.changes(version)["changes"]["cdph_recall"]["deletes"] == [
+		"https://www.cdph.ca.gov/Programs/CEH/DFDCS/CDPH%20Document%20Library/FDB/Recalls/Pump.pdf"]
+
+	# A page without any recall links leaves the index alone
+	bundle.fetch_cdph = lambda: "<html></html>"
+	assert bundle.refresh_cdph() is None
+
+
+def test_pruned_versions_are_gone(bundle, monkeypatch):
+	with bundle.connect() as con:
+		con.execute("INSERT INTO contact VALUES (3, 'Kern', 'Bakersfield')")
+		con.commit()
+		monkeypatch.setattr(time, "time", lambda: 10 ** 10)
+		assert sync_bundle.prune(con) == 1
+	with pytest.raises(ChangesPruned):
+		bundle.changes(0)
+	assert bundle.changes(1)["changes"] == {}
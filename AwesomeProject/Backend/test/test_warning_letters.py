@@ -0,0 +1,60 @@
+from warning_letters import WarningLetterIndex
+
+
+ROWS = [
+	{"CaseInjunctionID": "650001", "FEINumber": "3001", "LegalName": "Medtronic MiniMed, Inc.",
+	 "ActionTakenDate": "2024-03-01", "ActionType": "Warning Letter", "State": "CA", "FirmProfile": "p1"},
+	{"CaseInjunctionID": "650002", "FEINumber": "3002", "LegalName": "Heart Devices LLC",
+	 "ActionTakenDate": "2024-02-01", "ActionType": "Warning Letter", "State": "TX", "FirmProfile": "p2"},
+	{"CaseInjunctionID": "650003", "FEINumber": "3003", "LegalName": "Acme Heart Pumps Inc",
+	 "ActionTakenDate": "2023-12-01", "ActionType": "Warning Letter", "State": "NY", "FirmProfile": "p3"},
+]
+
+
+def make_index(tmp_path, rows=ROWS, checked=None):
+	def fetch(start, page_size, legal_name=None):
+		return {"result": rows[start - 1:start - 1 + page_size]}
+
+	def check_url(url):
+		if checked is not None:
+			checked.append(url)
+		return None if "acme" in url else url + "?verified"
+
+	return WarningLetterIndex(str(tmp_path / "index.db"), fetch=fetch, check_url=check_url, page_size=2)
+
+
+def test_sync_pages_and_resolves_links(tmp_path):
+	checked = []
+	index = make_index(tmp_path, checked=checked)
+
+	assert not index.is_ready()
+	assert index.sync() == 3
+	assert index.is_ready()
+	assert len(checked) == 3
+
+	results = index.lookup(legal_name="heart")
+	assert [r["CaseInjunctionID"] for r in results] == ["650002", "650003"]
+	assert results[0]["warning_letter_url_verified"] is True
+	assert results[0]["warning_letter_url"].endswith("?verified")
+	assert results[1]["warning_letter_url_verified"] is False
+
+
+def test_lookup_by_fei_and_name_prefix(tmp_path):
+	index = make_index(tmp_path)
+	index.sync()
+
+	assert [r["LegalName"] for r in index.lookup(fei_number="3001")] == ["Medtronic MiniMed, Inc."]
+	assert [r["CaseInjunctionID"] for r in index.lookup(legal_name="medtr mini")] == ["650001"]
+	assert index.lookup(legal_name="heart", fei_number="3001") == []
+
+
+def test_links_are_checked_once(tmp_path):
+	checked = []
+	index = make_index(tmp_path, checked=checked)
+	index.sync()
+	index.sync()
+
+	# verified links are cached; recent misses wait for the recheck interval
+	assert len(checked) == 3
+	url, verified = index.letter_url("650001", "2024-03-01", "Medtronic MiniMed, Inc.")
+	assert verified and url.endswith("medtronic-inc-650001-03012024?verified")
@@ -0,0 +1,353 @@
+# Local index of FDA Data Dashboard warning letters (Devices and Biologics)
+# Compliance actions are synced periodically into SQLite so /warning_letters
+# can answer from a local table instead of calling the dashboard per keyword.
+
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+
+import connectors
+from local_db import LocalDB, INDEX_DB_PATH
+from metrics import track_upstream
+
+
+DASHBOARD_API_URL = os.getenv('DASHBOARD_API_URL', 'https://api-datadashboard.fda.gov/v1/compliance_actions')
+WARNING_LETTER_BASE_URL = "https://www.fda.gov/inspections-compliance-enforcement-and-criminal-investigations/warning-letters"
+
+SYNC_INTERVAL = int(os.getenv('WARNING_LETTER_SYNC_INTERVAL', 6 * 3600))
+# Letters are sometimes added to the dashboard after their action date,
+# so incremental syncs re-read this many days behind the high-water mark
+SYNC_OVERLAP_DAYS = 30
+# Letters are posted on fda.gov weeks after the action; keep re-checking
+# missing links for recent actions
+URL_RECHECK_AFTER = 7 * 86400
+URL_RECHECK_WINDOW_DAYS = 180
+
+COLUMNS = [
+    "FirmProfile",
+    "FEINumber",
+    "ActionType",
+    "State",
+    "ActionTakenDate",
+    "LegalName",
+    "CaseInjunctionID"
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS warning_letter (
+    case_injunction_id TEXT PRIMARY KEY,
+    fei_number TEXT,
+    legal_name TEXT,
+    state TEXT,
+    action_type TEXT,
+    action_taken_date TEXT,
+    firm_profile TEXT,
+    letter_url TEXT,
+    url_status TEXT NOT NULL DEFAULT 'pending',
+    url_checked_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_warning_letter_fei ON warning_letter (fei_number);
+CREATE INDEX IF NOT EXISTS idx_warning_letter_date ON warning_letter (action_taken_date);
+CREATE INDEX IF NOT EXISTS idx_warning_letter_url_status ON warning_letter (url_status);
+
+CREATE TABLE IF NOT EXISTS warning_letter_token (
+    token TEXT NOT NULL,
+    case_injunction_id TEXT NOT NULL,
+    PRIMARY KEY (token, case_injunction_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_warning_letter_token_case ON warning_letter_token (case_injunction_id);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def normalize_legal_name(legal_name):
+    known_exceptions = {"medtronic-minimed-inc": "medtronic-inc"}
+    legal_name_key = re.sub(r'[^a-zA-Z0-9\s]', '', legal_name).replace(' ', '-').lower()
+    return known_exceptions.get(legal_name_key, legal_name_key)
+
+
+def construct_warning_letter_url(case_injunction_id, action_date, legal_name):
+    formatted_date = datetime.strptime(action_date, "%Y-%m-%d").strftime("%m%d%Y")
+    normalized_legal_name = normalize_legal_name(legal_name)
+    return f"{WARNING_LETTER_BASE_URL}/{normalized_legal_name}-{case_injunction_id}-{formatted_date}"
+
+
+def name_tokens(legal_name):
+    return re.findall(r'[a-z0-9]+', (legal_name or '').lower())
+
+
+def dashboard_headers():
+    return {
+        'Content-Type': 'application/json',
+        'Authorization-User': os.getenv('AUTHORIZATION_USER'),
+        'Authorization-Key': os.getenv('AUTHORIZATION_KEY')
+    }
+
+
+def dashboard_request_body(start, rows, legal_name=None):
+    filters = {
+        "ProductType": ["Biologics", "Devices"],
+        "ActionType": ["Warning Letter"]
+    }
+    if legal_name is not None:
+        filters["LegalName"] = [legal_name]
+    return {
+        "start": start,
+        "rows": rows,
+        "returntotalcount": "true",
+        "sort": "ActionTakenDate",
+        "sortorder": "DESC",
+        "filters": filters,
+        "columns": COLUMNS
+    }
+
+
+def fetch_compliance_actions(start, rows, legal_name=None):
+    """Fetch one page of warning-letter compliance actions from the dashboard."""
+    def send(timeout):
+        with track_upstream('fda_dashboard') as call:
+            response = call.response = requests.post(DASHBOARD_API_URL, json=dashboard_request_body(start, rows, legal_name),
+                                                     headers=dashboard_headers(), timeout=timeout)
+            response.raise_for_status()
+        return response
+
+    return connectors.get('fda_dashboard').call(send, timeout=60).json()
+
+
+_head_session = requests.Session()
+
+
+def head_check(url):
+    """
+    Returns the final URL of a warning letter page, or None if fda.gov does not
+    have it. Transient failures raise so the link is retried on the next sync.
+    """
+    def send(timeout):
+        with track_upstream('fda_letters'):
+            return _head_session.head(url, allow_redirects=True, timeout=timeout)
+
+    response = connectors.get('fda_letters').call(send, idempotent=True)
+    if response.status_code in (404, 410):
+        return None
+    response.raise_for_status()
+    return response.url
+
+
+class WarningLetterIndex:
+    """
+    SQLite table of warning-letter compliance actions keyed by case, FEI number
+    and legal-name tokens, with letter links verified once in the background.
+    """
+
+    def __init__(self, path=INDEX_DB_PATH, fetch=fetch_compliance_actions, check_url=head_check,
+                 page_size=500, max_workers=8, sync_interval=SYNC_INTERVAL):
+        self.db = LocalDB(path)
+        self.fetch = fetch
+        self.check_url = check_url
+        self.page_size = page_size
+        self.max_workers = max_workers
+        self.sync_interval = sync_interval
+        self._stop = threading.Event()
+        self._thread = None
+        self.db.executescript(SCHEMA)
+
+    def _get_state(self, key):
+        row = self.db.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row['value'] if row else None
+
+    def _set_state(self, key, value):
+        self.db.execute("INSERT INTO sync_state (key, value) VALUES (?, ?) "
+                        "ON CONFLICT(key) DO UPDATE SET value = excluded.value", (key, value))
+
+    def is_ready(self):
+        return self._get_state('last_synced_at') is not None
+
+    def _upsert(self, rows):
+        con = self.db.connection()
+        for row in rows:
+            case_id = row.get('CaseInjunctionID')
+            if not case_id:
+                continue
+            case_id = str(case_id)
+            # A changed name or date invalidates the resolved link
+            con.execute("""
+                INSERT INTO warning_letter (case_injunction_id, fei_number, legal_name, state,
+                                            action_type, action_taken_date, firm_profile)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(case_injunction_id) DO UPDATE SET
+                    url_status = CASE WHEN excluded.legal_name IS NOT legal_name
+                                        OR excluded.action_taken_date IS NOT action_taken_date
+                                      THEN 'pending' ELSE url_status END,
+                    fei_number = excluded.fei_number,
+                    legal_name = excluded.legal_name,
+                    state = excluded.state,
+                    action_type = excluded.action_type,
+                    action_taken_date = excluded.action_taken_date,
+                    firm_profile = excluded.firm_profile
+            """, (case_id, row.get('FEINumber'), row.get('LegalName'), row.get('State'),
+                  row.get('ActionType'), row.get('ActionTakenDate'), row.get('FirmProfile')))
+            con.execute("DELETE FROM warning_letter_token WHERE case_injunction_id = ?", (case_id,))
+            con.executemany("INSERT OR IGNORE INTO warning_letter_token (token, case_injunction_id) VALUES (?, ?)",
+                            [(token, case_id) for token in set(name_tokens(row.get('LegalName')))])
+
+    def sync(self):
+        """
+        Pull new compliance actions from the dashboard, newest first, stopping
+        once a page reaches past the previous high-water mark. Returns the
+        number of rows read.
+        """
+        high_water = self._get_state('last_action_date')
+        cutoff = None
+        if high_water:
+            cutoff = (datetime.strptime(high_water, "%Y-%m-%d") - timedelta(days=SYNC_OVERLAP_DAYS)).strftime("%Y-%m-%d")
+
+        con = self.db.connection()
+        start = 1
+        synced = 0
+        newest = high_water
+        while True:
+            out = self.fetch(start, self.page_size)
+            rows = out.get('result') or []
+            if not rows:
+                break
+            with con:
+                self._upsert(rows)
+            synced += len(rows)
+
+            dates = [row['ActionTakenDate'] for row in rows if row.get('ActionTakenDate')]
+            if dates:
+                newest = max(dates + ([newest] if newest else []))
+                if cutoff and min(dates) < cutoff:
+                    break
+            if len(rows) < self.page_size:
+                break
+            start += self.page_size
+
+        with con:
+            if newest:
+                self._set_state('last_action_date', newest)
+            self._set_state('last_synced_at', str(time.time()))
+        logging.info(f"Warning letter sync read {synced} compliance actions")
+
+        self.resolve_urls()
+        return synced
+
+    def _check_row(self, row):
+        try:
+            url = construct_warning_letter_url(row['case_injunction_id'], row['action_taken_date'], row['legal_name'])
+        except (TypeError, ValueError):
+            return row['case_injunction_id'], 'missing', None
+        try:
+            final_url = self.check_url(url)
+        except requests.RequestException as e:
+            logging.debug(f"Warning letter link check failed for {url}: {e}")
+            return row['case_injunction_id'], 'pending', None
+        if final_url is None:
+            return row['case_injunction_id'], 'missing', None
+        return row['case_injunction_id'], 'verified', final_url
+
+    def resolve_urls(self):
+        """Verify pending letter links with a bounded pool of concurrent HEAD checks."""
+        now = time.time()
+        recent = (datetime.utcnow() - timedelta(days=URL_RECHECK_WINDOW_DAYS)).strftime("%Y-%m-%d")
+        rows = self.db.execute("""
+            SELECT case_injunction_id, action_taken_date, legal_name FROM warning_letter
+            WHERE url_status = 'pending'
+               OR (url_status = 'missing' AND url_checked_at < ? AND action_taken_date >= ?)
+        """, (now - URL_RECHECK_AFTER, recent)).fetchall()
+        if not rows:
+            return 0
+
+        con = self.db.connection()
+        resolved = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for case_id, status, url in pool.map(self._check_row, rows):
+                if status == 'pending':
+                    continue
+                with con:
+                    con.execute("UPDATE warning_letter SET url_status = ?, letter_url = ?, url_checked_at = ? "
+                                "WHERE case_injunction_id = ?", (status, url, now, case_id))
+                resolved += 1
+        logging.info(f"Warning letter link check resolved {resolved} of {len(rows)} links")
+        return resolved
+
+    def _to_result(self, row):
+        url, verified = row['letter_url'], row['url_status'] == 'verified'
+        if not verified:
+            try:
+                url = construct_warning_letter_url(row['case_injunction_id'], row['action_taken_date'], row['legal_name'])
+            except (TypeError, ValueError):
+                url = None
+        return {
+            "FirmProfile": row['firm_profile'],
+            "FEINumber": row['fei_number'],
+            "ActionType": row['action_type'],
+            "State": row['state'],
+            "ActionTakenDate": row['action_taken_date'],
+            "LegalName": row['legal_name'],
+            "CaseInjunctionID": row['case_injunction_id'],
+            "warning_letter_url": url,
+            "warning_letter_url_verified": verified
+        }
+
+    def lookup(self, legal_name=None, fei_number=None, limit=50):
+        """
+        Search the local table by FEI number and/or legal name. Every word of
+        the name must prefix-match a word of the firm's legal name.
+        """
+        clauses, params = [], []
+        if fei_number:
+            clauses.append("fei_number = ?")
+            params.append(str(fei_number))
+        for token in name_tokens(legal_name):
+            clauses.append("case_injunction_id IN (SELECT case_injunction_id FROM warning_letter_token "
+                           "WHERE token >= ? AND token < ?)")
+            params.extend([token, token + '\uffff'])
+        where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+        rows = self.db.execute(f"SELECT * FROM warning_letter {where} "
+                               f"ORDER BY action_taken_date DESC LIMIT ?", params + [limit]).fetchall()
+        return [self._to_result(row) for row in rows]
+
+    def since(self, action_date):
+        """Letters with an action date on or after `action_date` (YYYY-MM-DD), oldest first."""
+        rows = self.db.execute("SELECT * FROM warning_letter WHERE action_taken_date >= ? "
+                               "ORDER BY action_taken_date", (action_date,)).fetchall()
+        return [self._to_result(row) for row in rows]
+
+    def letter_url(self, case_injunction_id, action_date, legal_name):
+        """Verified link for a case if one is cached, otherwise the constructed guess."""
+        row = self.db.execute("SELECT letter_url FROM warning_letter WHERE case_injunction_id = ? "
+                              "AND url_status = 'verified'", (str(case_injunction_id),)).fetchone()
+        if row:
+            return row['letter_url'], True
+        return construct_warning_letter_url(case_injunction_id, action_date, legal_name), False
+
+    def legal_names(self):
+        return [row['legal_name'] for row in self.db.execute("SELECT DISTINCT legal_name FROM warning_letter")]
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sync()
+            except Exception as e:
+                logging.error(f"Warning letter sync failed: {e}")
+            self._stop.wait(self.sync_interval)
+
+    def start(self):
+        """Start the periodic background sync."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="warning-letter-sync", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
@@ -1,42 +1,28 @@
 # This Python script uses SQLite to create a Data Base File
 # The database table is populated with contact info collected from an Excel file
 
+import os
 import sqlite3
-import pandas as pd
+import sys
 
-# Read .xlsx file containing column names
-info = pd.read_excel('CA District Attorney.xlsx', header=0)
+# The contact sync lives in the backend; this is its only copy
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'AwesomeProject', 'Backend'))
+from contact_sync import read_contacts, sync_contacts
 
-# Remove leading and trailing whitespace using strip()
-# Apply strip() to each element of `info` for strings only
-info = info.applymap(lambda x: x.strip() if isinstance(x, str) else x)
+# Read .xlsx file containing column names, streamed row by row
+# Leading and trailing whitespace is stripped from every string
+contact_list = read_contacts('CA District Attorney.xlsx')
 
-# Create new database and open database connection
+# Create new database or open the existing one
 con = sqlite3.connect("contact_info.db")
 
-# Execute SQL statements and fetch results with database cursor object
-cur = con.cursor()
-
-# Drop table if already exists to avoid errors
-cur.execute("DROP TABLE IF EXISTS contact")
-
-# Create contact table in database 
-cur.execute("CREATE TABLE contact(County TEXT, Name TEXT, Address TEXT, Phone TEXT, Fax TEXT, Link_to_Website TEXT)")
-
-
-# List of data to store in the contact table of the database
-contact_list = [tuple(row) for row in info.values]
-
-
-# Insert multiple rows into contact_list
-cur.executemany("INSERT INTO contact VALUES(?, ?, ?, ?, ?, ?)", contact_list)
-
-# Commit transaction to save inserted data and changes
-con.commit()
+# Insert, update and delete only the counties that changed, in one transaction,
+# so readers never see an empty table
+print(sync_contacts(con, contact_list))
 
 # Print
-for i in cur.execute("SELECT  * FROM contact"):
+for i in con.execute("SELECT  * FROM contact"):
     print(i)
 
 # Close existing connection
-con.close()
\ No newline at end of file
+con.close()
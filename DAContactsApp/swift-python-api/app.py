@@ -1,28 +1,103 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, request
+import hashlib
+import os
 import sqlite3
+import threading
+from datetime import datetime, timezone
 
 app = Flask(__name__)
 
+DB_PATH = os.getenv('CONTACT_DB_PATH', 'contact_info.db')
+
+
+class ContactSnapshot:
+    """
+    The /contacts responses, serialized once per version of the database
+    file and rebuilt when create_db.py changes it. Keeps one connection open,
+    reopening it if the file is replaced.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._con = None
+        self._inode = None
+        self._version = None
+        self.last_modified = None
+        self.all = None          # (body, etag)
+        self.by_county = {}      # lower-cased county -> (body, etag)
+
+    def _connection(self, stat):
+        if self._con is None or self._inode != stat.st_ino:
+            if self._con is not None:
+                self._con.close()
+            self._con = sqlite3.connect(self.path, check_same_thread=False)
+            self._inode = stat.st_ino
+        return self._con
+
+    def _serialize(self, contacts):
+        body = app.json.dumps(contacts).encode('utf-8')
+        return body, hashlib.sha1(body).hexdigest()
+
+    def refresh(self):
+        """Rebuild the responses if the database file changed since the last build."""
+        stat = os.stat(self.path)
+        version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        modified = stat.st_mtime
+        # Commits in WAL mode touch only the -wal file until a checkpoint
+        if os.path.exists(self.path + '-wal'):
+            wal = os.stat(self.path + '-wal')
+            version += (wal.st_mtime_ns, wal.st_size)
+            modified = max(modified, wal.st_mtime)
+        if version == self._version:
+            return self
+        with self._lock:
+            if version == self._version:
+                return self
+            rows = self._connection(stat).execute(
+                "SELECT County, Name, Address, Phone, Fax, Link_to_Website FROM contact").fetchall()
+
+            contacts = []
+            counties = {}
+            for row in rows:
+                contact = {
+                    'County': row[0],
+                    'Name': row[1],
+                    'Address': row[2],
+                    'Phone': row[3],
+                    'Fax': row[4],
+                    'Website': row[5],
+                }
+                contacts.append(contact)
+                counties.setdefault((row[0] or '').lower(), []).append(contact)
+
+            self.all = self._serialize(contacts)
+            self.by_county = {county: self._serialize(items) for county, items in counties.items()}
+            self.last_modified = datetime.fromtimestamp(modified, timezone.utc)
+            self._version = version
+        return self
+
+
+snapshot = ContactSnapshot(DB_PATH)
+empty_response = (b'[]', hashlib.sha1(b'[]').hexdigest())
+
+
 @app.route('/contacts', methods=['GET'])
 def get_contacts():
-    con = sqlite3.connect('contact_info.db')
-    cur = con.cursor()
-    cur.execute("SELECT * FROM contact")
-    rows = cur.fetchall()
-    con.close()
-    
-    contacts = []
-    for row in rows:
-        contacts.append({
-            'County': row[0],
-            'Name': row[1],
-            'Address': row[2],
-            'Phone': row[3],
-            'Fax': row[4],
-            'Website': row[5],
-        })
-    
-    return jsonify(contacts)
+    current = snapshot.refresh()
+    county = request.args.get('county')
+    if county:
+        body, etag = current.by_county.get(county.strip().lower(), empty_response)
+    else:
+        body, etag = current.all
+
+    # Clients revalidate with If-None-Match / If-Modified-Since and get a 304
+    # until the database changes
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.last_modified = current.last_modified
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 if __name__ == '__main__':
     app.run(debug=True)
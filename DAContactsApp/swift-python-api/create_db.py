@@ -1,24 +1,19 @@
+import os
 import sqlite3
-import pandas as pd
+import sys
 
-# Read Excel file
-info = pd.read_excel('CA District Attorney.xlsx', header=0)
+# The contact sync lives in the backend; this is its only copy
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'AwesomeProject', 'Backend'))
+from contact_sync import read_contacts, sync_contacts
 
-# Clean up strings
-info = info.applymap(lambda x: x.strip() if isinstance(x, str) else x)
+# Read Excel file (streamed, strings stripped)
+contact_list = read_contacts('CA District Attorney.xlsx')
 
 # Connect to SQLite
 con = sqlite3.connect("contact_info.db")
-cur = con.cursor()
 
-# Create table
-cur.execute("DROP TABLE IF EXISTS contact")
-cur.execute("CREATE TABLE contact(County TEXT, Name TEXT, Address TEXT, Phone TEXT, Fax TEXT, Link_to_Website TEXT)")
+# Apply only the inserted, changed and removed counties, in one transaction
+print(sync_contacts(con, contact_list))
 
-# Insert data
-contact_list = [tuple(row) for row in info.values]
-cur.executemany("INSERT INTO contact VALUES (?, ?, ?, ?, ?, ?)", contact_list)
-
-# Save and close
-con.commit()
+# Close
 con.close()
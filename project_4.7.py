@@ -5,6 +5,12 @@ import requests
 import csv
 from openpyxl import Workbook
 import os
+import sys
+
+# Draw from the backend's shared openFDA rate limiter (set RATE_LIMIT_DB_PATH
+# to the backend's file so the script and the API share one quota)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'AwesomeProject', 'Backend'))
+from rate_limit import openfda_limiter, BATCH
 
 apikey = 'e3oka6wF312QcwuJguDeXVEN6XGyeJC94Hirijj8'
 
@@ -22,7 +28,8 @@ url = f'https://api.fda.gov/device/510k.json?api_key={apikey}&search=decision_da
 # Print the constructed URL
 print("Constructed URL:", url)
 
-# Send request
+# Send request once a rate-limit token is free
+openfda_limiter.acquire(BATCH)
 response = requests.get(url)
 
 # Check if request was successful